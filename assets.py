@@ -0,0 +1,101 @@
+"""
+Precompiled, precompressed static assets for the page.
+
+Every file in static/ is read once at startup, content-hashed and compressed
+(gzip always, brotli when the optional `brotli` package is installed). Assets are
+served from /assets/<name>.<hash>.<ext> with a strong ETag and an immutable
+Cache-Control. The rendered index page uses the same machinery but is revalidated
+on every load, so a repeat visit costs one conditional request answered with 304.
+"""
+
+import gzip
+import hashlib
+import os
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip-only without it
+    brotli = None
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+CONTENT_TYPES = {
+    '.css': 'text/css; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.html': 'text/html; charset=utf-8',
+}
+MIN_COMPRESS_BYTES = 256
+ETAG_SUFFIXES = {'identity': '', 'gzip': '-gz', 'br': '-br'}
+
+
+class CompiledAsset:
+    """One asset with its content hash and precomputed encodings."""
+
+    def __init__(self, name, content):
+        self.name = name
+        self.content_type = CONTENT_TYPES.get(os.path.splitext(name)[1], 'application/octet-stream')
+        self.digest = hashlib.sha256(content).hexdigest()[:16]
+        stem, ext = os.path.splitext(name)
+        self.hashed_name = f'{stem}.{self.digest}{ext}'
+
+        self.variants = {'identity': content}
+        if len(content) >= MIN_COMPRESS_BYTES:
+            compressed = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(content, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(content):
+                    self.variants[encoding] = data
+
+    def negotiate(self):
+        """Pick the smallest encoding the client accepts."""
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accepted.quality(encoding) > 0:
+                return encoding
+        return 'identity'
+
+    def response(self, cache_control):
+        encoding = self.negotiate()
+        etag = self.digest + ETAG_SUFFIXES[encoding]
+        headers = {
+            'Cache-Control': cache_control,
+            'Vary': 'Accept-Encoding',
+            'ETag': f'"{etag}"',
+        }
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+
+        response = Response(self.variants[encoding], headers=headers, content_type=self.content_type)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class AssetBundle:
+    """All files of a directory, addressable by name or by content-hashed name."""
+
+    def __init__(self, directory, url_prefix='/assets'):
+        self.url_prefix = url_prefix
+        self.assets = {}
+        self.by_hashed_name = {}
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                asset = CompiledAsset(name, f.read())
+            self.assets[name] = asset
+            self.by_hashed_name[asset.hashed_name] = asset
+
+    def __getitem__(self, name):
+        return self.assets[name]
+
+    def url(self, name):
+        return f'{self.url_prefix}/{self.assets[name].hashed_name}'
+
+    def lookup(self, hashed_name):
+        return self.by_hashed_name.get(hashed_name)
@@ -0,0 +1,370 @@
+"""
+Batch transcription of recorded audio over the streaming protocol.
+
+The WebSocket endpoint is the only transcription engine, and the page paces it
+at real time: one chunk every 500 ms. A stored recording has no reason to wait
+for the clock. This job memory-maps a WAV file (stream_client.WavFile), cuts it
+into chunks and sends them with stream_client.StreamSession as fast as the server answers. At most `window` chunks are unanswered at any time,
+and fewer if the server grants fewer flow-control credits. Results come back
+keyed by `chunk_id` and are put back in order, whatever order they arrived in.
+
+Jobs talk to the transcription service directly, not through the gateway, so
+they do its audio conversion themselves: stereo is downmixed in integer
+arithmetic and other rates are resampled to the model's (resample.py), chunk
+by chunk, so memory stays flat whatever the recording's length.
+
+One session is processed chunk after chunk upstream, so `parallel` > 1 splits
+the recording into that many contiguous spans. Each span is streamed on its own
+session, and the spans are joined on the recording's timeline.
+
+Recordings uploaded through /upload are found by their `gcs_metadata_id` in
+the upload stand-in's directory. In the app, POST /uploads/<gcs_metadata_id>/transcription
+starts a job with the caller's bearer id token. GET on the same URL returns the
+job's state, and the transcript once it is done. The transcript is also written
+next to the upload as transcription.json.
+
+Throughput is reported in audio-seconds per wall-second. Real-time streaming is 1.0.
+
+Usage:
+    python batch_transcribe.py --url http://localhost:8001 recording.wav
+    python batch_transcribe.py --url http://localhost:8001 --upload <gcs_metadata_id> --window 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+import aiohttp
+import numpy as np
+from flask import Blueprint, current_app, jsonify, request
+
+import gateway
+import resample
+import stream_client
+import streaming_protocol
+import upload_standin
+
+RESULT_FILE = 'transcription.json'
+JOB_WORKERS = int(os.environ.get('BATCH_JOB_WORKERS', '2'))
+
+
+class BatchError(Exception):
+    """The recording could not be found or read."""
+
+
+@dataclass
+class BatchOptions:
+    chunk_ms: int = 1000
+    window: int = 8  # chunks in flight per session; server credits can lower it
+    parallel: int = 1  # sessions the recording is split across
+    codec: str = 'pcm_s16le'
+    language: str = 'en'
+    timeout: float = 600.0  # per session
+    sample_rate: int = gateway.GatewayConfig.sample_rate  # the model's; other rates are resampled to it
+
+
+def open_wav(path):
+    """The memory-mapped WAV file at `path`, any channel count."""
+    try:
+        return stream_client.WavFile(path, mono=False)
+    except stream_client.WavError as e:
+        raise BatchError(f'{os.path.basename(path)}: {e}')
+
+
+def read_mono(wav, start, end):
+    """Frames [start, end) of `wav` as int16 mono; stereo is averaged in int32."""
+    samples = np.frombuffer(wav.data[start * wav.frame_bytes:end * wav.frame_bytes], dtype='<i2')
+    if wav.channels == 1:
+        return samples
+    return (samples.reshape(-1, wav.channels).sum(axis=1, dtype=np.int32) // wav.channels).astype('<i2')
+
+
+def upload_path(gcs_metadata_id):
+    """Path of a completed upload in the upload stand-in's directory."""
+    session = upload_standin.load_session(gcs_metadata_id)
+    if session is None:
+        raise BatchError('Unknown upload')
+    path = upload_standin.object_path(gcs_metadata_id)
+    if not os.path.exists(path) or ('part_count' in session and not session.get('complete')):
+        raise BatchError('Upload is not complete')
+    return path
+
+
+def split_spans(sample_count, chunk_samples, parallel):
+    """(first_chunk, first_sample, end_sample) of each span, on chunk boundaries."""
+    chunk_count = max(1, -(-sample_count // chunk_samples))
+    parallel = max(1, min(parallel, chunk_count))
+    spans = []
+    for i in range(parallel):
+        first = chunk_count * i // parallel
+        last = chunk_count * (i + 1) // parallel
+        spans.append((first, first * chunk_samples, min(sample_count, last * chunk_samples)))
+    return spans
+
+
+async def login(http, api_base_url, email, password):
+    async with http.post(api_base_url + '/login', json={'email': email, 'password': password}) as response:
+        data = await response.json(content_type=None)
+        if response.status != 200:
+            raise BatchError(f"Login failed: {data.get('detail', response.status)}")
+        return data['access_token']
+
+
+def span_chunks(read, start, end, chunk_samples, resampler=None, release=None):
+    """
+    Chunks of samples [start, end) from `read`, resampled when `resampler` is set.
+    `release(start, end)` is called once a chunk has been sent.
+    """
+    for i in range(start, end, chunk_samples):
+        stop = min(i + chunk_samples, end)
+        chunk = read(i, stop)
+        yield chunk if resampler is None else resampler.process_pcm(chunk)
+        if release is not None:
+            release(i, stop)
+
+
+async def transcribe_samples(http, ws_url, tokens, samples, sample_rate, options=None):
+    """Stream int16 mono `samples` through `ws_url` unpaced; returns the transcript and timings."""
+    return await transcribe_frames(http, ws_url, tokens, len(samples), sample_rate,
+                                   lambda start, end: samples[start:end], options)
+
+
+async def transcribe_frames(http, ws_url, tokens, sample_count, sample_rate, read, options=None, release=None):
+    """
+    Like transcribe_samples, with `read(start, end)` returning each chunk's int16
+    mono samples and `release(start, end)` told when they have been sent.
+    """
+    options = options or BatchOptions()
+    if sample_rate != options.sample_rate and not resample.supported(sample_rate, options.sample_rate):
+        raise BatchError(f'Unsupported sample rate {sample_rate}')
+    stream_options = stream_client.StreamOptions(
+        chunk_ms=options.chunk_ms, window=options.window, speed=0,
+        codec=options.codec, language=options.language,
+    )
+    chunk_samples = max(1, sample_rate * options.chunk_ms // 1000)
+    spans = []
+    for first, start, end in split_spans(sample_count, chunk_samples, options.parallel):
+        # One resampler per span: each session's audio is a stream of its own
+        resampler = None
+        if sample_rate != options.sample_rate:
+            resampler = resample.Resampler(sample_rate, options.sample_rate)
+        frames = span_chunks(read, start, end, chunk_samples, resampler, release)
+        session = stream_client.StreamSession(frames, options.sample_rate, stream_options)
+        spans.append((first * chunk_samples / sample_rate, session))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        asyncio.wait_for(session.run(http, ws_url, tokens), options.timeout) for _, session in spans
+    ))
+    wall_seconds = time.perf_counter() - started
+
+    # Each span's chunk_ids start over; its results are shifted onto the recording's timeline
+    segments = [segment for offset, session in spans for segment in session.segments(offset)]
+    counts = [session.counts() for _, session in spans]
+    audio_seconds = sample_count / sample_rate
+    return {
+        'text': ' '.join(segment['text'] for segment in segments if segment['text']),
+        'segments': segments,
+        'chunks': {name: sum(c[name] for c in counts) for name in counts[0]},
+        'options': asdict(options),
+        'sessions': len(spans),
+        'audio_seconds': round(audio_seconds, 3),
+        'wall_seconds': round(wall_seconds, 3),
+        'audio_seconds_per_second': round(audio_seconds / wall_seconds, 3) if wall_seconds else None,
+    }
+
+
+async def transcribe_wav(http, ws_url, tokens, path, options=None):
+    """Transcribe the WAV file at `path`, read span by span from its mapping."""
+    with open_wav(path) as wav:
+        return await transcribe_frames(
+            http, ws_url, tokens, wav.frame_count, wav.sample_rate,
+            lambda start, end: read_mono(wav, start, end), options,
+            lambda start, end: wav.release_span(start * wav.frame_bytes, end * wav.frame_bytes),
+        )
+
+
+async def transcribe_file(path, ws_url, tokens, options=None):
+    async with aiohttp.ClientSession() as http:
+        return await transcribe_wav(http, ws_url, tokens, path, options)
+
+
+# ============================================================
+# Jobs for uploaded recordings
+# ============================================================
+class BatchJobs:
+    """
+    Runs upload transcriptions on a small thread pool, each on its own event loop.
+    Finished transcripts are stored next to the upload, so every worker process
+    can serve them; only the state of running jobs is held here.
+    """
+
+    def __init__(self, workers=JOB_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch')
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def start(self, gcs_metadata_id, ws_url, tokens, options):
+        path = upload_path(gcs_metadata_id)
+        with self.lock:
+            job = self.jobs.get(gcs_metadata_id)
+            if job is not None and job['status'] in ('queued', 'running'):
+                return job
+            job = self.jobs[gcs_metadata_id] = {'gcs_metadata_id': gcs_metadata_id, 'status': 'queued'}
+        self.executor.submit(self.run, job, path, ws_url, tokens, options)
+        return job
+
+    def run(self, job, path, ws_url, tokens, options):
+        job['status'] = 'running'
+        try:
+            result = asyncio.run(transcribe_file(path, ws_url, tokens, options))
+            result.update(gcs_metadata_id=job['gcs_metadata_id'], status='done')
+            target = os.path.join(os.path.dirname(path), RESULT_FILE)
+            with open(target + '.tmp', 'w') as f:
+                json.dump(result, f)
+            os.replace(target + '.tmp', target)
+        except Exception as e:  # the executor would swallow it and leave the job 'running'
+            job.update(status='failed', error=str(e) or type(e).__name__)
+            return
+        with self.lock:
+            self.jobs.pop(job['gcs_metadata_id'], None)
+
+    def status(self, gcs_metadata_id):
+        """Running job state, the stored transcript, or None."""
+        with self.lock:
+            job = self.jobs.get(gcs_metadata_id)
+        if job is not None and job['status'] != 'done':
+            return dict(job)
+        if upload_standin.load_session(gcs_metadata_id) is None:
+            return None
+        try:
+            with open(os.path.join(upload_standin.session_dir(gcs_metadata_id), RESULT_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+jobs = BatchJobs()
+blueprint = Blueprint('batch_transcribe', __name__)
+
+
+def options_from(values):
+    defaults = BatchOptions()
+    try:
+        options = BatchOptions(
+            chunk_ms=int(values.get('chunk_ms', defaults.chunk_ms)),
+            window=int(values.get('window', defaults.window)),
+            parallel=int(values.get('parallel', defaults.parallel)),
+            codec=values.get('codec', defaults.codec),
+            language=values.get('language', defaults.language),
+        )
+    except (TypeError, ValueError):
+        return None
+    if options.codec not in streaming_protocol.ENCODING_IDS:
+        return None
+    if not (100 <= options.chunk_ms <= 30000 and 1 <= options.window <= 256 and 1 <= options.parallel <= 32):
+        return None
+    return options
+
+
+@blueprint.route('/uploads/<gcs_metadata_id>/transcription', methods=['POST'])
+def start_transcription(gcs_metadata_id):
+    auth = request.headers.get('Authorization', '')
+    if not auth.startswith('Bearer '):
+        return jsonify({'detail': 'Bearer id token required'}), 401
+    body = request.get_json(silent=True) or request.form
+    options = options_from(body)
+    if options is None:
+        return jsonify({'detail': 'Invalid batch options'}), 422
+    tokens = {'idToken': auth[len('Bearer '):], 'refreshToken': body.get('refresh_token')}
+    try:
+        job = jobs.start(gcs_metadata_id, current_app.config['TRANSCRIPTION_WS_URL'], tokens, options)
+    except BatchError as e:
+        return jsonify({'detail': str(e)}), 404
+    return jsonify(job), 202
+
+
+@blueprint.route('/uploads/<gcs_metadata_id>/transcription', methods=['GET'])
+def transcription_status(gcs_metadata_id):
+    status = jobs.status(gcs_metadata_id)
+    if status is None:
+        return jsonify({'detail': 'No transcription for this upload'}), 404
+    return jsonify(status)
+
+
+def parse_args(argv=None):
+    defaults = BatchOptions()
+    parser = argparse.ArgumentParser(description='Transcribe a recording without real-time pacing')
+    parser.add_argument('audio', nargs='?', help='16-bit PCM WAV file')
+    parser.add_argument('--upload', metavar='GCS_METADATA_ID',
+                        help='transcribe a file stored by the upload stand-in instead')
+    parser.add_argument('--url', default='http://localhost:8001',
+                        help='base URL of the API serving /login')
+    parser.add_argument('--ws-url', help='WebSocket URL (default: derived from --url)')
+    parser.add_argument('--chunk-ms', type=int, default=defaults.chunk_ms)
+    parser.add_argument('--window', type=int, default=defaults.window,
+                        help='chunks in flight per session (server credits may lower it)')
+    parser.add_argument('--parallel', type=int, default=defaults.parallel,
+                        help='sessions the recording is split across')
+    parser.add_argument('--codec', choices=sorted(streaming_protocol.ENCODING_IDS), default=defaults.codec)
+    parser.add_argument('--language', default=defaults.language)
+    parser.add_argument('--timeout', type=float, default=defaults.timeout)
+    parser.add_argument('--sample-rate', type=int, default=defaults.sample_rate,
+                        help="the model's sample rate; recordings at other rates are resampled to it")
+    parser.add_argument('--email', default='loadtest@example.com')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--id-token', help='skip /login and use this id token')
+    parser.add_argument('--output', help='write the JSON result to this file')
+    args = parser.parse_args(argv)
+    if not args.audio and not args.upload:
+        parser.error('give a WAV file or --upload')
+
+    args.url = args.url.rstrip('/')
+    if not args.ws_url:
+        args.ws_url = (
+            args.url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+            + '/stream-transcription-auth'
+        )
+    return args
+
+
+async def run_cli(args):
+    options = BatchOptions(args.chunk_ms, args.window, args.parallel, args.codec, args.language, args.timeout,
+                           args.sample_rate)
+    path = upload_path(args.upload) if args.upload else args.audio
+    async with aiohttp.ClientSession() as http:
+        if args.id_token:
+            tokens = {'idToken': args.id_token}
+        else:
+            tokens = await login(http, args.url, args.email, args.password)
+        return await transcribe_wav(http, args.ws_url, tokens, path, options)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        result = asyncio.run(run_cli(args))
+    except (BatchError, aiohttp.ClientError, OSError) as e:
+        raise SystemExit(f'❌ {e}')
+
+    chunks = result['chunks']
+    print(f"📊 {result['audio_seconds']} s of audio in {result['wall_seconds']} s "
+          f"({result['audio_seconds_per_second']} audio-s/s) over {result['sessions']} session(s)",
+          file=sys.stderr)
+    print(f"   chunks: {chunks['sent']} sent, {chunks['chunk_results']} results, "
+          f"{chunks['no_speech']} no_speech, {chunks['errors']} errors", file=sys.stderr)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
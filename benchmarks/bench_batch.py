@@ -0,0 +1,105 @@
+"""
+Batch transcription throughput against the stand-in server.
+
+Starts standin_server.py in-process on a free port and streams one recording
+through batch_transcribe.py for each in-flight window and session count. It
+reports audio-seconds per wall-second for each, next to real-time pacing, which
+is 1.0 by definition.
+
+The stand-in's credit window caps what a single session can have in flight
+(--credit-window, default 8), so windows above it only help with parallel sessions.
+
+Usage:
+    python benchmarks/bench_batch.py
+    python benchmarks/bench_batch.py --seconds 300 --windows 1,4,16 --parallel 1,4 --latency-ms 300
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch_transcribe  # noqa: E402
+import standin_server  # noqa: E402
+from bench_codecs import load_wav, synthesize  # noqa: E402
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark batch transcription throughput')
+    parser.add_argument('--audio', help='mono 16-bit WAV to use instead of a synthetic signal')
+    parser.add_argument('--seconds', type=float, default=120.0, help='length of the synthetic signal')
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--chunk-ms', type=int, default=1000)
+    parser.add_argument('--windows', default='1,2,4,8', help='comma-separated in-flight windows')
+    parser.add_argument('--parallel', default='1,4', help='comma-separated session counts')
+    parser.add_argument('--latency-ms', type=float, default=150.0, help='stand-in inference latency')
+    parser.add_argument('--credit-window', type=int, default=8, help="stand-in's flow-control window")
+    parser.add_argument('--output', help='write results as JSON to this path')
+    return parser.parse_args(argv)
+
+
+async def run(args, samples, sample_rate):
+    server = standin_server.StandinServer(standin_server.StandinConfig(
+        latency_ms=args.latency_ms, jitter_ms=0.0, login_latency_ms=0.0,
+        credit_window=args.credit_window,
+    ))
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    results = []
+    try:
+        async with aiohttp.ClientSession() as http:
+            tokens = await batch_transcribe.login(http, f'http://127.0.0.1:{port}', 'bench@example.com', 'bench')
+            ws_url = f'ws://127.0.0.1:{port}/stream-transcription-auth'
+            for parallel in [int(p) for p in args.parallel.split(',')]:
+                for window in [int(w) for w in args.windows.split(',')]:
+                    options = batch_transcribe.BatchOptions(chunk_ms=args.chunk_ms, window=window, parallel=parallel)
+                    result = await batch_transcribe.transcribe_samples(
+                        http, ws_url, tokens, samples, sample_rate, options
+                    )
+                    results.append({
+                        'window': window,
+                        'parallel': parallel,
+                        'wall_seconds': result['wall_seconds'],
+                        'audio_seconds_per_second': result['audio_seconds_per_second'],
+                        'chunks': result['chunks'],
+                    })
+    finally:
+        await runner.cleanup()
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.audio:
+        samples, sample_rate = load_wav(args.audio)
+    else:
+        sample_rate = args.sample_rate
+        samples = synthesize(args.seconds, sample_rate)
+
+    results = asyncio.run(run(args, samples, sample_rate))
+
+    print(f"📊 {len(samples) / sample_rate:.0f} s of audio, {args.chunk_ms} ms chunks, "
+          f"stand-in latency {args.latency_ms:.0f} ms, credit window {args.credit_window}", file=sys.stderr)
+    print(f"   {'sessions':>8} {'window':>7} {'wall s':>8} {'audio-s/s':>10}", file=sys.stderr)
+    print(f"   {'real time':>16} {len(samples) / sample_rate:>8.1f} {1.0:>10.2f}", file=sys.stderr)
+    for r in results:
+        print(f"   {r['parallel']:>8} {r['window']:>7} {r['wall_seconds']:>8.2f} "
+              f"{r['audio_seconds_per_second']:>10.2f}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
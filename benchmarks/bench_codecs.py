@@ -0,0 +1,149 @@
+"""
+Audio codec benchmark: encode/decode cost versus bytes saved.
+
+For each binary frame encoding (pcm_s16le, mulaw, adpcm_ima) and for the JSON
+base64 WAV fallback, reports per-chunk encode and decode time, bytes on the
+wire per chunk and per second of audio, compression against PCM frames and the
+reconstruction SNR.
+
+Python encoders are the reference ones used by loadgen.py; the page's JS
+encoders produce identical bytes and log their own per-chunk encode time.
+
+Usage:
+    python benchmarks/bench_codecs.py
+    python benchmarks/bench_codecs.py --audio dictation.wav --output codecs.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio_codecs  # noqa: E402
+import streaming_protocol  # noqa: E402
+
+
+def synthesize(seconds, sample_rate, seed=0):
+    """Speech-like test signal: voiced harmonics with a syllable envelope, noise and pauses."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 8))
+    envelope = np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None) * (np.sin(2 * np.pi * 0.2 * t) > -0.5)
+    signal = 6000 * voiced * envelope + rng.normal(0, 150, len(t))
+    return np.clip(signal, -32768, 32767).astype('<i2')
+
+
+def load_wav(path):
+    with wave.open(path, 'rb') as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise SystemExit(f'{path}: expected mono 16-bit WAV')
+        return np.frombuffer(wav.readframes(wav.getnframes()), dtype='<i2'), wav.getframerate()
+
+
+def snr_db(reference, decoded):
+    reference = reference.astype(np.float64)
+    noise = np.sum((reference - decoded.astype(np.float64)) ** 2)
+    if noise == 0:
+        return math.inf
+    return 10 * math.log10(np.sum(reference ** 2) / noise)
+
+
+def time_per_chunk(func, chunks, repeat):
+    best = math.inf
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for chunk in chunks:
+            func(chunk)
+        best = min(best, time.perf_counter() - started)
+    return best / len(chunks) * 1e6
+
+
+def bench_encoding(name, chunks, sample_rate, repeat):
+    encoding = streaming_protocol.ENCODING_IDS[name]
+    payloads = [audio_codecs.encode_payload(encoding, chunk) for chunk in chunks]
+    frames = [
+        streaming_protocol.encode_audio_frame(seq, payload, encoding, len(chunk))
+        for seq, (chunk, payload) in enumerate(zip(chunks, payloads))
+    ]
+
+    def decode(frame):
+        _, enc, sample_count, payload = streaming_protocol.decode_audio_frame(frame)
+        return audio_codecs.decode_payload(enc, payload, sample_count)
+
+    decoded = np.frombuffer(b''.join(decode(frame) for frame in frames), dtype='<i2')
+    return {
+        'encode_us_per_chunk': time_per_chunk(lambda c: audio_codecs.encode_payload(encoding, c), chunks, repeat),
+        'decode_us_per_chunk': time_per_chunk(decode, frames, repeat),
+        'bytes_per_chunk': sum(len(f) for f in frames) / len(frames),
+        'snr_db': snr_db(np.concatenate(chunks), decoded),
+    }
+
+
+def bench_json(chunks, sample_rate, repeat):
+    messages = [json.dumps(streaming_protocol.encode_json_audio(c.tobytes(), sample_rate)) for c in chunks]
+    return {
+        'encode_us_per_chunk': time_per_chunk(
+            lambda c: json.dumps(streaming_protocol.encode_json_audio(c.tobytes(), sample_rate)), chunks, repeat),
+        'decode_us_per_chunk': time_per_chunk(
+            lambda m: streaming_protocol.decode_json_audio(json.loads(m)), messages, repeat),
+        'bytes_per_chunk': sum(len(m) for m in messages) / len(messages),
+        'snr_db': math.inf,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark audio frame codecs')
+    parser.add_argument('--audio', help='mono 16-bit WAV to use instead of a synthetic signal')
+    parser.add_argument('--seconds', type=float, default=30.0, help='length of the synthetic signal')
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--chunk-ms', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs per codec (best is kept)')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.audio:
+        samples, sample_rate = load_wav(args.audio)
+    else:
+        sample_rate = args.sample_rate
+        samples = synthesize(args.seconds, sample_rate)
+
+    chunk_samples = sample_rate * args.chunk_ms // 1000
+    chunks = [samples[i:i + chunk_samples] for i in range(0, len(samples) - chunk_samples + 1, chunk_samples)]
+    chunks_per_second = 1000 / args.chunk_ms
+
+    results = {'json_wav': bench_json(chunks, sample_rate, args.repeat)}
+    for name in ('pcm_s16le', 'mulaw', 'adpcm_ima'):
+        results[name] = bench_encoding(name, chunks, sample_rate, args.repeat)
+
+    pcm_bytes = results['pcm_s16le']['bytes_per_chunk']
+    for result in results.values():
+        result['bytes_per_audio_second'] = result['bytes_per_chunk'] * chunks_per_second
+        result['ratio_vs_pcm'] = pcm_bytes / result['bytes_per_chunk']
+
+    print(f"📊 {len(chunks)} chunks of {args.chunk_ms} ms at {sample_rate} Hz", file=sys.stderr)
+    print(f"   {'codec':<10} {'encode µs':>10} {'decode µs':>10} {'bytes/chunk':>12} "
+          f"{'KB/s':>7} {'vs pcm':>7} {'SNR dB':>7}", file=sys.stderr)
+    for name, r in results.items():
+        print(f"   {name:<10} {r['encode_us_per_chunk']:>10.1f} {r['decode_us_per_chunk']:>10.1f} "
+              f"{r['bytes_per_chunk']:>12.0f} {r['bytes_per_audio_second'] / 1024:>7.1f} "
+              f"{r['ratio_vs_pcm']:>6.2f}x {r['snr_db']:>7.1f}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
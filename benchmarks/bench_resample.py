@@ -0,0 +1,97 @@
+"""
+Resampler throughput: input samples per second per core, by input rate.
+
+For each capture rate, streams a synthetic speech-like signal through
+resample.Resampler in chunks (as the gateway does, one chunk per message) and
+reports the time per chunk, input samples per CPU-second and how many real-time
+streams one core could resample. It also checks the conversion: the gain at
+1 kHz and the rejection of a 9.5 kHz tone, which has to be filtered out before
+going to 16 kHz.
+
+BLAS is limited to one thread so the numbers are per core.
+
+Usage:
+    python benchmarks/bench_resample.py
+    python benchmarks/bench_resample.py --rates 44100,48000 --chunk-ms 250 --output resample.json
+"""
+
+import os
+
+for _name in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_name, '1')
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import math  # noqa: E402
+import sys  # noqa: E402
+
+import numpy as np  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import resample  # noqa: E402
+from bench_codecs import synthesize, time_per_chunk  # noqa: E402
+
+
+def tone_level_db(in_rate, out_rate, frequency, seconds=1.0):
+    """Output level of a full-scale-ish tone relative to its input level."""
+    t = np.arange(int(seconds * in_rate)) / in_rate
+    tone = (10000 * np.sin(2 * np.pi * frequency * t)).astype('<i2')
+    out = resample.Resampler(in_rate, out_rate).process(tone)
+    settled = out[len(out) // 10:-len(out) // 10]
+    rms = math.sqrt(float(np.mean(settled.astype(np.float64) ** 2)))
+    return 20 * math.log10(rms * math.sqrt(2) / 10000 + 1e-12)
+
+
+def bench_rate(in_rate, args):
+    samples = synthesize(args.seconds, in_rate)
+    chunk_samples = in_rate * args.chunk_ms // 1000
+    chunks = [samples[i:i + chunk_samples] for i in range(0, len(samples) - chunk_samples + 1, chunk_samples)]
+    resampler = resample.Resampler(in_rate, args.out_rate)
+    us_per_chunk = time_per_chunk(resampler.process_pcm, chunks, args.repeat)
+    samples_per_second = chunk_samples / (us_per_chunk / 1e6)
+    return {
+        'in_rate': in_rate,
+        'phases': resampler.up,
+        'taps': resampler.taps,
+        'us_per_chunk': round(us_per_chunk, 1),
+        'samples_per_second': round(samples_per_second),
+        'realtime_streams_per_core': round(samples_per_second / in_rate, 1),
+        'gain_1k_db': round(tone_level_db(in_rate, args.out_rate, 1000), 2),
+        'reject_9k5_db': round(tone_level_db(in_rate, args.out_rate, 9500), 1) if in_rate > 19000 else None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the polyphase resampler')
+    parser.add_argument('--rates', default='44100,48000,96000,32000,22050',
+                        help='comma-separated input rates')
+    parser.add_argument('--out-rate', type=int, default=16000)
+    parser.add_argument('--seconds', type=float, default=30.0, help='length of the synthetic signal')
+    parser.add_argument('--chunk-ms', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs per rate (best is kept)')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = [bench_rate(int(rate), args) for rate in args.rates.split(',')]
+
+    print(f"📊 {args.seconds:.0f} s per rate in {args.chunk_ms} ms chunks -> {args.out_rate} Hz, one core",
+          file=sys.stderr)
+    print(f"   {'rate':>6} {'phases':>6} {'taps':>5} {'µs/chunk':>9} {'Msamples/s':>11} "
+          f"{'streams':>8} {'1k dB':>6} {'9.5k dB':>8}", file=sys.stderr)
+    for r in results:
+        reject = f"{r['reject_9k5_db']:.1f}" if r['reject_9k5_db'] is not None else '-'
+        print(f"   {r['in_rate']:>6} {r['phases']:>6} {r['taps']:>5} {r['us_per_chunk']:>9.1f} "
+              f"{r['samples_per_second'] / 1e6:>11.2f} {r['realtime_streams_per_core']:>8.1f} "
+              f"{r['gain_1k_db']:>6.2f} {reject:>8}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+Gateway throughput against the number of worker processes.
+
+For each worker count it starts `sample_app.py --workers N` in front of
+stand-in servers and drives it with loadgen.py client processes at --speed 0
+(chunks as fast as the credit window allows). Throughput is the clients'
+summed audio-seconds per wall-second, which is also the number of real-time
+sessions the gateway could carry. Efficiency is throughput(N) / (N x throughput(1));
+near 1.0 means the workers scale linearly.
+
+The stand-in answers instantly (no inference latency, no jitter) and accepts
+any token, so the gateway's relay work is what is being measured. The clients
+and stand-ins need CPU too: on Linux, --pin puts the gateway workers on the
+first cores and everything else on the remaining ones. Without spare cores
+the numbers show how the gateway shares the machine rather than how it scales.
+
+Usage:
+    python benchmarks/bench_workers.py
+    python benchmarks/bench_workers.py --workers 1,2,4,8 --sessions 64 --duration 120 --pin
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import standin_server  # noqa: E402
+
+
+def parse_args(argv=None):
+    cores = os.cpu_count() or 1
+    default_workers = ','.join(str(n) for n in (1, 2, 4, 8, 16, 32, 64) if n <= cores) or '1'
+    parser = argparse.ArgumentParser(description='Benchmark gateway scaling with worker processes')
+    parser.add_argument('--workers', default=default_workers, help='comma-separated worker counts')
+    parser.add_argument('--sessions', type=int, default=32, help='concurrent sessions, split over the clients')
+    parser.add_argument('--duration', type=float, default=60.0, help='audio seconds per session')
+    parser.add_argument('--chunk-ms', type=int, default=500)
+    parser.add_argument('--transport', choices=('binary', 'json'), default='binary')
+    parser.add_argument('--clients', type=int, default=4, help='loadgen processes')
+    parser.add_argument('--standins', type=int, default=2, help='stand-in server processes')
+    parser.add_argument('--vad', action=argparse.BooleanOptionalAction, default=True,
+                        help='gateway voice activity detection (GATEWAY_VAD)')
+    parser.add_argument('--pin', action='store_true',
+                        help='pin gateway workers to the first cores and the load to the rest (Linux)')
+    parser.add_argument('--output', help='write results as JSON to this path')
+    return parser.parse_args(argv)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_standin(port):
+    server = standin_server.StandinServer(standin_server.StandinConfig(
+        latency_ms=0.0, jitter_ms=0.0, login_latency_ms=0.0, final_latency_ms=0.0,
+        final_ms_per_chunk=0.0, accept_any_token=True,
+    ))
+    web.run_app(server.create_app(), host='127.0.0.1', port=port, reuse_port=True, print=None)
+
+
+def wait_for_workers(port, workers, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/gateway/stats', timeout=2) as response:
+                if json.load(response).get('workers', 1) >= workers:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f'❌ Gateway with {workers} workers did not come up')
+
+
+def cpu_sets(workers, pin):
+    """(gateway cores, load cores), or (None, None) when not pinning."""
+    if not pin or not hasattr(os, 'sched_setaffinity'):
+        return None, None
+    cores = sorted(os.sched_getaffinity(0))
+    if len(cores) <= workers:
+        print(f'⚠️ {len(cores)} cores can not keep {workers} workers apart from the load, not pinning',
+              file=sys.stderr)
+        return None, None
+    return set(cores[:workers]), set(cores[workers:])
+
+
+def run_workers(args, workers, standin_port, directory):
+    gateway_cpus, load_cpus = cpu_sets(workers, args.pin)
+    port = free_port()
+    env = dict(os.environ, TRANSCRIPTION_API_URL=f'http://127.0.0.1:{standin_port}',
+               GATEWAY_TRANSCRIPT_DIR='', GATEWAY_VAD='1' if args.vad else '0', GATEWAY_DRAIN_TIMEOUT='5')
+    gateway = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'sample_app.py'), '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers)],
+        env=env, stdout=subprocess.DEVNULL,
+        preexec_fn=(lambda: os.sched_setaffinity(0, gateway_cpus)) if gateway_cpus else None,
+    )
+    try:
+        wait_for_workers(port, workers)
+        clients = []
+        for i in range(args.clients):
+            sessions = args.sessions // args.clients + (i < args.sessions % args.clients)
+            if not sessions:
+                continue
+            output = os.path.join(directory, f'workers{workers}-client{i}.json')
+            command = [
+                sys.executable, os.path.join(ROOT, 'loadgen.py'),
+                '--ws-url', f'ws://127.0.0.1:{port}/stream-transcription-auth', '--id-token', 'bench',
+                '--sessions', str(sessions), '--duration', str(args.duration), '--chunk-ms', str(args.chunk_ms),
+                '--speed', '0', '--silence-ratio', '0', '--transport', args.transport,
+                '--seed', str(i), '--output', output,
+            ]
+            process = subprocess.Popen(
+                command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                preexec_fn=(lambda: os.sched_setaffinity(0, load_cpus)) if load_cpus else None,
+            )
+            clients.append((process, output))
+        summaries = []
+        for process, output in clients:
+            process.wait()
+            with open(output) as f:
+                summaries.append(json.load(f))
+    finally:
+        gateway.terminate()
+        gateway.wait()
+
+    throughput = sum(s['throughput']['audio_seconds_per_second'] for s in summaries)
+    chunks = sum(s['throughput']['chunks_per_second'] for s in summaries)
+    latencies = [s['latency_ms']['chunk_result'] for s in summaries if s['latency_ms']['chunk_result']['count']]
+    return {
+        'workers': workers,
+        'sessions_completed': sum(s['sessions']['completed'] for s in summaries),
+        'sessions_failed': sum(s['sessions']['failed'] for s in summaries),
+        'audio_seconds_per_second': round(throughput, 2),
+        'chunks_per_second': round(chunks, 2),
+        'chunk_result_p50_ms': max((r['p50'] for r in latencies), default=None),
+        'chunk_result_p99_ms': max((r['p99'] for r in latencies), default=None),
+        'pinned': gateway_cpus is not None,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts = [int(n) for n in args.workers.split(',')]
+    standin_port = free_port()
+    standins = [multiprocessing.Process(target=serve_standin, args=(standin_port,), daemon=True)
+                for _ in range(args.standins)]
+    for process in standins:
+        process.start()
+    time.sleep(1.0)
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for workers in counts:
+                results.append(run_workers(args, workers, standin_port, directory))
+                print(f"   {workers} worker(s): {results[-1]['audio_seconds_per_second']} audio-s/s", file=sys.stderr)
+    finally:
+        for process in standins:
+            process.terminate()
+
+    base = next((r['audio_seconds_per_second'] for r in results if r['workers'] == 1), None)
+    for r in results:
+        r['efficiency'] = round(r['audio_seconds_per_second'] / (r['workers'] * base), 3) if base else None
+
+    print(f"📊 {args.sessions} sessions x {args.duration:.0f} s of audio at --speed 0, {args.chunk_ms} ms chunks, "
+          f"{args.transport}, VAD {'on' if args.vad else 'off'}, {os.cpu_count()} cores", file=sys.stderr)
+    print(f"   {'workers':>7} {'audio-s/s':>10} {'chunks/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'efficiency':>10}",
+          file=sys.stderr)
+    for r in results:
+        efficiency = f"{r['efficiency']:.2f}" if r['efficiency'] is not None else '-'
+        print(f"   {r['workers']:>7} {r['audio_seconds_per_second']:>10.1f} {r['chunks_per_second']:>9.1f} "
+              f"{r['chunk_result_p50_ms'] or 0:>8.1f} {r['chunk_result_p99_ms'] or 0:>8.1f} {efficiency:>10}",
+              file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1429 @@
+"""
+Same-origin asyncio WebSocket gateway for the transcription app.
+
+Serves the Flask app and a WebSocket endpoint on one port. The page connects to
+/stream-transcription-auth on its own origin; the gateway relays the existing
+message protocol (config/audio/end in, ready/chunk_result/... out) to the
+upstream transcription service.
+
+Upstream WebSockets come from a pool of warm connections: a few are kept
+connected ahead of demand so a session never pays the TCP/TLS/WebSocket
+handshake, and a connection whose session finished cleanly with `complete`
+is returned to the pool for the next session.
+
+Memory per session is bounded: messages are forwarded one at a time with
+socket-level backpressure in both directions and a hard cap on message size.
+Credit-based flow control (`flow_control` in `ready`, then `credit` messages) is
+end to end with the upstream; the gateway only returns the credits of chunks it
+answers itself.
+
+Resumable sessions: with VAD on, a browser disconnect parks the session with its
+upstream connection for GATEWAY_RESUME_TTL seconds, buffering upstream messages,
+and a `resume` carrying the session id (an unguessable gateway-issued token)
+reattaches it. The upstream session itself is not made resumable and sees gap-free
+sequence numbers. In passthrough mode `resume` goes to the upstream, which keeps
+its own dropped sessions.
+
+Silent chunks are answered with `no_speech` by the gateway itself (vad.py) and
+never reach the upstream model; GATEWAY_VAD=0 turns this off.
+
+With VAD on the gateway also terminates audio codec negotiation: the browser may
+send μ-law or IMA-ADPCM frames (audio_codecs.py) whatever the upstream accepts,
+and chunks are passed through or transcoded to what the upstream's `ready` offered.
+
+The page captures at the device's native rate and declares it in `config`.
+Audio at any other rate than GATEWAY_SAMPLE_RATE is resampled to it (resample.py)
+in both modes, and upstream is told the converted rate.
+
+A page that asks for `partial_deltas` gets each partial as the length of the
+prefix it shares with the chunk's previous hypothesis plus the changed tail
+(streaming_protocol.encode_partial_delta). The gateway encodes them unless the
+upstream's `ready` says it sends deltas itself.
+
+`final_segments` (negotiated between the page and the upstream) lets `complete`
+reference the punctuated segments already sent instead of repeating the whole
+text; the gateway assembles them for the transcript store, where a fix-up to
+an earlier segment is logged as a corrected record of that segment's chunk.
+
+When the API base URL is known, the gateway also keeps the users' tokens
+(token_cache.py): the page logs in at /auth/login, gets an HttpOnly session
+cookie, and the gateway fills the cached tokens into `config` and `resume`.
+
+Every `chunk_result` and `complete` is also appended to an on-disk transcript
+log (transcript_store.py) off the relay path. `ready` carries the session's
+`transcript_id`, and GET /transcripts/<transcript_id>?start=&end= reads it back.
+
+With GATEWAY_RECORD_PATH set, whole sessions (browser frames in, messages out,
+with timestamps) are recorded for replay.py (session_recorder.py).
+
+GET /metrics serves Prometheus text: session, chunk, byte and token refresh
+counters, and latency histograms (metrics.py) of chunk round trips (client chunk
+in -> its chunk_result/no_speech out) and of `end` -> `complete`.
+
+On SIGINT/SIGTERM the gateway stops accepting, closes sockets that never started
+a session, and waits up to GATEWAY_DRAIN_TIMEOUT seconds for the others to
+finish before closing them with 1012 (service restart).
+
+With --workers N, prefork.py runs N gateway processes on the same port
+(SO_REUSEPORT). Token cache entries, parked sessions and transcripts live in the
+process that created them, so their keys (the session cookie, `session_id`,
+`transcript_id`) start with that worker's index, and a worker that receives a
+request for another worker's key relays it there over loopback. /metrics,
+/gateway/stats and GET /telemetry add up every worker's numbers.
+
+Usage:
+    python sample_app.py            # serves Flask + gateway on port 8000
+    python sample_app.py --workers 4
+"""
+
+import asyncio
+import collections
+import io
+import json
+import os
+import secrets
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from urllib.parse import unquote_to_bytes
+
+import aiohttp
+from aiohttp import WSMsgType, web
+
+import audio_codecs
+import metrics
+import prefork
+import resample
+import session_recorder
+import streaming_protocol
+import telemetry
+import token_cache
+import transcript_store
+import vad
+
+WS_PATH = '/stream-transcription-auth'
+WORKER_PATH = '/gateway/worker'
+# Marks a request one worker relayed to another; it is always served where it lands
+FORWARDED_HEADER = 'X-Gateway-Forwarded'
+FORWARDED_REQUEST_HEADERS = ('Accept', 'Content-Type', 'Cookie', 'Origin', 'User-Agent')
+FORWARDED_RESPONSE_HEADERS = ('Cache-Control', 'Content-Type', 'Set-Cookie')
+# Upstream messages the relay looks into; credits, pongs and partials (unless delta-encoded) pass untouched
+PARSED_MARKERS = ('"ready"', '"chunk_result"', '"no_speech"', '"complete"', '"resumed"', '"token_refresh')
+# Stats /metrics exports under their own names; the rest become gateway_<name>_total
+EXPORTED_STATS = {
+    'chunks_from_client', 'chunk_results', 'no_speech', 'bytes_from_client', 'bytes_to_client',
+    'auth_refreshes', 'auth_refresh_failures', 'upstream_token_refreshes', 'upstream_token_refresh_failures',
+}
+
+
+@dataclass
+class GatewayConfig:
+    """Gateway tuning knobs, read from GATEWAY_* environment variables."""
+
+    upstream_url: str = ''
+    api_base_url: str = ''
+    pool_min_idle: int = 4
+    pool_max_idle: int = 64
+    pool_idle_timeout: float = 120.0
+    reuse_upstream: bool = True
+    connect_timeout: float = 10.0
+    max_sessions: int = 10000
+    max_message_bytes: int = 1024 * 1024
+    heartbeat: float = 30.0
+    wsgi_threads: int = 32
+    max_request_bytes: int = 64 * 1024 * 1024
+    sample_rate: int = 16000  # the upstream model's rate
+    resample: bool = True  # convert client audio at other rates to sample_rate
+    chunk_id_base: int = 0
+    vad: bool = True
+    vad_threshold_db: float = -50.0
+    vad_hangover_ms: float = 500.0
+    resume_ttl: float = 60.0
+    resume_outbox: int = 512
+    token_cache: bool = True
+    token_refresh_path: str = '/refresh'
+    token_refresh_ahead: float = 300.0
+    token_idle_ttl: float = 12 * 3600.0
+    transcript_dir: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'transcripts')  # '' disables
+    transcript_segment_bytes: int = 64 * 1024 * 1024
+    transcript_commit_interval: float = 0.05
+    record_path: str = ''  # JSONL file to record sessions to for replay.py
+    drain_timeout: float = 600.0  # seconds shutdown waits for sessions to finish
+    # Set per process when prefork.py runs several workers: this one's index, every one's loopback port
+    worker: int = None
+    worker_ports: tuple = ()
+
+    @classmethod
+    def from_env(cls, upstream_url, environ=os.environ, api_base_url=''):
+        config = cls(upstream_url=upstream_url, api_base_url=api_base_url)
+        for name, value in vars(config).items():
+            raw = environ.get('GATEWAY_' + name.upper())
+            if raw is None or name in ('upstream_url', 'api_base_url', 'worker', 'worker_ports'):
+                continue
+            if isinstance(value, bool):
+                setattr(config, name, raw.lower() in ('1', 'true', 'yes', 'on'))
+            else:
+                setattr(config, name, type(value)(raw))
+        return config
+
+    def shard_key(self, key):
+        """`key` prefixed with this worker's index, so any worker can tell who holds it."""
+        return key if self.worker is None else f'{self.worker}.{key}'
+
+    def split_shard(self, key):
+        """(owning worker or None, key without the prefix) for a shard_key() key."""
+        head, sep, rest = (key or '').partition('.')
+        if self.worker is None or not sep or not head.isdigit() or int(head) >= len(self.worker_ports):
+            return None, key
+        return int(head), rest
+
+    def key_owner(self, key):
+        """The worker holding `key` when that is another worker, else None."""
+        owner = self.split_shard(key)[0]
+        return owner if owner != self.worker else None
+
+
+class UpstreamConnection:
+    """
+    One upstream WebSocket.
+
+    A single reader task owns the socket for its whole life and hands messages
+    to whichever relay session is attached, so idle pooled connections still
+    answer pings and notice when the upstream closes them.
+    """
+
+    def __init__(self, pool, ws):
+        self.pool = pool
+        self.ws = ws
+        self.session = None
+        self.sessions_served = 0
+        self.idle_since = time.monotonic()
+        self.reader = asyncio.create_task(self.read_loop())
+
+    @property
+    def closed(self):
+        return self.ws.closed
+
+    async def read_loop(self):
+        try:
+            async for msg in self.ws:
+                if self.session is not None:
+                    await self.session.on_upstream_message(msg)
+        except Exception as e:  # keep one bad session from killing the gateway
+            print(f'⚠️ Upstream reader failed: {e!r}', file=sys.stderr)
+        finally:
+            self.pool.discard(self)
+            if self.session is not None:
+                await self.session.on_upstream_closed()
+
+    async def send(self, msg_type, data):
+        if msg_type == WSMsgType.BINARY:
+            await self.ws.send_bytes(data)
+        else:
+            await self.ws.send_str(data)
+
+    async def close(self):
+        self.session = None
+        if not self.ws.closed:
+            await self.ws.close()
+
+
+class UpstreamPool:
+    """Keeps warm upstream WebSockets ready and recycles cleanly finished ones."""
+
+    def __init__(self, config, stats):
+        self.config = config
+        self.stats = stats
+        self.idle = []
+        self.connecting = 0
+        self.http = None
+        self.maintainer = None
+        self.wakeup = asyncio.Event()
+
+    async def start(self):
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=self.config.pool_idle_timeout),
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.config.connect_timeout),
+        )
+        self.maintainer = asyncio.create_task(self.maintain())
+
+    async def stop(self):
+        if self.maintainer:
+            self.maintainer.cancel()
+        idle, self.idle = self.idle, []
+        for conn in idle:
+            await conn.close()
+        if self.http:
+            await self.http.close()
+
+    async def connect(self):
+        self.connecting += 1
+        try:
+            ws = await self.http.ws_connect(
+                self.config.upstream_url,
+                heartbeat=self.config.heartbeat,
+                max_msg_size=self.config.max_message_bytes,
+            )
+        finally:
+            self.connecting -= 1
+        self.stats['upstream_connects'] += 1
+        return UpstreamConnection(self, ws)
+
+    async def acquire(self, session):
+        """Attach `session` to a warm connection, connecting one if none is idle."""
+        while self.idle:
+            conn = self.idle.pop()
+            if not conn.closed:
+                self.stats['pool_hits'] += 1
+                break
+        else:
+            self.stats['pool_misses'] += 1
+            conn = await self.connect()
+        self.wakeup.set()
+        conn.session = session
+        conn.sessions_served += 1
+        return conn
+
+    async def release(self, conn, reusable):
+        """Detach a connection after its session; keep it if it can be reused."""
+        conn.session = None
+        if (reusable and self.config.reuse_upstream and not conn.closed
+                and len(self.idle) < self.config.pool_max_idle):
+            conn.idle_since = time.monotonic()
+            self.idle.append(conn)
+            self.stats['upstream_reuses'] += 1
+        else:
+            await conn.close()
+
+    def discard(self, conn):
+        if conn in self.idle:
+            self.idle.remove(conn)
+            self.wakeup.set()
+
+    async def maintain(self):
+        """Top the pool up to pool_min_idle and retire long-idle connections."""
+        backoff = 1.0
+        while True:
+            now = time.monotonic()
+            expired = [c for c in self.idle if now - c.idle_since > self.config.pool_idle_timeout]
+            for conn in expired[:max(0, len(self.idle) - self.config.pool_min_idle)]:
+                self.idle.remove(conn)
+                await conn.close()
+
+            try:
+                while len(self.idle) + self.connecting < self.config.pool_min_idle:
+                    conn = await self.connect()
+                    conn.idle_since = time.monotonic()
+                    self.idle.append(conn)
+                backoff = 1.0
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                self.stats['upstream_connect_errors'] += 1
+                print(f'⚠️ Could not pre-warm upstream connection: {e!r}', file=sys.stderr)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.config.pool_idle_timeout / 4)
+            except asyncio.TimeoutError:
+                pass
+
+
+class RelaySession:
+    """
+    Relays one browser WebSocket to an upstream connection.
+
+    With VAD enabled the gateway decodes each audio chunk, answers silent ones
+    with `no_speech` itself and forwards only speech. Upstream then numbers the
+    chunks it sees differently from the client, so chunk ids, times and the
+    chunk total in upstream messages are mapped back to the client's timeline.
+
+    Audio format is negotiated per hop: the client gets any codec the gateway
+    can decode, and chunks are re-encoded only when upstream can't take them as is.
+    """
+
+    def __init__(self, gateway, client_ws, auth=None):
+        self.gateway = gateway
+        self.config = gateway.config
+        self.client = client_ws
+        self.auth = auth
+        self.upstream = None
+        self.stats = gateway.stats
+        self.vad = None
+        self.outbox = collections.deque()
+        self.outbox_overflowed = False
+        self.expiry = None
+        self.transcript_id = None
+        self.recording = gateway.recorder.session() if gateway.recorder else None
+        # Per-session histograms: written only by this session, merged on scrape
+        self.round_trips = metrics.Histogram()
+        self.completions = metrics.Histogram()
+        self.reset_timeline(self.config.sample_rate)
+
+    def reset_timeline(self, sample_rate):
+        self.sample_rate = sample_rate
+        self.client_chunks = 0
+        self.client_samples = 0
+        self.upstream_chunks = 0
+        self.chunk_map = {}
+        self.sent_at = {}
+        self.end_sent = None
+        self.client_format = {}
+        self.client_binary = False
+        self.client_deltas = False
+        self.encode_partials = False  # the client wants partial deltas the upstream doesn't send
+        self.partials = {}  # chunk id -> last hypothesis sent to the client
+        self.final = None  # assembled text of a final_segments session, for the transcript store
+        self.segment_chunks = {}  # segment -> (chunk_id, start_time, end_time) of the chunk it came in
+        self.upstream_binary = False
+        self.upstream_encoding = streaming_protocol.ENCODING_PCM_S16LE
+        self.flow_control = False
+        self.session_id = None
+        self.client_resumable = False  # VAD mode: the page asked for a resumable session
+        self.resampler = None
+        if self.config.resample and sample_rate != self.config.sample_rate:
+            self.resampler = resample.Resampler(sample_rate, self.config.sample_rate)
+        if self.config.vad:
+            self.vad = vad.VoiceActivityDetector(
+                sample_rate=self.resampler.out_rate if self.resampler else sample_rate,
+                threshold_db=self.config.vad_threshold_db,
+                hangover_ms=self.config.vad_hangover_ms,
+            )
+
+    def describe(self):
+        return {
+            'client_chunks': self.client_chunks,
+            'upstream_chunks': self.upstream_chunks,
+            'audio_seconds': round(self.client_samples / self.sample_rate, 3),
+            'vad': self.vad.counters() if self.vad else None,
+            'round_trip_ms': self.round_trips.summary(),
+        }
+
+    async def send_client(self, data):
+        if self.client is not None and not self.client.closed:
+            if self.recording:
+                self.recording.record('out', data)
+            await self.client.send_str(data)
+        elif self.session_id is not None:
+            # Parked session: hold the message until the browser resumes
+            if len(self.outbox) >= self.config.resume_outbox:
+                self.outbox_overflowed = True
+            else:
+                self.outbox.append(data)
+
+    async def send_client_json(self, message):
+        await self.send_client(json.dumps(message))
+
+    async def run(self):
+        try:
+            async for msg in self.client:
+                if msg.type in (WSMsgType.TEXT, WSMsgType.BINARY):
+                    self.stats['bytes_from_client'] += len(msg.data)
+                    if self.recording:
+                        self.recording.record('in', msg.data)
+                if msg.type == WSMsgType.TEXT:
+                    await self.on_client_text(msg.data)
+                elif msg.type == WSMsgType.BINARY:
+                    await self.on_client_binary(msg.data)
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            if self.resumable():
+                self.detach()
+            else:
+                if self.upstream is not None:
+                    # Session state upstream is mid-flight; the connection can't be reused
+                    upstream, self.upstream = self.upstream, None
+                    await self.gateway.pool.release(upstream, reusable=False)
+                    if self.vad is None and self.session_id is not None:
+                        self.park_transcript()
+                self.close_transcript()
+                self.close_recording()
+            self.gateway.collect_metrics(self)
+
+    def resumable(self):
+        # Only VAD mode keeps per-session state here; passthrough resumes upstream
+        return (self.vad is not None and self.session_id is not None
+                and self.upstream is not None and self.config.resume_ttl > 0)
+
+    def detach(self):
+        self.client = None
+        self.gateway.detached[self.session_id] = self
+        self.expiry = asyncio.get_running_loop().call_later(
+            self.config.resume_ttl, lambda: asyncio.ensure_future(self.expire())
+        )
+
+    async def expire(self):
+        if self.gateway.detached.get(self.session_id) is self:
+            del self.gateway.detached[self.session_id]
+            self.stats['sessions_expired'] += 1
+        self.close_transcript()
+        self.close_recording()
+        self.gateway.collect_metrics(self)
+        if self.upstream is not None:
+            upstream, self.upstream = self.upstream, None
+            await self.gateway.pool.release(upstream, reusable=False)
+
+    async def attach(self, client_ws):
+        """Continue a parked session on the browser's new socket."""
+        if self.expiry:
+            self.expiry.cancel()
+            self.expiry = None
+        self.client = client_ws
+        self.partials.clear()  # in case a delta was lost with the old socket
+        await self.send_client_json({
+            'type': 'resumed',
+            'session_id': self.config.shard_key(self.session_id),
+            'next_seq': self.client_chunks,
+        })
+        while self.outbox:
+            await self.send_client(self.outbox.popleft())
+
+    async def resume(self, message, data):
+        session = self.gateway.detached.pop(message.get('session_id'), None)
+        if session is not None and not session.outbox_overflowed:
+            self.stats['sessions_resumed'] += 1
+            await session.attach(self.client)
+            await session.run()
+            return
+        if session is not None:
+            await session.expire()
+        if self.vad is None:
+            await self.start_upstream(data)
+            return
+        # The chunk id/time mapping of that session is gone with it
+        self.stats['resume_failures'] += 1
+        await self.send_client_json({'type': 'resume_failed', 'message': 'Unknown or expired session'})
+
+    def is_replay(self, seq):
+        """True for a chunk already received before a resume."""
+        if self.session_id is None or seq is None or seq >= self.client_chunks:
+            return False
+        self.stats['chunks_deduplicated'] += 1
+        return True
+
+    async def on_client_text(self, data):
+        if '"ping"' in data and await self.answer_ping(data):
+            return
+        if '"end"' in data:
+            self.end_sent = time.perf_counter()
+        if self.upstream is None:
+            try:
+                message = json.loads(data)
+            except ValueError:
+                await self.send_client_json({'type': 'error', 'message': 'Invalid JSON message'})
+                return
+            if message.get('type') not in ('config', 'resume'):
+                await self.send_client_json({'type': 'error', 'message': 'Send config first'})
+                return
+            if message.get('type') == 'resume' and self.config.worker is not None:
+                owner, message['session_id'] = self.config.split_shard(message.get('session_id'))
+                if owner not in (None, self.config.worker) and await self.gateway.pipe(self.client, owner, {}, data):
+                    return
+                data = json.dumps(message)
+            audio_format = message.get('audio_format') if isinstance(message.get('audio_format'), dict) else {}
+            try:
+                sample_rate = int(audio_format.get('sample_rate') or self.config.sample_rate)
+            except (TypeError, ValueError):
+                sample_rate = 0
+            if sample_rate != self.config.sample_rate:
+                if sample_rate <= 0 or (self.config.resample
+                                        and not resample.supported(sample_rate, self.config.sample_rate)):
+                    await self.send_client_json({'type': 'error', 'message': f'Unsupported sample rate {sample_rate}'})
+                    return
+                if self.config.resample:
+                    audio_format['sample_rate'] = self.config.sample_rate  # what upstream will receive
+                    data = json.dumps(message)
+            self.reset_timeline(sample_rate)
+            if self.vad is not None and message.get('type') == 'config':
+                # The gateway owns resume here; upstream would take VAD gaps for lost chunks
+                self.client_resumable = message.pop('resumable', None) is True
+                data = json.dumps(message)
+            self.client_deltas = self.encode_partials = message.get('partial_deltas') is True
+            if self.auth is not None:
+                data = await self.with_cached_tokens(message)
+            if message.get('type') == 'resume':
+                await self.resume(message, data)
+                return
+            self.client_format = audio_format
+            self.client_binary = message.get('binary_audio') is True
+            await self.start_upstream(data)
+        elif self.vad is None:
+            if '"audio"' in data:
+                self.chunk_sent()
+                if self.resampler is not None:
+                    data = self.resample_json(data)
+            await self.forward(WSMsgType.TEXT, data)
+        else:
+            try:
+                message = json.loads(data)
+            except ValueError:
+                await self.send_client_json({'type': 'error', 'message': 'Invalid JSON message'})
+                return
+            if message.get('type') != 'audio':
+                await self.forward(WSMsgType.TEXT, data)
+                return
+            try:
+                pcm, sample_rate = streaming_protocol.decode_json_audio(message)
+            except streaming_protocol.AudioFrameError as e:
+                await self.send_client_json({'type': 'error', 'message': str(e)})
+                return
+            if self.is_replay(message.get('seq')):
+                return
+            if self.resampler is None:
+                self.vad.sample_rate = sample_rate
+            await self.on_audio(pcm, WSMsgType.TEXT, data, message)
+
+    async def with_cached_tokens(self, message):
+        """Put the cookie session's tokens into a config/resume message for upstream."""
+        tokens = self.gateway.tokens
+        entry = await tokens.current(self.auth)
+        message['id_token'] = entry.id_token
+        if tokens.can_refresh:
+            # The cache refreshes once per user; a per-connection refresh upstream
+            # would rotate the same refresh token out from under it
+            message.pop('refresh_token', None)
+        else:
+            message['refresh_token'] = entry.refresh_token
+        return json.dumps(message)
+
+    async def answer_ping(self, data):
+        """Answer the page's RTT probe here so it measures the client link only."""
+        try:
+            message = json.loads(data)
+        except ValueError:
+            return False
+        if message.get('type') != 'ping':
+            return False
+        await self.send_client_json({'type': 'pong', 'id': message.get('id')})
+        return True
+
+    async def on_client_binary(self, data):
+        if self.vad is None or self.upstream is None:
+            if self.upstream is not None:
+                self.chunk_sent()
+                if self.resampler is not None:
+                    try:
+                        data = self.resample_frame(data)
+                    except streaming_protocol.AudioFrameError as e:
+                        await self.send_client_json({'type': 'error', 'message': str(e)})
+                        return
+            await self.forward(WSMsgType.BINARY, data)
+            return
+        try:
+            sequence, encoding, sample_count, payload = streaming_protocol.decode_audio_frame(data)
+            pcm = audio_codecs.decode_payload(encoding, payload, sample_count)
+        except streaming_protocol.AudioFrameError as e:
+            await self.send_client_json({'type': 'error', 'message': str(e)})
+            return
+        if self.is_replay(sequence):
+            return
+        await self.on_audio(pcm, WSMsgType.BINARY, data, (encoding, sample_count, payload))
+
+    async def on_audio(self, pcm, msg_type, data, frame=None):
+        """
+        Classify one client chunk and either forward it or answer it locally.
+
+        `frame` is (encoding, sample_count, payload) for binary chunks and the
+        decoded message for JSON ones.
+        """
+        client_id = self.config.chunk_id_base + self.client_chunks
+        self.stats['chunks_from_client'] += 1
+        start = self.client_samples / self.sample_rate
+        self.client_chunks += 1
+        self.client_samples += len(pcm) // 2
+        end = self.client_samples / self.sample_rate
+        if self.resampler is not None:
+            pcm = self.resampler.process_pcm(pcm)
+            if msg_type == WSMsgType.BINARY:
+                frame = (frame[0], len(pcm) // 2, None)
+            else:
+                frame.update(streaming_protocol.encode_json_audio(pcm, self.resampler.out_rate))
+                data = json.dumps(frame)
+
+        if not self.vad.should_forward(pcm):
+            self.stats['vad_suppressed_chunks'] += 1
+            self.stats['vad_suppressed_bytes'] += len(data)
+            self.stats['no_speech'] += 1
+            await self.send_client_json({'type': 'no_speech', 'chunk_id': client_id})
+            if self.flow_control:
+                # Upstream never sees this chunk, so its credit comes back from here
+                await self.send_client_json({'type': 'credit', 'credits': 1})
+            return
+
+        upstream_id = self.config.chunk_id_base + self.upstream_chunks
+        if msg_type == WSMsgType.BINARY:
+            msg_type, data = self.encode_for_upstream(pcm, *frame)
+        elif 'seq' in frame:
+            frame['seq'] = self.upstream_chunks  # renumbered like binary frames
+            data = json.dumps(frame)
+        self.chunk_map[upstream_id] = (client_id, start, end)
+        self.sent_at[client_id] = time.perf_counter()
+        self.upstream_chunks += 1
+        await self.forward(msg_type, data)
+
+    def chunk_sent(self):
+        """Count a passthrough audio chunk; upstream numbers it like the client did."""
+        self.sent_at[self.config.chunk_id_base + self.client_chunks] = time.perf_counter()
+        self.client_chunks += 1
+        self.stats['chunks_from_client'] += 1
+
+    def record_result(self, message):
+        """Count a chunk_result/no_speech on its way out and time its round trip."""
+        self.stats['chunk_results' if message.get('type') == 'chunk_result' else 'no_speech'] += 1
+        sent = self.sent_at.pop(message.get('chunk_id'), None)
+        if sent is not None:
+            self.round_trips.record(time.perf_counter() - sent)
+
+    def encode_for_upstream(self, pcm, encoding, sample_count, payload):
+        """Re-frame a client chunk in a format upstream negotiated, transcoding if needed."""
+        # Sequence numbers are renumbered so upstream sees them gap-free
+        if not self.upstream_binary:
+            self.stats['transcoded_chunks'] += 1
+            rate = self.resampler.out_rate if self.resampler else self.sample_rate
+            message = streaming_protocol.encode_json_audio(pcm, rate)
+            return WSMsgType.TEXT, json.dumps(message)
+        if encoding != self.upstream_encoding or payload is None:  # payload is None once resampled
+            self.stats['transcoded_chunks'] += 1
+            encoding = self.upstream_encoding
+            payload = audio_codecs.encode_payload(encoding, pcm)
+        frame = streaming_protocol.encode_audio_frame(self.upstream_chunks, payload, encoding, sample_count)
+        return WSMsgType.BINARY, frame
+
+    def resample_frame(self, data):
+        """A passthrough binary frame with its audio resampled, same sequence and encoding."""
+        sequence, encoding, sample_count, payload = streaming_protocol.decode_audio_frame(data)
+        pcm = self.resampler.process_pcm(audio_codecs.decode_payload(encoding, payload, sample_count))
+        return streaming_protocol.encode_audio_frame(
+            sequence, audio_codecs.encode_payload(encoding, pcm), encoding, len(pcm) // 2
+        )
+
+    def resample_json(self, data):
+        """A passthrough JSON `audio` message with its audio resampled."""
+        try:
+            message = json.loads(data)
+            pcm, _ = streaming_protocol.decode_json_audio(message)
+        except (ValueError, streaming_protocol.AudioFrameError):
+            return data  # not audio after all, or upstream reports the error itself
+        message.update(streaming_protocol.encode_json_audio(self.resampler.process_pcm(pcm), self.resampler.out_rate))
+        return json.dumps(message)
+
+    async def start_upstream(self, config_data):
+        try:
+            self.upstream = await self.gateway.pool.acquire(self)
+            await self.upstream.send(WSMsgType.TEXT, config_data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self.stats['upstream_connect_errors'] += 1
+            self.upstream = None
+            await self.send_client_json({
+                'type': 'error',
+                'message': f'Transcription service unavailable: {type(e).__name__}',
+            })
+            await self.client.close()
+
+    async def forward(self, msg_type, data):
+        if self.upstream is None:
+            await self.send_client_json({'type': 'error', 'message': 'Send config first'})
+            return
+        self.stats['messages_to_upstream'] += 1
+        self.stats['bytes_to_upstream'] += len(data)
+        try:
+            await self.upstream.send(msg_type, data)
+        except ConnectionResetError:
+            pass  # on_upstream_closed reports it to the client
+
+    def to_client_timeline(self, message):
+        """
+        Rewrite upstream chunk ids/times to the ids and times the client sent,
+        and answer the client's audio format negotiation on the gateway's behalf.
+        """
+        kind = message.get('type')
+        if kind == 'ready':
+            self.upstream_binary = message.get('binary_audio') is True
+            self.flow_control = bool(message.get('flow_control'))
+            resumable = self.client_resumable and self.config.resume_ttl > 0
+            self.session_id = secrets.token_urlsafe(16) if resumable else None
+            message['session_id'] = self.session_id
+            self.upstream_encoding = streaming_protocol.ENCODING_IDS.get(
+                message.get('audio_encoding'), streaming_protocol.ENCODING_PCM_S16LE
+            )
+            message['binary_audio'] = self.client_binary
+            if self.client_binary:
+                message['audio_encoding'] = streaming_protocol.choose_encoding(
+                    self.client_format, streaming_protocol.ENCODING_IDS
+                )
+        elif kind in ('chunk_result', 'no_speech', 'partial') and 'chunk_id' in message:
+            if kind == 'partial':
+                mapped = self.chunk_map.get(message['chunk_id'])
+            else:
+                mapped = self.chunk_map.pop(message['chunk_id'], None)
+            if mapped is not None:
+                message['chunk_id'], start, end = mapped
+                if kind == 'chunk_result':
+                    message['start_time'] = start
+                    message['end_time'] = end
+        elif kind == 'complete':
+            message['total_chunks'] = self.client_chunks
+            message['vad'] = self.vad.counters()
+        return message
+
+    def delta_partial(self, message):
+        """Cut a full-text partial down to what changed since the last one for its chunk."""
+        chunk_id, text = message.get('chunk_id'), message.get('text')
+        if 'stable' in message or not isinstance(text, str):
+            self.partials.pop(chunk_id, None)  # already a delta (a resumed upstream that sends them)
+            return False
+        message.update(streaming_protocol.encode_partial_delta(self.partials.get(chunk_id, ''), text))
+        self.partials[chunk_id] = text
+        self.stats['partials_delta_encoded'] += 1
+        self.stats['partial_chars_saved'] += len(text) - len(message['text'])
+        return True
+
+    def record_transcript(self, message):
+        """Queue a relayed message for the transcript store (client timeline ids and times)."""
+        store = self.gateway.transcripts
+        kind = message.get('type')
+        if kind == 'ready':
+            self.transcript_id = self.config.shard_key(secrets.token_urlsafe(16))
+            if self.vad is None:
+                self.session_id = message.get('session_id')  # lets a passthrough resume find it
+            owner = self.auth.user.get('localId') if self.auth is not None else None
+            store.append(self.transcript_id, 'start', owner=owner)
+            message['transcript_id'] = self.transcript_id
+            self.final = None
+            self.segment_chunks = {}
+        elif kind == 'resumed' and self.vad is None:
+            parked = self.gateway.parked_transcripts.pop(message.get('session_id'), None)
+            if parked is not None:
+                self.transcript_id, expiry = parked
+                self.session_id = message.get('session_id')
+                expiry.cancel()
+        elif self.transcript_id is None:
+            return
+        elif kind == 'chunk_result':
+            self.assemble(message)
+            self.record_fixups(message)
+            chunk = (message.get('chunk_id'), message.get('start_time'), message.get('end_time'))
+            store.append(self.transcript_id, 'chunk', chunk_id=chunk[0],
+                         start_time=chunk[1], end_time=chunk[2], text=message.get('text', ''))
+            if isinstance(message.get('segment'), int):
+                self.segment_chunks[message['segment']] = chunk
+        elif kind == 'no_speech':
+            self.assemble(message)
+            self.record_fixups(message)
+        elif kind == 'complete':
+            self.assemble(message)
+            self.record_fixups(message)
+            text = message.get('text')
+            if text is None and self.final is not None:
+                text = self.final.text(message.get('segments'))
+            store.append(self.transcript_id, 'complete', text=text or '',
+                         total_chunks=message.get('total_chunks'), duration=message.get('duration'))
+            self.transcript_id = None
+            self.final = None
+            self.segment_chunks = {}
+
+    def record_fixups(self, message):
+        """Log the corrected text of earlier segments; it replaces their chunk's record."""
+        for index, text in message.get('fixups') or ():
+            chunk = self.segment_chunks.get(index)
+            if chunk is not None:
+                self.gateway.transcripts.append(self.transcript_id, 'chunk', chunk_id=chunk[0],
+                                                start_time=chunk[1], end_time=chunk[2], text=text)
+
+    def assemble(self, message):
+        """Follow a final_segments session, whose `complete` leaves the text out."""
+        if self.final is None:
+            if 'segment' not in message:
+                return
+            self.final = streaming_protocol.FinalTranscript()
+        self.final.update(message)
+
+    def park_transcript(self):
+        """Keep a passthrough session's transcript open while the upstream holds it for resume."""
+        if self.transcript_id is None:
+            return
+        transcript_id, self.transcript_id = self.transcript_id, None
+        store, parked = self.gateway.transcripts, self.gateway.parked_transcripts
+
+        def expire(session_id=self.session_id):
+            if parked.pop(session_id, None) is not None:
+                store.append(transcript_id, 'closed')
+
+        expiry = asyncio.get_running_loop().call_later(self.config.resume_ttl, expire)
+        parked[self.session_id] = (transcript_id, expiry)
+
+    def close_transcript(self):
+        if self.transcript_id is not None:
+            self.gateway.transcripts.append(self.transcript_id, 'closed')
+            self.transcript_id = None
+
+    def close_recording(self):
+        if self.recording:
+            self.recording.close()
+            self.recording = None
+
+    async def on_upstream_message(self, msg):
+        if msg.type != WSMsgType.TEXT:
+            return
+        data = msg.data
+        complete = False
+        store = self.gateway.transcripts
+        if (self.vad is not None or any(marker in data for marker in PARSED_MARKERS)
+                or (self.encode_partials and '"partial"' in data)):
+            try:
+                message = json.loads(data)
+            except ValueError:
+                message = {}
+            kind = message.get('type')
+            complete = kind == 'complete'
+            rewrite = self.vad is not None and bool(message)
+            if rewrite:
+                self.to_client_timeline(message)
+            if kind == 'ready':
+                message['ping'] = True
+                self.encode_partials = self.client_deltas and message.get('partial_deltas') is not True
+                message['partial_deltas'] = self.client_deltas
+                if self.auth is not None and self.gateway.tokens.can_refresh:
+                    message['auto_refresh_enabled'] = True
+                rewrite = True
+            elif kind == 'partial' and self.encode_partials:
+                rewrite = self.delta_partial(message) or rewrite
+            elif kind in ('chunk_result', 'no_speech'):
+                self.record_result(message)
+                self.partials.pop(message.get('chunk_id'), None)
+            elif kind == 'complete' and self.end_sent is not None:
+                self.completions.record(time.perf_counter() - self.end_sent)
+                self.end_sent = None
+            elif kind == 'resumed' and self.vad is None:
+                self.client_chunks = message.get('next_seq', self.client_chunks)
+            elif kind == 'token_refreshed':
+                self.stats['upstream_token_refreshes'] += 1
+                if self.auth is not None:
+                    self.gateway.tokens.update_from_upstream(self.auth, message)
+            elif kind == 'token_refresh_failed':
+                self.stats['upstream_token_refresh_failures'] += 1
+            if store is not None:
+                self.record_transcript(message)
+            if kind in ('ready', 'resumed') and message.get('session_id') and self.config.worker is not None:
+                message['session_id'] = self.config.shard_key(message['session_id'])
+                rewrite = True
+            if rewrite:
+                data = json.dumps(message)
+
+        self.stats['messages_to_client'] += 1
+        self.stats['bytes_to_client'] += len(data)
+        await self.send_client(data)
+
+        if complete:
+            upstream, self.upstream = self.upstream, None
+            self.stats['sessions_completed'] += 1
+            await self.gateway.pool.release(upstream, reusable=True)
+
+    async def on_upstream_closed(self):
+        if self.upstream is None:
+            return
+        self.upstream = None
+        self.stats['upstream_disconnects'] += 1
+        if self.client is None:
+            # Parked session lost its upstream: nothing left to resume
+            await self.expire()
+            return
+        await self.send_client_json({'type': 'error', 'message': 'Transcription service disconnected'})
+        await self.client.close()
+
+
+class Gateway:
+    """Owns the upstream pool, session accounting and the aiohttp handlers."""
+
+    def __init__(self, config):
+        self.config = config
+        self.active_sessions = 0
+        self.stats = {
+            'sessions_total': 0,
+            'sessions_completed': 0,
+            'sessions_rejected': 0,
+            'upstream_connects': 0,
+            'upstream_connect_errors': 0,
+            'upstream_disconnects': 0,
+            'upstream_reuses': 0,
+            'pool_hits': 0,
+            'pool_misses': 0,
+            'messages_to_upstream': 0,
+            'messages_to_client': 0,
+            'bytes_to_upstream': 0,
+            'bytes_to_client': 0,
+            'bytes_from_client': 0,
+            'chunks_from_client': 0,
+            'chunk_results': 0,
+            'no_speech': 0,
+            'upstream_token_refreshes': 0,
+            'upstream_token_refresh_failures': 0,
+            'vad_suppressed_chunks': 0,
+            'vad_suppressed_bytes': 0,
+            'transcoded_chunks': 0,
+            'sessions_resumed': 0,
+            'sessions_expired': 0,
+            'resume_failures': 0,
+            'chunks_deduplicated': 0,
+            'sessions_forwarded': 0,
+            'partials_delta_encoded': 0,
+            'partial_chars_saved': 0,
+        }
+        self.sessions = set()
+        self.pipes = set()  # browser sockets relayed to the worker holding their state
+        self.draining = False
+        self.internal = None  # client session for the other workers' loopback ports
+        self.detached = {}
+        self.round_trips = metrics.Histogram()
+        self.completions = metrics.Histogram()
+        self.pool = UpstreamPool(config, self.stats)
+        self.tokens = None
+        if config.token_cache and config.api_base_url:
+            self.tokens = token_cache.TokenCache(config, self.stats)
+        self.recorder = session_recorder.SessionRecorder(config.record_path) if config.record_path else None
+        self.transcripts = None
+        self.parked_transcripts = {}
+        if config.transcript_dir:
+            directory = config.transcript_dir
+            if config.worker is not None:
+                directory = os.path.join(directory, f'worker-{config.worker}')
+            self.transcripts = transcript_store.TranscriptStore(
+                directory, config.transcript_segment_bytes,
+                config.transcript_commit_interval, self.stats,
+            )
+
+    async def handle_stream(self, request):
+        ws = web.WebSocketResponse(
+            heartbeat=self.config.heartbeat,
+            max_msg_size=self.config.max_message_bytes,
+        )
+        await ws.prepare(request)
+
+        if self.draining:
+            await ws.send_str(json.dumps({'type': 'error', 'message': 'Gateway restarting, try again'}))
+            await ws.close(code=aiohttp.WSCloseCode.SERVICE_RESTART)
+            return ws
+        owner = self.request_owner(request, self.cookie_key)
+        if owner is not None:
+            headers = {name: request.headers[name] for name in ('Cookie', 'Origin') if name in request.headers}
+            if await self.pipe(ws, owner, dict(headers, Host=request.host)):
+                return ws
+
+        if self.active_sessions >= self.config.max_sessions:
+            self.stats['sessions_rejected'] += 1
+            await ws.send_str(json.dumps({'type': 'error', 'message': 'Gateway at capacity, try again later'}))
+            await ws.close()
+            return ws
+
+        self.active_sessions += 1
+        self.stats['sessions_total'] += 1
+        auth = self.tokens.lookup_request(request) if self.tokens else None
+        session = RelaySession(self, ws, auth)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+            self.active_sessions -= 1
+        return ws
+
+    # ============================================================
+    # Worker sharding: relay requests to the worker holding their state
+    # ============================================================
+    @staticmethod
+    def cookie_key(request):
+        return request.cookies.get(token_cache.COOKIE_NAME)
+
+    @staticmethod
+    def transcript_key(request):
+        return request.match_info['transcript_id']
+
+    def request_owner(self, request, key_of):
+        """The other worker holding the request's key; requests relayed once are served where they land."""
+        if self.config.worker is None or FORWARDED_HEADER in request.headers:
+            return None
+        return self.config.key_owner(key_of(request))
+
+    def worker_url(self, worker, path, scheme='http'):
+        return f'{scheme}://127.0.0.1:{self.config.worker_ports[worker]}{path}'
+
+    def routed(self, key_of, handler):
+        """`handler`, run by the worker holding the request's key."""
+        async def handle(request):
+            owner = self.request_owner(request, key_of)
+            if owner is not None:
+                return await self.forward(request, owner)
+            return await handler(request)
+        return handle
+
+    async def forward(self, request, worker):
+        """Answer an HTTP request with another worker's response to it."""
+        headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+        headers.update({'Host': request.host, FORWARDED_HEADER: '1'})
+        try:
+            async with self.internal.request(request.method, self.worker_url(worker, str(request.rel_url)),
+                                             headers=headers, data=await request.read()) as upstream:
+                response = web.Response(body=await upstream.read(), status=upstream.status)
+                for name in FORWARDED_RESPONSE_HEADERS:
+                    for value in upstream.headers.getall(name, ()):
+                        response.headers.add(name, value)
+                return response
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            return web.json_response({'detail': f'Gateway worker unavailable: {type(e).__name__}'}, status=503)
+
+    async def pipe(self, client_ws, worker, headers, first=None):
+        """
+        Relay a browser socket to another worker's WS_PATH, frame for frame,
+        starting with `first` when the message that picked the worker was
+        already read. Returns False if that worker can't be reached, leaving
+        the socket to be served here.
+        """
+        try:
+            owner_ws = await self.internal.ws_connect(
+                self.worker_url(worker, WS_PATH, 'ws'), headers=dict(headers, **{FORWARDED_HEADER: '1'}),
+                max_msg_size=self.config.max_message_bytes,
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            return False
+        self.stats['sessions_forwarded'] += 1
+        self.pipes.add(client_ws)
+
+        async def relay(source, target, pending=None):
+            try:
+                if pending is not None:
+                    await target.send_str(pending)
+                async for msg in source:
+                    if msg.type == WSMsgType.TEXT:
+                        await target.send_str(msg.data)
+                    elif msg.type == WSMsgType.BINARY:
+                        await target.send_bytes(msg.data)
+                    elif msg.type == WSMsgType.ERROR:
+                        break
+            except ConnectionResetError:
+                pass
+            finally:
+                # 1005/1006 only describe a connection locally; they can't be sent on
+                code = source.close_code if source.close_code not in (None, 1005, 1006) else 1000
+                await target.close(code=code)
+
+        try:
+            await asyncio.gather(relay(client_ws, owner_ws, first), relay(owner_ws, client_ws))
+        finally:
+            self.pipes.discard(client_ws)
+        return True
+
+    def worker_snapshot(self):
+        """This worker's counters and histograms, JSON-safe for merging (gather)."""
+        round_trips, completions = self.latency_histograms()
+        return {
+            'stats': self.stats,
+            'active_sessions': self.active_sessions,
+            'detached_sessions': len(self.detached),
+            'pool_idle': len(self.pool.idle),
+            'round_trips': round_trips.to_dict(),
+            'completions': completions.to_dict(),
+            'telemetry': telemetry.aggregates.export(),
+        }
+
+    async def handle_worker(self, request):
+        return web.json_response(self.worker_snapshot())
+
+    async def gather(self):
+        """worker_snapshot() of every worker that answers, this one's first."""
+        snapshots = [self.worker_snapshot()]
+        if self.config.worker is None:
+            return snapshots
+
+        async def fetch(worker):
+            async with self.internal.get(self.worker_url(worker, WORKER_PATH), headers={FORWARDED_HEADER: '1'},
+                                         timeout=aiohttp.ClientTimeout(total=5)) as response:
+                return await response.json()
+
+        others = [worker for worker in range(len(self.config.worker_ports)) if worker != self.config.worker]
+        results = await asyncio.gather(*(fetch(worker) for worker in others), return_exceptions=True)
+        return snapshots + [result for result in results if isinstance(result, dict)]
+
+    async def merged_snapshot(self):
+        """gather() added up: one snapshot-shaped dict with Histograms, plus `workers`."""
+        snapshots = await self.gather()
+        merged = {
+            'stats': collections.Counter(), 'active_sessions': 0, 'detached_sessions': 0, 'pool_idle': 0,
+            'round_trips': metrics.Histogram(), 'completions': metrics.Histogram(), 'workers': len(snapshots),
+        }
+        for snapshot in snapshots:
+            merged['stats'].update(snapshot['stats'])
+            for name in ('active_sessions', 'detached_sessions', 'pool_idle'):
+                merged[name] += snapshot[name]
+            for name in ('round_trips', 'completions'):
+                merged[name].merge(metrics.Histogram.from_dict(snapshot[name]))
+        merged['telemetry'] = telemetry.combine(snapshot['telemetry'] for snapshot in snapshots)
+        return merged
+
+    async def handle_telemetry(self, request):
+        merged = await self.merged_snapshot()
+        return web.json_response(telemetry.summarize(merged['telemetry'], telemetry.aggregates.window))
+
+    async def drain(self, timeout):
+        """
+        Let in-flight sessions finish after the listener has stopped: sockets
+        that never started a session are closed at once, the rest get up to
+        `timeout` seconds before being closed with 1012 (service restart).
+        """
+        self.draining = True
+        restart = aiohttp.WSCloseCode.SERVICE_RESTART
+        for session in list(self.sessions):
+            if session.upstream is None and session.client is not None:
+                await session.client.close(code=restart, message=b'Gateway restarting')
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.sessions or self.detached or self.pipes) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        for client in [*self.pipes, *(session.client for session in self.sessions)]:
+            if client is not None:
+                await client.close(code=restart, message=b'Gateway restarting')
+        for session in list(self.detached.values()):
+            await session.expire()
+
+    def collect_metrics(self, session):
+        """Fold a session's histograms into the totals once it stops relaying."""
+        self.round_trips.merge(session.round_trips)
+        self.completions.merge(session.completions)
+        session.round_trips = metrics.Histogram()
+        session.completions = metrics.Histogram()
+
+    def latency_histograms(self):
+        """Totals plus the histograms of sessions still relaying or parked."""
+        round_trips, completions = self.round_trips.copy(), self.completions.copy()
+        for session in [*self.sessions, *self.detached.values()]:
+            round_trips.merge(session.round_trips)
+            completions.merge(session.completions)
+        return round_trips, completions
+
+    async def handle_stats(self, request):
+        merged = await self.merged_snapshot()
+        round_trips, completions = merged['round_trips'], merged['completions']
+        return web.json_response(dict(
+            merged['stats'],
+            active_sessions=merged['active_sessions'],
+            detached_sessions=merged['detached_sessions'],
+            pool_idle=merged['pool_idle'],
+            workers=merged['workers'],
+            latency_ms={'chunk_round_trip': round_trips.summary(), 'end_to_complete': completions.summary()},
+        ))
+
+    async def handle_metrics(self, request):
+        merged = await self.merged_snapshot()
+        stats = merged['stats']
+        round_trips, completions = merged['round_trips'], merged['completions']
+        results = stats['chunk_results'] + stats['no_speech']
+        out = metrics.Exposition()
+        out.gauge('gateway_workers', merged['workers'], 'Gateway worker processes reporting')
+        out.gauge('gateway_active_sessions', merged['active_sessions'], 'Browser sessions connected')
+        out.gauge('gateway_detached_sessions', merged['detached_sessions'], 'Sessions parked for resume')
+        out.gauge('gateway_pool_idle_connections', merged['pool_idle'], 'Warm upstream connections')
+        out.counter('gateway_chunks_in_total', stats['chunks_from_client'], 'Audio chunks from browsers')
+        out.counter('gateway_chunks_out_total', results, 'chunk_result and no_speech messages to browsers')
+        out.counter('gateway_bytes_in_total', stats['bytes_from_client'], 'Bytes received from browsers')
+        out.counter('gateway_bytes_out_total', stats['bytes_to_client'], 'Bytes sent to browsers')
+        out.counter('gateway_no_speech_total', stats['no_speech'], 'Chunks answered with no_speech')
+        out.gauge('gateway_no_speech_ratio', stats['no_speech'] / results if results else 0.0,
+                  'Share of chunk results that were no_speech')
+        out.header('gateway_token_refreshes_total', 'counter', 'Token refreshes by where they ran and outcome')
+        for source, ok, failed in (
+            ('cache', stats.get('auth_refreshes'), stats.get('auth_refresh_failures')),
+            ('upstream', stats['upstream_token_refreshes'], stats['upstream_token_refresh_failures']),
+        ):
+            out.sample('gateway_token_refreshes_total', ok, {'source': source, 'outcome': 'success'})
+            out.sample('gateway_token_refreshes_total', failed, {'source': source, 'outcome': 'failure'})
+        out.histogram('gateway_chunk_round_trip_seconds', round_trips,
+                      'Client chunk received to its chunk_result/no_speech sent')
+        out.histogram('gateway_end_to_complete_seconds', completions, 'end received to complete sent')
+        for name, value in stats.items():
+            if name not in EXPORTED_STATS:
+                out.counter(f"gateway_{name.removesuffix('_total')}_total", value)
+        return web.Response(text=out.render(), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+    async def handle_sessions(self, request):
+        return web.json_response([session.describe() for session in self.sessions])
+
+    async def handle_transcript(self, request):
+        """A stored transcript, or the chunks of it between ?start= and ?end= seconds."""
+        transcript_id = request.match_info['transcript_id']
+        known, owner = self.transcripts.owner(transcript_id)
+        if owner is not None:
+            # Sessions of a logged-in user are theirs only; others are keyed by the unguessable id
+            auth = self.tokens.lookup_request(request) if self.tokens else None
+            if auth is None or auth.user.get('localId') != owner:
+                known = False
+        if not known:
+            return web.json_response({'detail': 'Unknown transcript'}, status=404)
+        try:
+            start = float(request.query['start']) if 'start' in request.query else None
+            end = float(request.query['end']) if 'end' in request.query else None
+        except ValueError:
+            return web.json_response({'detail': 'start and end are seconds'}, status=422)
+        loop = asyncio.get_running_loop()
+        transcript = await loop.run_in_executor(None, self.transcripts.read, transcript_id, start, end)
+        return web.json_response(transcript)
+
+
+class WSGIBridge:
+    """Runs a WSGI app (the Flask app) on a thread pool for aiohttp requests."""
+
+    def __init__(self, wsgi_app, threads):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+
+    async def handle(self, request):
+        body = await request.read()
+        environ = self.build_environ(request, body)
+        loop = asyncio.get_running_loop()
+        status, headers, content = await loop.run_in_executor(self.executor, self.call, environ)
+        response = web.Response(body=content, status=int(status.split(' ', 1)[0]),
+                                reason=status.split(' ', 1)[1] if ' ' in status else None)
+        for name, value in headers:
+            response.headers.add(name, value)
+        return response
+
+    def call(self, environ):
+        captured = {}
+
+        def start_response(status, headers, exc_info=None):
+            captured['status'] = status
+            captured['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return captured['status'], captured['headers'], content
+
+    def build_environ(self, request, body):
+        path, _, query = request.raw_path.partition('?')
+        host, _, port = (request.host or '').partition(':')
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        environ = {
+            'REQUEST_METHOD': request.method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': host or 'localhost',
+            'SERVER_PORT': port or ('443' if request.secure else '80'),
+            'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+            'REMOTE_ADDR': peer[0] if peer else '',
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': request.scheme,
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+            'CONTENT_LENGTH': str(len(body)),
+        }
+        for name, value in request.headers.items():
+            key = name.upper().replace('-', '_')
+            if key == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif key != 'CONTENT_LENGTH':
+                key = 'HTTP_' + key
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+
+def create_app(flask_app, config):
+    """Build the aiohttp application serving `flask_app` plus the gateway."""
+    gateway = Gateway(config)
+    bridge = WSGIBridge(flask_app.wsgi_app, config.wsgi_threads)
+    flask_app.config['GATEWAY_WS_PATH'] = WS_PATH
+
+    app = web.Application(client_max_size=config.max_request_bytes)
+    app['gateway'] = gateway
+    app.router.add_get(WS_PATH, gateway.handle_stream)
+    app.router.add_get('/gateway/stats', gateway.handle_stats)
+    app.router.add_get('/gateway/sessions', gateway.handle_sessions)
+    app.router.add_get('/metrics', gateway.handle_metrics)
+    if config.worker is not None:
+        app.router.add_get(WORKER_PATH, gateway.handle_worker)
+        app.router.add_get('/telemetry', gateway.handle_telemetry)
+    if gateway.transcripts:
+        app.router.add_get('/transcripts/{transcript_id}',
+                           gateway.routed(gateway.transcript_key, gateway.handle_transcript))
+    if gateway.tokens:
+        flask_app.config['AUTH_PATH'] = token_cache.AUTH_PATH
+        app.router.add_post(token_cache.AUTH_PATH + '/login', gateway.tokens.handle_login)
+        app.router.add_get(token_cache.AUTH_PATH + '/session',
+                           gateway.routed(gateway.cookie_key, gateway.tokens.handle_session))
+        app.router.add_post(token_cache.AUTH_PATH + '/logout',
+                            gateway.routed(gateway.cookie_key, gateway.tokens.handle_logout))
+    app.router.add_route('*', '/{tail:.*}', bridge.handle)
+
+    async def on_startup(app):
+        if config.worker is not None:
+            gateway.internal = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, connect=5))
+        await gateway.pool.start()
+        if gateway.tokens:
+            await gateway.tokens.start()
+        if gateway.transcripts:
+            await asyncio.get_running_loop().run_in_executor(None, gateway.transcripts.start)
+        if gateway.recorder:
+            gateway.recorder.start()
+
+    async def on_cleanup(app):
+        await gateway.pool.stop()
+        if gateway.tokens:
+            await gateway.tokens.stop()
+        if gateway.transcripts:
+            await asyncio.get_running_loop().run_in_executor(None, gateway.transcripts.stop)
+        if gateway.recorder:
+            await asyncio.get_running_loop().run_in_executor(None, gateway.recorder.stop)
+        bridge.executor.shutdown(wait=False)
+        if gateway.internal:
+            await gateway.internal.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def serve(flask_app, config, host='0.0.0.0', port=8000, internal_socket=None):
+    """Serve until SIGINT/SIGTERM, then stop accepting and drain sessions before returning."""
+    app = create_app(flask_app, config)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    public = web.TCPSite(runner, host, port, reuse_port=True if config.worker is not None else None)
+    await public.start()
+    if internal_socket is not None:
+        # Stays open while draining: other workers still relay this one's sessions here
+        await web.SockSite(runner, internal_socket).start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    try:
+        await stopping.wait()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)  # a second signal stops without draining
+        await public.stop()
+        await app['gateway'].drain(config.drain_timeout)
+    finally:
+        await runner.cleanup()
+
+
+def run(flask_app, config, host='0.0.0.0', port=8000, workers=1):
+    """Serve on one event loop, or on `workers` pre-forked processes (prefork.py)."""
+    if workers <= 1:
+        asyncio.run(serve(flask_app, config, host, port))
+        return
+
+    def serve_worker(index, ports, internal_socket):
+        worker_config = replace(config, worker=index, worker_ports=ports)
+        asyncio.run(serve(flask_app, worker_config, host, port, internal_socket))
+
+    prefork.run(serve_worker, workers)
@@ -0,0 +1,486 @@
+"""
+Concurrent-session load generator for the /stream-transcription-auth protocol.
+
+Each simulated session follows the same protocol as the page in sample_app.py:
+config (with tokens) -> audio chunks every CHUNK_DURATION_MS -> end -> complete.
+Chunks are sent at real-time pace by default (--speed 1), faster with --speed N,
+or as fast as possible with --speed 0.
+
+Measured per run:
+- send -> chunk_result latency per chunk_id
+- time from WebSocket connect to `ready`
+- time from `end` to `complete`
+- no_speech, dropped (never answered) and errored chunks
+- misplaced chunk_results, whose start_time is not where their chunk_id was sent
+- chunk and audio throughput
+
+The summary is printed as JSON (and written to --output) so runs can be diffed
+between builds. chunk_id is assumed to count audio messages from --chunk-id-base.
+
+Usage:
+    python loadgen.py --url http://localhost:8001 --sessions 200 --duration 60 --output run.json
+"""
+
+import argparse
+import array
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import wave
+from dataclasses import dataclass, field
+
+import aiohttp
+
+import audio_codecs
+import streaming_protocol
+
+
+@dataclass
+class SessionResult:
+    """Timings and counters collected by one simulated session."""
+
+    ready_ms: float = None
+    complete_ms: float = None
+    chunk_latencies_ms: list = field(default_factory=list)
+    chunks_sent: int = 0
+    chunk_results: int = 0
+    no_speech: int = 0
+    errors: int = 0
+    misplaced: int = 0
+    bytes_sent: int = 0
+    binary_audio: bool = False
+    audio_encoding: str = None
+    flow_control: bool = False
+    credit_wait_ms: float = 0.0
+    completed: bool = False
+    failure: str = None
+
+    @property
+    def dropped(self):
+        return max(0, self.chunks_sent - self.chunk_results - self.no_speech)
+
+
+def percentile(sorted_values, pct):
+    """Linearly interpolated percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = (len(sorted_values) - 1) * pct / 100
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_values[low]
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def distribution(values):
+    """p50/p95/p99 summary of a list of millisecond timings."""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 3),
+        'p50': round(percentile(values, 50), 3),
+        'p95': round(percentile(values, 95), 3),
+        'p99': round(percentile(values, 99), 3),
+        'max': round(values[-1], 3),
+    }
+
+
+class AudioSource:
+    """Fixed-size PCM chunks, either synthetic or read from a WAV file."""
+
+    def __init__(self, sample_rate, chunk_ms, path=None, silence_ratio=0.3, seed=0):
+        self.sample_rate = sample_rate
+        self.chunk_ms = chunk_ms
+        if path:
+            self.chunks = self.load_wav(path)
+        else:
+            self.chunks = self.synthesize(silence_ratio, seed)
+        self.json_messages = [
+            json.dumps(streaming_protocol.encode_json_audio(chunk, self.sample_rate))
+            for chunk in self.chunks
+        ]
+        self.payloads = {}
+
+    def load_wav(self, path):
+        with wave.open(path, 'rb') as wav:
+            if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                raise SystemExit(f'{path}: expected mono 16-bit WAV')
+            self.sample_rate = wav.getframerate()
+            pcm = wav.readframes(wav.getnframes())
+        step = self.chunk_samples * 2
+        return [pcm[i:i + step] for i in range(0, len(pcm) - step + 1, step)] or [pcm]
+
+    def synthesize(self, silence_ratio, seed):
+        """A small cycle of 'speech' (modulated tones) and silent chunks."""
+        rng = random.Random(seed)
+        chunks = []
+        for i in range(20):
+            if rng.random() < silence_ratio:
+                chunks.append(bytes(self.chunk_samples * 2))
+                continue
+            freq = rng.uniform(120, 300)
+            samples = array.array('h', (
+                int(6000 * math.sin(2 * math.pi * freq * n / self.sample_rate)
+                    * (0.6 + 0.4 * math.sin(2 * math.pi * 4 * n / self.sample_rate)))
+                for n in range(self.chunk_samples)
+            ))
+            if sys.byteorder == 'big':
+                samples.byteswap()
+            chunks.append(samples.tobytes())
+        return chunks
+
+    @property
+    def chunk_samples(self):
+        return self.sample_rate * self.chunk_ms // 1000
+
+    def chunk(self, index):
+        return index % len(self.chunks)
+
+    def payload(self, encoding, chunk):
+        """Chunk encoded for a binary frame; each codec is encoded once and cached."""
+        if encoding not in self.payloads:
+            self.payloads[encoding] = [
+                audio_codecs.encode_payload(encoding, pcm) for pcm in self.chunks
+            ]
+        return self.payloads[encoding][chunk]
+
+
+class LoadGenerator:
+    def __init__(self, args):
+        self.args = args
+        self.audio = AudioSource(
+            args.sample_rate, args.chunk_ms, args.audio, args.silence_ratio, args.seed
+        )
+        self.chunk_count = max(1, round(args.duration * 1000 / args.chunk_ms))
+        self.results = []
+        self.tokens = None
+
+    async def login(self, http):
+        if self.args.id_token:
+            return {'idToken': self.args.id_token, 'refreshToken': self.args.refresh_token}
+        async with http.post(self.args.url + '/login', json={
+            'email': self.args.email,
+            'password': self.args.password,
+        }) as response:
+            data = await response.json()
+            if response.status != 200:
+                raise RuntimeError(f"login failed: {data.get('detail', response.status)}")
+            return data['access_token']
+
+    async def run(self):
+        connector = aiohttp.TCPConnector(limit=0)
+        async with aiohttp.ClientSession(connector=connector) as http:
+            if not self.args.login_per_session:
+                self.tokens = await self.login(http)
+
+            started = time.perf_counter()
+            tasks = []
+            for i in range(self.args.sessions):
+                if self.args.ramp_up and i:
+                    await asyncio.sleep(self.args.ramp_up / self.args.sessions)
+                tasks.append(asyncio.create_task(self.run_session(http, i)))
+            self.results = await asyncio.gather(*tasks)
+            self.wall_seconds = time.perf_counter() - started
+        return self.summary()
+
+    async def run_session(self, http, index):
+        result = SessionResult()
+        try:
+            tokens = self.tokens or await self.login(http)
+            await asyncio.wait_for(
+                self.stream(http, index, tokens, result),
+                timeout=self.args.timeout,
+            )
+        except asyncio.TimeoutError:
+            result.failure = 'timeout'
+        except (aiohttp.ClientError, RuntimeError, OSError) as e:
+            result.failure = f'{type(e).__name__}: {e}'
+        return result
+
+    async def stream(self, http, index, tokens, result):
+        args = self.args
+        sent_at = {}
+        ready = asyncio.Event()
+        complete = asyncio.Event()
+        credit_available = asyncio.Event()
+        credits = [None]  # None: server did not enable flow control
+        base = args.chunk_id_base
+
+        connect_started = time.perf_counter()
+        async with http.ws_connect(args.ws_url, max_msg_size=0) as ws:
+            await ws.send_str(json.dumps({
+                'type': 'config',
+                'language': args.language,
+                'id_token': tokens['idToken'],
+                'refresh_token': tokens.get('refreshToken'),
+                'binary_audio': args.transport == 'binary',
+                'flow_control': args.flow_control,
+                'final_segments': args.final_segments,
+                'resumable': args.resumable,
+                'audio_format': {
+                    'encoding': 'pcm_s16le',
+                    'sample_rate': self.audio.sample_rate,
+                    'channels': 1,
+                    'frame_version': streaming_protocol.AUDIO_FRAME_VERSION,
+                    'codecs': [args.codec],
+                },
+            }))
+
+            async def receive():
+                try:
+                    await receive_messages()
+                finally:
+                    credit_available.set()  # never leave the sender waiting
+
+            async def receive_messages():
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        continue
+                    now = time.perf_counter()
+                    data = json.loads(msg.data)
+                    kind = data.get('type')
+                    if kind == 'ready':
+                        result.ready_ms = (now - connect_started) * 1000
+                        result.binary_audio = data.get('binary_audio') is True
+                        result.audio_encoding = data.get('audio_encoding') or 'pcm_s16le'
+                        if args.flow_control and data.get('flow_control'):
+                            result.flow_control = True
+                            credits[0] = data['flow_control']['credits'] - result.chunks_sent
+                            credit_available.set()
+                        ready.set()
+                    elif kind == 'credit':
+                        if credits[0] is not None:
+                            credits[0] += data.get('credits', 0)
+                            credit_available.set()
+                    elif kind == 'chunk_result':
+                        result.chunk_results += 1
+                        expected = (data.get('chunk_id', base) - base) * args.chunk_ms / 1000
+                        if data.get('start_time') is not None and abs(data['start_time'] - expected) > 0.001:
+                            result.misplaced += 1
+                        sent = sent_at.pop(data.get('chunk_id'), None)
+                        if sent is not None:
+                            result.chunk_latencies_ms.append((now - sent) * 1000)
+                    elif kind == 'no_speech':
+                        result.no_speech += 1
+                        sent_at.pop(data.get('chunk_id'), None)
+                    elif kind == 'error':
+                        result.errors += 1
+                        message = data.get('message', '')
+                        if not ready.is_set() or 'Authentication' in message:
+                            result.failure = message
+                            ready.set()
+                            complete.set()
+                            return
+                    elif kind == 'complete':
+                        result.complete_ms = (now - end_sent[0]) * 1000
+                        result.completed = True
+                        complete.set()
+                        return
+                complete.set()
+                ready.set()
+                if not result.completed and not result.failure:
+                    result.failure = 'connection closed before complete'
+
+            end_sent = [None]
+            receiver = asyncio.create_task(receive())
+            try:
+                if args.wait_ready:
+                    await ready.wait()
+                    if result.failure:
+                        return
+
+                interval = args.chunk_ms / 1000 / args.speed if args.speed else 0
+                stream_started = time.perf_counter()
+                for seq in range(self.chunk_count):
+                    if complete.is_set():
+                        break
+                    if interval:
+                        delay = stream_started + seq * interval - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+
+                    if credits[0] is not None and credits[0] <= 0:
+                        wait_started = time.perf_counter()
+                        while credits[0] <= 0 and not complete.is_set():
+                            credit_available.clear()
+                            await credit_available.wait()
+                        result.credit_wait_ms += (time.perf_counter() - wait_started) * 1000
+                        if complete.is_set():
+                            break
+                    if credits[0] is not None:
+                        credits[0] -= 1
+
+                    chunk = self.audio.chunk(seq + index)
+                    if result.binary_audio:
+                        encoding = streaming_protocol.ENCODING_IDS[result.audio_encoding]
+                        payload = streaming_protocol.encode_audio_frame(
+                            seq, self.audio.payload(encoding, chunk), encoding,
+                            len(self.audio.chunks[chunk]) // 2,
+                        )
+                        sent_at[base + seq] = time.perf_counter()
+                        await ws.send_bytes(payload)
+                    else:
+                        payload = self.audio.json_messages[chunk]
+                        if args.resumable:
+                            payload = f'{{"seq": {seq}, {payload[1:]}'  # like the page's JSON chunks
+                        sent_at[base + seq] = time.perf_counter()
+                        await ws.send_str(payload)
+                    result.chunks_sent += 1
+                    result.bytes_sent += len(payload)
+
+                end_sent[0] = time.perf_counter()
+                await ws.send_str(json.dumps({'type': 'end'}))
+                await complete.wait()
+            finally:
+                receiver.cancel()
+
+    def summary(self):
+        results = self.results
+        chunk_latencies = [v for r in results for v in r.chunk_latencies_ms]
+        totals = {
+            'sent': sum(r.chunks_sent for r in results),
+            'chunk_results': sum(r.chunk_results for r in results),
+            'no_speech': sum(r.no_speech for r in results),
+            'dropped': sum(r.dropped for r in results),
+            'errors': sum(r.errors for r in results),
+            'misplaced': sum(r.misplaced for r in results),
+        }
+        failures = {}
+        for r in results:
+            if r.failure:
+                failures[r.failure] = failures.get(r.failure, 0) + 1
+
+        answered = totals['chunk_results'] + totals['no_speech']
+        audio_seconds = answered * self.args.chunk_ms / 1000
+        return {
+            'config': {
+                'sessions': self.args.sessions,
+                'duration_s': self.args.duration,
+                'chunk_ms': self.args.chunk_ms,
+                'speed': self.args.speed,
+                'transport': self.args.transport,
+                'codec': self.args.codec,
+                'final_segments': self.args.final_segments,
+                'resumable': self.args.resumable,
+                'ws_url': self.args.ws_url,
+            },
+            'sessions': {
+                'completed': sum(r.completed for r in results),
+                'failed': sum(1 for r in results if r.failure),
+                'binary_audio': sum(r.binary_audio for r in results),
+                'flow_control': sum(r.flow_control for r in results),
+                'failures': failures,
+            },
+            'chunks': totals,
+            'no_speech_ratio': round(totals['no_speech'] / answered, 4) if answered else None,
+            'latency_ms': {
+                'chunk_result': distribution(chunk_latencies),
+                'ready': distribution([r.ready_ms for r in results]),
+                'end_to_complete': distribution([r.complete_ms for r in results]),
+                'credit_wait': distribution([r.credit_wait_ms for r in results if r.flow_control]),
+            },
+            'throughput': {
+                'wall_seconds': round(self.wall_seconds, 3),
+                'chunks_per_second': round(answered / self.wall_seconds, 3),
+                'audio_seconds_per_second': round(audio_seconds / self.wall_seconds, 3),
+                'bytes_sent_per_second': round(
+                    sum(r.bytes_sent for r in results) / self.wall_seconds, 1
+                ),
+            },
+        }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Concurrent-session load generator')
+    parser.add_argument('--url', default='http://localhost:8001',
+                        help='base URL of the API serving /login')
+    parser.add_argument('--ws-url', help='WebSocket URL (default: derived from --url)')
+    parser.add_argument('--sessions', type=int, default=10)
+    parser.add_argument('--ramp-up', type=float, default=0.0,
+                        help='seconds over which sessions are started')
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help='seconds of audio per session')
+    parser.add_argument('--chunk-ms', type=int, default=500)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='pacing multiple of real time (0 = as fast as possible)')
+    parser.add_argument('--transport', choices=('binary', 'json'), default='binary',
+                        help='preferred audio transport (binary falls back to json)')
+    parser.add_argument('--no-flow-control', dest='flow_control', action='store_false',
+                        help='ignore server chunk credits and send at the paced rate')
+    parser.add_argument('--codec', choices=sorted(streaming_protocol.ENCODING_IDS), default='pcm_s16le',
+                        help='binary audio codec to offer (the server may fall back to pcm_s16le)')
+    parser.add_argument('--final-segments', action='store_true',
+                        help='ask for a complete that references the segments already sent')
+    parser.add_argument('--resumable', action='store_true',
+                        help='ask for a resumable session and number JSON chunks with `seq`, like the page')
+    parser.add_argument('--audio', help='mono 16-bit WAV to stream instead of synthetic audio')
+    parser.add_argument('--sample-rate', type=int, default=16000)
+    parser.add_argument('--silence-ratio', type=float, default=0.3,
+                        help='share of silent chunks in synthetic audio')
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--email', default='loadtest@example.com')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--id-token', help='skip /login and use this id token')
+    parser.add_argument('--refresh-token')
+    parser.add_argument('--login-per-session', action='store_true')
+    parser.add_argument('--no-wait-ready', dest='wait_ready', action='store_false',
+                        help='start sending audio before ready, like the page does')
+    parser.add_argument('--chunk-id-base', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='per-session timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON summary to this file')
+    args = parser.parse_args(argv)
+
+    args.url = args.url.rstrip('/')
+    if not args.ws_url:
+        args.ws_url = (
+            args.url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+            + '/stream-transcription-auth'
+        )
+    if args.timeout is None:
+        pace = args.duration / args.speed if args.speed else 0
+        args.timeout = pace + 120
+    return args
+
+
+def print_report(summary, stream=sys.stderr):
+    latency = summary['latency_ms']
+    print('=' * 80, file=stream)
+    print(f"📊 {summary['config']['sessions']} sessions, "
+          f"{summary['sessions']['completed']} completed, {summary['sessions']['failed']} failed",
+          file=stream)
+    for name, dist in latency.items():
+        if dist['count']:
+            print(f"   {name:<16} p50 {dist['p50']:>9.1f} ms   p95 {dist['p95']:>9.1f} ms   "
+                  f"p99 {dist['p99']:>9.1f} ms   (n={dist['count']})", file=stream)
+    chunks = summary['chunks']
+    print(f"   chunks: {chunks['sent']} sent, {chunks['chunk_results']} results, "
+          f"{chunks['no_speech']} no_speech, {chunks['dropped']} dropped, {chunks['errors']} errors, "
+          f"{chunks['misplaced']} misplaced",
+          file=stream)
+    throughput = summary['throughput']
+    print(f"   throughput: {throughput['chunks_per_second']} chunks/s, "
+          f"{throughput['audio_seconds_per_second']} audio-s/s, "
+          f"{throughput['bytes_sent_per_second']} B/s sent", file=stream)
+    print('=' * 80, file=stream)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    summary = asyncio.run(LoadGenerator(args).run())
+    print_report(summary)
+    output = json.dumps(summary, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Latency histograms and Prometheus text exposition for the gateway.
+
+`Histogram` is HDR-style: values are bucketed log-linearly (128 sub-buckets per
+power of two, so any recorded value is known to within 0.8%) over microseconds
+up to hours, and only the buckets that were hit are stored. Recording is an
+integer bit_length, a shift and a dict increment.
+
+Each relay session records into its own histograms on the event loop thread,
+so the hot path shares nothing and takes no lock. A scrape merges the live
+sessions' histograms with the totals of the finished ones, and with the other
+workers' (to_dict/from_dict) when the gateway runs more than one.
+"""
+
+SUB_BUCKET_BITS = 8
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+# Exported `le` bounds, in seconds
+DEFAULT_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0,
+                  1.5, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def bucket_index(value):
+    """Bucket of a non-negative integer value."""
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    return (shift << (SUB_BUCKET_BITS - 1)) + (value >> shift)
+
+
+def bucket_bounds(index):
+    """Lowest and highest value that land in a bucket."""
+    if index < SUB_BUCKET_COUNT:
+        return index, index
+    shift = (index >> (SUB_BUCKET_BITS - 1)) - 1
+    sub = (index & (SUB_BUCKET_HALF - 1)) + SUB_BUCKET_HALF
+    return sub << shift, ((sub + 1) << shift) - 1
+
+
+class Histogram:
+    """Sparse log-linear histogram of durations (recorded in seconds, kept in microseconds) or integers."""
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+
+    def record(self, seconds):
+        self.record_value(int(seconds * 1_000_000) if seconds > 0 else 0)
+
+    def record_value(self, value):
+        """Record a non-negative integer: microseconds, or a count such as bytes."""
+        index = bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        counts = self.counts
+        for index, n in other.counts.items():
+            counts[index] = counts.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def copy(self):
+        return Histogram().merge(self)
+
+    def to_dict(self):
+        """JSON-safe form, for merging histograms across processes."""
+        return {'counts': {str(index): n for index, n in self.counts.items()},
+                'count': self.count, 'total': self.total}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        histogram.counts = {int(index): n for index, n in data['counts'].items()}
+        histogram.count = data['count']
+        histogram.total = data['total']
+        return histogram
+
+    def quantile(self, q):
+        """Value at quantile `q` (0-1) in seconds, or None when empty."""
+        if not self.count:
+            return None
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return (low + high) / 2 / 1_000_000
+        return None
+
+    def cumulative(self, bounds):
+        """Counts at or below each bound (seconds), for Prometheus buckets."""
+        limits = [int(bound * 1_000_000) for bound in bounds]
+        totals = [0] * len(limits)
+        for index, n in self.counts.items():
+            high = bucket_bounds(index)[1]
+            for i, limit in enumerate(limits):
+                if high <= limit:
+                    totals[i] += n
+                    break
+        running = 0
+        for i, n in enumerate(totals):
+            running += n
+            totals[i] = running
+        return totals
+
+    def summary(self, unit=1000):
+        """
+        count/mean/p50/p95/p99/max, the shape loadgen reports.
+
+        Recorded values are divided by `unit`: milliseconds for durations by
+        default, unit=1 for values recorded with record_value.
+        """
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count / unit, 3),
+            'p50': round(self.quantile(0.5) * 1_000_000 / unit, 3),
+            'p95': round(self.quantile(0.95) * 1_000_000 / unit, 3),
+            'p99': round(self.quantile(0.99) * 1_000_000 / unit, 3),
+            'max': round(bucket_bounds(max(self.counts))[1] / unit, 3),
+        }
+
+
+# ============================================================
+# Prometheus text format
+# ============================================================
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + pairs + '}'
+
+
+class Exposition:
+    """Builds a /metrics response body."""
+
+    def __init__(self):
+        self.lines = []
+
+    def header(self, name, kind, help_text):
+        if help_text:
+            self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name, value, labels=None):
+        if value is None:
+            return
+        if isinstance(value, float):
+            value = repr(round(value, 6))
+        self.lines.append(f'{name}{format_labels(labels)} {value}')
+
+    def counter(self, name, value, help_text=None, labels=None):
+        self.header(name, 'counter', help_text)
+        self.sample(name, value, labels)
+
+    def gauge(self, name, value, help_text=None):
+        self.header(name, 'gauge', help_text)
+        self.sample(name, value)
+
+    def histogram(self, name, histogram, help_text=None, bounds=DEFAULT_BOUNDS):
+        self.header(name, 'histogram', help_text)
+        for bound, count in zip(bounds, histogram.cumulative(bounds)):
+            self.sample(name + '_bucket', count, {'le': repr(float(bound))})
+        self.sample(name + '_bucket', histogram.count, {'le': '+Inf'})
+        self.sample(name + '_sum', histogram.total / 1_000_000)
+        self.sample(name + '_count', histogram.count)
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
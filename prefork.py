@@ -0,0 +1,106 @@
+"""
+Pre-forked multi-process serving.
+
+`run` forks N worker processes and supervises them. Each worker binds the
+public port itself with SO_REUSEPORT, so the kernel spreads new connections
+across the workers' accept queues with no shared accept lock. Each worker also
+gets a loopback listening socket, created here before the fork. Their ports
+are known to every worker, so a worker can hand a connection to the worker
+that holds its state (see Gateway.forward).
+
+SIGINT/SIGTERM are passed on to the workers, which stop accepting and drain
+their sessions before exiting. A second signal kills them. A worker that dies
+on its own is restarted, unless it dies right after starting, which points at
+a configuration problem (the port is taken, say) rather than a crash.
+"""
+
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+MIN_UPTIME = 5.0  # seconds; a worker exiting sooner stops the server instead of restarting
+RESPAWN_DELAY = 1.0
+
+
+def loopback_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    sock.setblocking(False)
+    return sock
+
+
+def describe_status(status):
+    if os.WIFSIGNALED(status):
+        return f'signal {os.WTERMSIG(status)}'
+    return f'exit code {os.waitstatus_to_exitcode(status)}'
+
+
+def run(serve_worker, workers):
+    """
+    Run serve_worker(index, ports, internal_socket) in `workers` forked processes
+    until they all exit. `ports` holds every worker's loopback port, by index.
+    """
+    if not hasattr(socket, 'SO_REUSEPORT'):
+        raise SystemExit('❌ Multiple workers need SO_REUSEPORT (Linux, macOS or BSD)')
+    internal = [loopback_socket() for _ in range(workers)]
+    ports = tuple(sock.getsockname()[1] for sock in internal)
+    children = {}  # pid -> (index, started)
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            for i, sock in enumerate(internal):
+                if i != index:
+                    sock.close()
+            code = 0
+            try:
+                serve_worker(index, ports, internal[index])
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (index, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        sig = signal.SIGKILL if stopping else signal.SIGTERM
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for index in range(workers):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index, started = children.pop(pid, (None, 0))
+        if index is None or stopping:
+            continue
+        if time.monotonic() - started < MIN_UPTIME:
+            print(f'❌ Worker {index} exited right after starting ({describe_status(status)}), stopping',
+                  file=sys.stderr)
+            stop(signal.SIGTERM, None)
+            continue
+        print(f'⚠️ Worker {index} exited ({describe_status(status)}), restarting', file=sys.stderr)
+        time.sleep(RESPAWN_DELAY)
+        spawn(index)
+
+    for sock in internal:
+        sock.close()
@@ -0,0 +1,469 @@
+"""
+Replay recorded WebSocket sessions and compare runs.
+
+Sessions are recorded by the gateway (GATEWAY_RECORD_PATH, see
+session_recorder.py). The replayer sends each session's browser frames to any
+server in the original order:
+- at the recorded timing (--speed 1), N times faster (--speed N), or as fast as
+  flow-control credits allow (--speed 0)
+- as --copies N parallel copies of each session, to turn a few recordings into load
+
+Fresh tokens are put into each `config`, since recordings have them redacted. If
+the target negotiates a different audio codec or transport than the recording
+used, binary chunks are transcoded. Pings and sessions that start with `resume`
+are skipped.
+
+Every run, and the recording itself (`summarize`), becomes a JSON report with
+the distributions of send -> chunk_result and `end` -> `complete` latency, and
+each session's transcript. `compare` puts two reports side by side. It prints
+the latency percentiles with their change and the word-level transcript
+differences per session. With --max-regression / --max-word-diff it exits
+non-zero, so a deploy pipeline can stop on a regression.
+
+Usage:
+    GATEWAY_RECORD_PATH=sessions.jsonl python sample_app.py
+    python replay.py summarize sessions.jsonl --output recorded.json
+    python replay.py run sessions.jsonl --url http://localhost:8001 --output base.json
+    python replay.py run sessions.jsonl --url http://staging:8001 --speed 4 --copies 20 --baseline base.json
+    python replay.py compare base.json new.json --max-regression 10 --max-word-diff 0.02
+"""
+
+import argparse
+import asyncio
+import base64
+import difflib
+import json
+import sys
+import time
+
+import aiohttp
+
+import audio_codecs
+import streaming_protocol
+from loadgen import distribution
+from stream_client import login
+
+
+class RecordedSession:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.frames = []  # (t_ms, direction, text or bytes)
+
+    @property
+    def inbound(self):
+        return [frame for frame in self.frames if frame[1] == 'in']
+
+    def first_message(self):
+        for _, direction, data in self.frames:
+            if direction == 'in' and isinstance(data, str):
+                try:
+                    return json.loads(data)
+                except ValueError:
+                    return {}
+        return {}
+
+
+def load_recording(path):
+    """Recorded sessions that start with `config`, in the order they opened."""
+    sessions = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # a line cut short by a crash
+            session = sessions.get(record['s'])
+            if session is None:
+                session = sessions[record['s']] = RecordedSession(record['s'])
+            if record['dir'] in ('in', 'out'):
+                data = base64.b64decode(record['bin']) if 'bin' in record else record.get('text', '')
+                session.frames.append((record['t'], record['dir'], data))
+    return [s for s in sessions.values() if s.first_message().get('type') == 'config']
+
+
+def audio_seq(data, count):
+    """Sequence number of an inbound audio frame, or None if it isn't one."""
+    if isinstance(data, bytes):
+        try:
+            return streaming_protocol.decode_audio_frame(data)[0]
+        except streaming_protocol.AudioFrameError:
+            return None
+    if '"audio"' not in data:
+        return None
+    message = json.loads(data)
+    if message.get('type') != 'audio':
+        return None
+    return message.get('seq', count)
+
+
+def analyze(frames, chunk_id_base=0):
+    """Latencies and transcript of one session from its (t_ms, direction, data) frames."""
+    sent_at = {}
+    latencies = []
+    end_sent = complete_ms = None
+    texts, final = [], None
+    assembly = streaming_protocol.FinalTranscript()
+    counts = {'sent': 0, 'chunk_results': 0, 'no_speech': 0, 'errors': 0}
+    for t, direction, data in frames:
+        if direction == 'in':
+            seq = audio_seq(data, counts['sent'])
+            if seq is not None:
+                sent_at.setdefault(chunk_id_base + seq, t)
+                counts['sent'] += 1
+            elif '"end"' in data and json.loads(data).get('type') == 'end':
+                end_sent = t
+            continue
+        message = json.loads(data)
+        kind = message.get('type')
+        if kind in ('chunk_result', 'no_speech', 'complete'):
+            assembly.update(message)
+        if kind == 'chunk_result':
+            counts['chunk_results'] += 1
+            texts.append(message.get('text', ''))
+            sent = sent_at.pop(message.get('chunk_id'), None)
+            if sent is not None:
+                latencies.append(t - sent)
+        elif kind == 'no_speech':
+            counts['no_speech'] += 1
+            sent_at.pop(message.get('chunk_id'), None)
+        elif kind == 'error':
+            counts['errors'] += 1
+        elif kind == 'complete':
+            final = message.get('text')
+            if final is None and 'segments' in message:
+                final = assembly.text(message['segments'])
+            if end_sent is not None:
+                complete_ms = t - end_sent
+    return {
+        'chunk_latencies_ms': latencies,
+        'complete_ms': complete_ms,
+        'completed': final is not None,
+        'text': final if final is not None else ' '.join(texts),
+        'chunks': counts,
+    }
+
+
+def report(results, config, wall_seconds=None):
+    """Run report from per-session analyze() results."""
+    return {
+        'config': config,
+        'sessions': [
+            {key: r.get(key) for key in ('id', 'copy', 'text', 'completed', 'chunks', 'failure')}
+            for r in results
+        ],
+        'latency_ms': {
+            'chunk_result': distribution([v for r in results for v in r.get('chunk_latencies_ms', [])]),
+            'end_to_complete': distribution([r.get('complete_ms') for r in results]),
+        },
+        'failed': sum(1 for r in results if r.get('failure')),
+        'wall_seconds': round(wall_seconds, 3) if wall_seconds is not None else None,
+    }
+
+
+class Replayer:
+    def __init__(self, args):
+        self.args = args
+
+    async def run(self, sessions):
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+            tokens = await login(http, self.args.url, self.args.email, self.args.password)
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                self.replay(http, tokens, session, copy)
+                for session in sessions for copy in range(self.args.copies)
+            ))
+            return results, time.perf_counter() - started
+
+    async def replay(self, http, tokens, session, copy):
+        frames = []
+        try:
+            await asyncio.wait_for(self.drive(http, tokens, session, frames), self.args.timeout)
+            result = analyze(frames, self.args.chunk_id_base)
+            if not result['completed']:
+                result['failure'] = 'no complete'
+        except asyncio.TimeoutError:
+            result = dict(analyze(frames, self.args.chunk_id_base), failure='timeout')
+        except (aiohttp.ClientError, ConnectionError, OSError) as e:
+            result = dict(analyze(frames, self.args.chunk_id_base), failure=f'{type(e).__name__}: {e}')
+        result.update(id=session.id, copy=copy)
+        return result
+
+    async def drive(self, http, tokens, session, frames):
+        speed = self.args.speed
+        ready = asyncio.Event()
+        complete = asyncio.Event()
+        credit_available = asyncio.Event()
+        state = {'credits': None, 'binary': False, 'encoding': None, 'sample_rate': 16000}
+
+        async with http.ws_connect(self.args.ws_url, max_msg_size=0) as ws:
+            started = time.perf_counter()
+
+            def now():
+                return (time.perf_counter() - started) * 1000
+
+            async def receive():
+                try:
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        frames.append((now(), 'out', msg.data))
+                        message = json.loads(msg.data)
+                        kind = message.get('type')
+                        if kind == 'ready':
+                            state['binary'] = message.get('binary_audio') is True
+                            state['encoding'] = streaming_protocol.ENCODING_IDS.get(
+                                message.get('audio_encoding') or 'pcm_s16le')
+                            if message.get('flow_control'):
+                                state['credits'] = message['flow_control']['credits']
+                            ready.set()
+                        elif kind == 'credit' and state['credits'] is not None:
+                            state['credits'] += message.get('credits', 0)
+                            credit_available.set()
+                        elif kind == 'complete':
+                            complete.set()
+                        elif kind == 'error' and not ready.is_set():
+                            raise ConnectionError(message.get('message', 'session rejected'))
+                finally:
+                    ready.set()
+                    complete.set()
+                    credit_available.set()
+
+            receiver = asyncio.create_task(receive())
+            try:
+                for t, _, data in session.inbound:
+                    if speed:
+                        delay = started + t / 1000 / speed - time.perf_counter()
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    if receiver.done():
+                        break
+                    data = await self.prepare(data, tokens, state, ready)
+                    if data is None:
+                        continue
+                    if audio_seq(data, 0) is not None and state['credits'] is not None:
+                        while state['credits'] <= 0 and not receiver.done():
+                            credit_available.clear()
+                            await credit_available.wait()
+                        state['credits'] -= 1
+                    frames.append((now(), 'in', data))
+                    if isinstance(data, bytes):
+                        await ws.send_bytes(data)
+                    else:
+                        await ws.send_str(data)
+                await complete.wait()
+                if receiver.done() and receiver.exception():
+                    raise receiver.exception()
+            finally:
+                receiver.cancel()
+
+    async def prepare(self, data, tokens, state, ready):
+        """The frame to send for a recorded one, or None to skip it."""
+        if isinstance(data, bytes):
+            await ready.wait()
+            return self.transcode(data, state)
+        message = json.loads(data)
+        kind = message.get('type')
+        if kind == 'ping':
+            return None  # RTT probes depend on the server's answers
+        if kind == 'config':
+            message['id_token'] = tokens['idToken']
+            message['refresh_token'] = tokens.get('refreshToken')
+            audio_format = message.get('audio_format') or {}
+            state['sample_rate'] = int(audio_format.get('sample_rate') or 16000)
+            return json.dumps(message)
+        if kind == 'audio':
+            await ready.wait()
+        return data
+
+    def transcode(self, frame, state):
+        seq, encoding, sample_count, payload = streaming_protocol.decode_audio_frame(frame)
+        if state['binary'] and encoding == state['encoding']:
+            return frame
+        pcm = audio_codecs.decode_payload(encoding, payload, sample_count)
+        if state['binary']:
+            target = state['encoding']
+            return streaming_protocol.encode_audio_frame(
+                seq, audio_codecs.encode_payload(target, pcm), target, sample_count)
+        message = streaming_protocol.encode_json_audio(pcm, state['sample_rate'])
+        message['seq'] = seq
+        return json.dumps(message)
+
+
+# ============================================================
+# Comparing runs
+# ============================================================
+def word_diff(a, b):
+    """Share of words in `a` that changed in `b` (0.0 = identical)."""
+    a_words, b_words = (a or '').split(), (b or '').split()
+    if not a_words:
+        return 0.0 if not b_words else 1.0
+    matched = sum(block.size for block in difflib.SequenceMatcher(None, a_words, b_words).get_matching_blocks())
+    return 1 - matched / max(len(a_words), len(b_words))
+
+
+def compare(base, new):
+    """Latency percentile changes and transcript differences between two reports."""
+    latency = {}
+    for name in base['latency_ms']:
+        before, after = base['latency_ms'][name], new['latency_ms'].get(name, {'count': 0})
+        row = {}
+        for pct in ('p50', 'p95', 'p99'):
+            if before.get('count') and after.get('count'):
+                change = (after[pct] - before[pct]) / before[pct] * 100 if before[pct] else 0.0
+                row[pct] = {'base': before[pct], 'new': after[pct], 'change_pct': round(change, 1)}
+        latency[name] = row
+
+    base_texts = {s['id']: s['text'] for s in base['sessions'] if s.get('copy', 0) == 0}
+    diffs = []
+    for session in new['sessions']:
+        if session['id'] in base_texts:
+            diffs.append({
+                'id': session['id'],
+                'copy': session.get('copy', 0),
+                'word_diff': round(word_diff(base_texts[session['id']], session['text']), 4),
+            })
+    changed = [d for d in diffs if d['word_diff'] > 0]
+    return {
+        'latency_ms': latency,
+        'transcripts': {
+            'compared': len(diffs),
+            'changed': len(changed),
+            'max_word_diff': max((d['word_diff'] for d in diffs), default=0.0),
+            'mean_word_diff': round(sum(d['word_diff'] for d in diffs) / len(diffs), 4) if diffs else 0.0,
+            'worst': sorted(changed, key=lambda d: -d['word_diff'])[:10],
+        },
+        'failed': {'base': base.get('failed', 0), 'new': new.get('failed', 0)},
+    }
+
+
+def print_comparison(result, stream=sys.stderr):
+    print('=' * 80, file=stream)
+    for name, row in result['latency_ms'].items():
+        for pct, values in row.items():
+            print(f"   {name:<16} {pct}  {values['base']:>9.1f} ms -> {values['new']:>9.1f} ms "
+                  f"({values['change_pct']:+.1f}%)", file=stream)
+    transcripts = result['transcripts']
+    print(f"   transcripts: {transcripts['changed']} of {transcripts['compared']} changed, "
+          f"mean word diff {transcripts['mean_word_diff']:.2%}, max {transcripts['max_word_diff']:.2%}",
+          file=stream)
+    for diff in transcripts['worst']:
+        print(f"      {diff['id']} copy {diff['copy']}: {diff['word_diff']:.2%} of words differ", file=stream)
+    print(f"   failed sessions: {result['failed']['base']} -> {result['failed']['new']}", file=stream)
+    print('=' * 80, file=stream)
+
+
+def regressions(result, max_regression, max_word_diff):
+    problems = []
+    if max_regression is not None:
+        for name, row in result['latency_ms'].items():
+            p95 = row.get('p95')
+            if p95 and p95['change_pct'] > max_regression:
+                problems.append(f'{name} p95 up {p95["change_pct"]}%')
+    if max_word_diff is not None and result['transcripts']['max_word_diff'] > max_word_diff:
+        problems.append(f"transcript word diff {result['transcripts']['max_word_diff']:.2%}")
+    if result['failed']['new'] > result['failed']['base']:
+        problems.append(f"{result['failed']['new']} failed sessions")
+    return problems
+
+
+# ============================================================
+# CLI
+# ============================================================
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Replay recorded sessions and compare runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='replay a recording against a server')
+    run.add_argument('recording', help='JSONL written by the gateway (GATEWAY_RECORD_PATH)')
+    run.add_argument('--url', default='http://localhost:8001', help='base URL of the API serving /login')
+    run.add_argument('--ws-url', help='WebSocket URL (default: derived from --url)')
+    run.add_argument('--speed', type=float, default=1.0,
+                     help='multiple of the recorded timing (0 = as fast as credits allow)')
+    run.add_argument('--copies', type=int, default=1, help='parallel copies of each session')
+    run.add_argument('--limit', type=int, help='replay only the first N sessions')
+    run.add_argument('--email', default='loadtest@example.com')
+    run.add_argument('--password', default='loadtest')
+    run.add_argument('--chunk-id-base', type=int, default=0)
+    run.add_argument('--timeout', type=float, help='per-session timeout in seconds')
+    run.add_argument('--baseline', help='report to compare this run against')
+
+    summarize = commands.add_parser('summarize', help='report on the recorded sessions themselves')
+    summarize.add_argument('recording')
+    summarize.add_argument('--chunk-id-base', type=int, default=0)
+
+    for sub in (run, summarize):
+        sub.add_argument('--output', help='write the JSON report to this file')
+
+    diff = commands.add_parser('compare', help='compare two reports')
+    diff.add_argument('base')
+    diff.add_argument('new')
+    for sub in (run, diff):
+        sub.add_argument('--max-regression', type=float,
+                         help='fail if a p95 latency grows by more than this many percent')
+        sub.add_argument('--max-word-diff', type=float,
+                         help='fail if any transcript differs by more than this share of words')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        args.url = args.url.rstrip('/')
+        if not args.ws_url:
+            args.ws_url = (
+                args.url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+                + '/stream-transcription-auth'
+            )
+    return args
+
+
+def write_report(summary, path):
+    output = json.dumps(summary, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+def check(result, args):
+    print_comparison(result)
+    problems = regressions(result, args.max_regression, args.max_word_diff)
+    if problems:
+        raise SystemExit('❌ Regression: ' + '; '.join(problems))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        check(compare(base, new), args)
+        return
+
+    sessions = load_recording(args.recording)
+    if args.command == 'summarize':
+        results = [dict(analyze(s.frames, args.chunk_id_base), id=s.id, copy=0) for s in sessions]
+        summary = report(results, {'recording': args.recording, 'sessions': len(sessions)})
+        print(f'📼 {len(sessions)} recorded sessions', file=sys.stderr)
+        write_report(summary, args.output)
+        return
+
+    sessions = sessions[:args.limit] if args.limit else sessions
+    print(f'▶️ Replaying {len(sessions)} sessions x {args.copies} at speed {args.speed:g} '
+          f'against {args.ws_url}', file=sys.stderr)
+    try:
+        results, wall_seconds = asyncio.run(Replayer(args).run(sessions))
+    except (ConnectionError, aiohttp.ClientError, OSError) as e:
+        raise SystemExit(f'❌ {e}')
+    summary = report(results, {
+        'recording': args.recording, 'ws_url': args.ws_url, 'speed': args.speed,
+        'copies': args.copies, 'sessions': len(sessions),
+    }, wall_seconds)
+    write_report(summary, args.output)
+    if args.baseline:
+        with open(args.baseline) as f:
+            check(compare(json.load(f), summary), args)
+
+
+if __name__ == '__main__':
+    main()
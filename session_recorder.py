@@ -0,0 +1,116 @@
+"""
+WebSocket session recorder for the gateway.
+
+With GATEWAY_RECORD_PATH set, every browser session through the gateway is
+captured to that JSONL file: each frame the browser sends and each message
+sent back to it, with its time in milliseconds since the session opened.
+replay.py re-drives the recordings against any server and compares runs.
+
+Lines (one per frame, sessions interleaved):
+    {"s": "<session>", "t": 0.0, "dir": "open", "ts": <unix time>}
+    {"s": ..., "t": 12.5, "dir": "in", "text": "{\"type\": \"config\", ...}"}
+    {"s": ..., "t": 530.1, "dir": "in", "bin": "<base64 frame>"}
+    {"s": ..., "t": 702.9, "dir": "out", "text": "{\"type\": \"chunk_result\", ...}"}
+    {"s": ..., "t": 9001.0, "dir": "close"}
+
+Tokens in `config`, `resume` and `token_refreshed` are replaced with
+"<redacted>"; the replayer logs in itself. Audio is recorded as sent, so treat
+recordings like the transcripts they contain.
+
+`record` only takes a timestamp and queues the frame; a writer thread encodes
+and appends in batches. Each batch is a single write() on an O_APPEND file, so
+gateway workers can share one recording file without splitting lines.
+"""
+
+import base64
+import json
+import os
+import queue
+import secrets
+import sys
+import threading
+import time
+
+REDACTED = '<redacted>'
+TOKEN_FIELDS = ('id_token', 'refresh_token', 'idToken', 'refreshToken')
+
+
+def redact(text):
+    """A text frame with any token values replaced."""
+    if not any(f'"{name}"' in text for name in TOKEN_FIELDS):
+        return text
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return text
+    if not isinstance(message, dict):
+        return text
+    for name in TOKEN_FIELDS:
+        if message.get(name):
+            message[name] = REDACTED
+    return json.dumps(message)
+
+
+class RecordedSession:
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.id = secrets.token_hex(6)
+        self.started = time.perf_counter()
+        recorder.queue.put((self.id, 0.0, 'open', time.time()))
+
+    def record(self, direction, data):
+        self.recorder.queue.put((self.id, (time.perf_counter() - self.started) * 1000, direction, data))
+
+    def close(self):
+        self.record('close', None)
+
+
+class SessionRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.fd = None
+        self.writer = None
+
+    def start(self):
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.writer = threading.Thread(target=self.write_loop, name='session-recorder', daemon=True)
+        self.writer.start()
+
+    def stop(self):
+        if self.writer:
+            self.queue.put(None)
+            self.writer.join()
+        if self.fd is not None:
+            os.close(self.fd)
+
+    def session(self):
+        return RecordedSession(self)
+
+    def write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [self.encode(item) for item in batch if item is not None]
+            try:
+                os.write(self.fd, ''.join(lines).encode('utf-8'))
+            except OSError as e:
+                print(f'⚠️ Session recording failed: {e!r}', file=sys.stderr)
+            if None in batch:
+                return
+
+    @staticmethod
+    def encode(item):
+        session_id, t, direction, data = item
+        line = {'s': session_id, 't': round(t, 3), 'dir': direction}
+        if direction == 'open':
+            line['ts'] = round(data, 3)
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            line['bin'] = base64.b64encode(data).decode('ascii')
+        elif data is not None:
+            line['text'] = redact(data)
+        return json.dumps(line) + '\n'
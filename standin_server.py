@@ -0,0 +1,747 @@
+"""
+Local stand-in for the Dawnbreak transcription backend.
+
+Implements the same surface the page in sample_app.py talks to, so the app,
+the load generator and every performance feature can be exercised offline:
+- POST /login returning {"access_token": {"idToken", "refreshToken", "expiresIn", ...}}
+- POST /refresh exchanging {"refresh_token"} for a new token pair, answered like /login
+- WebSocket /stream-transcription-auth
+    in:  config, resume, audio (JSON base64 WAV or binary frames), ping, end
+    out: ready, resumed, resume_failed, partial, chunk_result, no_speech, pong,
+         credit, token_refreshed, token_refresh_failed, complete, error
+- GET /stats with server-side counters
+
+Sessions that ask for `"resumable": true` get a `session_id` in `ready`. If the
+socket drops, the session keeps processing for --resume-ttl seconds, buffering
+what it would have sent; a new socket sending `resume` picks it up, and replayed
+chunks are deduplicated by sequence number.
+
+Transcripts are synthetic: silent chunks get `no_speech`, everything else gets a
+deterministic run of clinical vocabulary. Latency, failures and throughput limits
+are configurable so results can be compared against a known baseline. Without
+`final_segments` the `complete` text comes after a final pass that takes
+--final-ms-per-chunk per chunk; with it, segments are punctuated as results go
+out and `complete` only references them.
+
+Usage:
+    python standin_server.py --port 8001 --latency-ms 150 --jitter-ms 50
+    TRANSCRIPTION_API_URL=http://localhost:8001 python sample_app.py
+"""
+
+import argparse
+import asyncio
+import collections
+import json
+import math
+import random
+import secrets
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from aiohttp import WSMsgType, web
+
+import audio_codecs
+import streaming_protocol
+
+WORDS = (
+    'patient reports mild chest pain radiating to the left arm since this morning '
+    'blood pressure is one thirty over eighty five heart rate regular no murmurs '
+    'lungs clear to auscultation bilaterally abdomen soft non tender '
+    'continue metformin five hundred milligrams twice daily follow up in two weeks '
+    'history of type two diabetes and hypertension no known drug allergies '
+    'plan to order a chest x ray complete blood count and basic metabolic panel'
+).split()
+SENTENCE_BREAK_RATE = 0.3  # chance that a sentence ends between two speech chunks
+
+
+@dataclass
+class StandinConfig:
+    """Synthetic behaviour of the stand-in server."""
+
+    # Latency
+    latency_ms: float = 150.0
+    jitter_ms: float = 50.0
+    ms_per_audio_second: float = 0.0
+    login_latency_ms: float = 50.0
+    final_latency_ms: float = 200.0
+    final_ms_per_chunk: float = 5.0
+    partials: bool = True
+    partials_per_chunk: int = 3  # growing hypotheses before each chunk_result
+
+    # Failure injection (probabilities)
+    chunk_error_rate: float = 0.0
+    disconnect_rate: float = 0.0
+    login_failure_rate: float = 0.0
+    refresh_failure_rate: float = 0.0
+
+    # Throughput limits (0 = unlimited)
+    max_sessions: int = 0
+    inference_concurrency: int = 0
+    max_chunks_per_second: float = 0.0
+
+    # Auth
+    token_ttl: int = 3600
+    refresh_interval: float = 55 * 60
+    accept_any_token: bool = False
+
+    # Protocol
+    binary_audio: bool = True
+    partial_deltas: bool = True
+    final_segments: bool = True
+    codecs: str = 'pcm_s16le,mulaw,adpcm_ima'
+    credit_window: int = 8  # chunks a client may have outstanding (0 = no flow control)
+    resume_ttl: float = 60.0  # seconds a dropped session stays resumable (0 = off)
+    resume_outbox: int = 512  # messages buffered for a dropped session
+    sample_rate: int = 16000
+    silence_rms: float = 300.0
+    words_per_second: float = 2.5
+    seed: int = 0
+
+
+class TokenStore:
+    """Issues and validates synthetic Firebase-style tokens."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.id_tokens = {}
+        self.refresh_tokens = {}
+
+    def issue(self, user):
+        id_token = 'standin-id-' + secrets.token_urlsafe(24)
+        refresh_token = 'standin-refresh-' + secrets.token_urlsafe(24)
+        self.id_tokens[id_token] = (user, time.time() + self.ttl)
+        self.refresh_tokens[refresh_token] = user
+        return {
+            'idToken': id_token,
+            'refreshToken': refresh_token,
+            'expiresIn': str(self.ttl),
+            'email': user['email'],
+            'displayName': user['displayName'],
+            'localId': user['localId'],
+        }
+
+    def validate(self, id_token):
+        """Return the user for a live id token, or None."""
+        entry = self.id_tokens.get(id_token)
+        if not entry or entry[1] < time.time():
+            return None
+        return entry[0]
+
+    def refresh(self, refresh_token):
+        """Exchange a refresh token for a new token pair, or return None."""
+        user = self.refresh_tokens.pop(refresh_token, None)
+        if user is None:
+            return None
+        return self.issue(user)
+
+
+class TokenBucket:
+    """Global rate limiter for chunk inference."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class StandinServer:
+    """aiohttp application implementing the login and streaming endpoints."""
+
+    def __init__(self, config=None):
+        self.config = config or StandinConfig()
+        self.rng = random.Random(self.config.seed)
+        self.tokens = TokenStore(self.config.token_ttl)
+        self.inference_slots = (
+            asyncio.Semaphore(self.config.inference_concurrency)
+            if self.config.inference_concurrency else None
+        )
+        self.rate_limiter = (
+            TokenBucket(self.config.max_chunks_per_second)
+            if self.config.max_chunks_per_second else None
+        )
+        self.active_sessions = 0
+        self.stats = {
+            'logins': 0,
+            'sessions_started': 0,
+            'sessions_rejected': 0,
+            'chunks_received': 0,
+            'chunks_transcribed': 0,
+            'chunks_no_speech': 0,
+            'partials_sent': 0,
+            'chunks_failed': 0,
+            'bytes_received': 0,
+            'binary_frames': 0,
+            'json_frames': 0,
+            'tokens_refreshed': 0,
+            'disconnects_injected': 0,
+            'credits_granted': 0,
+            'credit_violations': 0,
+            'sessions_resumed': 0,
+            'sessions_expired': 0,
+            'resume_failures': 0,
+            'chunks_deduplicated': 0,
+            'sequence_gaps': 0,
+        }
+        self.detached = {}
+
+    def create_app(self):
+        app = web.Application(middlewares=[cors_middleware])
+        app.router.add_post('/login', self.handle_login)
+        app.router.add_post('/refresh', self.handle_refresh)
+        app.router.add_get('/stats', self.handle_stats)
+        app.router.add_get('/stream-transcription-auth', self.handle_stream)
+        return app
+
+    def chance(self, probability):
+        return probability > 0 and self.rng.random() < probability
+
+    async def sleep_ms(self, base_ms, jitter_ms=0.0):
+        delay = base_ms + (self.rng.uniform(-jitter_ms, jitter_ms) if jitter_ms else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    async def handle_login(self, request):
+        try:
+            body = await request.json()
+            email = body['email']
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'detail': 'email and password are required'}, status=422)
+
+        await self.sleep_ms(self.config.login_latency_ms)
+        if self.chance(self.config.login_failure_rate):
+            return web.json_response({'detail': 'Synthetic login failure'}, status=503)
+
+        self.stats['logins'] += 1
+        user = {
+            'email': email,
+            'displayName': email.split('@')[0].title(),
+            'localId': 'standin-' + secrets.token_hex(8),
+        }
+        return web.json_response({'access_token': self.tokens.issue(user)})
+
+    async def handle_refresh(self, request):
+        try:
+            body = await request.json()
+            refresh_token = body['refresh_token']
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'detail': 'refresh_token is required'}, status=422)
+
+        await self.sleep_ms(self.config.login_latency_ms)
+        if self.chance(self.config.refresh_failure_rate):
+            return web.json_response({'detail': 'Synthetic refresh failure'}, status=503)
+        tokens = self.tokens.refresh(refresh_token)
+        if tokens is None:
+            return web.json_response({'detail': 'Invalid refresh token'}, status=401)
+        self.stats['tokens_refreshed'] += 1
+        return web.json_response({'access_token': tokens})
+
+    async def handle_stats(self, request):
+        return web.json_response(dict(
+            self.stats,
+            active_sessions=self.active_sessions,
+            detached_sessions=len(self.detached),
+        ))
+
+    async def handle_stream(self, request):
+        ws = web.WebSocketResponse(max_msg_size=16 * 1024 * 1024)
+        await ws.prepare(request)
+        await StreamSession(self, ws).run()
+        return ws
+
+
+class StreamSession:
+    """
+    One transcription session. After `complete` the socket can start a new one.
+
+    A resumable session outlives its socket: on disconnect it is parked in
+    `server.detached` and its messages go to an outbox until `resume` attaches
+    a new socket (or the TTL expires).
+    """
+
+    def __init__(self, server, ws):
+        self.server = server
+        self.config = server.config
+        self.ws = ws
+        self.rng = random.Random(server.rng.random())
+        self.reset()
+
+    def reset(self):
+        self.configured = False
+        self.binary_audio = False
+        self.partial_deltas = False
+        self.last_partial = ''
+        self.final_segments = False
+        self.sentence_open = False
+        self.audio_encoding = 'pcm_s16le'
+        self.flow_control = False
+        self.credits = 0
+        self.session_id = None
+        self.outbox = collections.deque()
+        self.outbox_overflowed = False
+        self.expiry = None
+        self.sample_rate = self.config.sample_rate
+        self.chunk_id = 0
+        self.samples_received = 0
+        self.texts = []
+        self.queue = asyncio.Queue()
+        self.worker = None
+        self.refresher = None
+        self.refresh_token = None
+
+    async def send(self, message):
+        if self.ws is not None and not self.ws.closed:
+            await self.ws.send_str(json.dumps(message))
+        elif self.session_id is not None:
+            # Dropped connection: hold the message until the client resumes
+            if len(self.outbox) >= self.config.resume_outbox:
+                self.outbox_overflowed = True
+            else:
+                self.outbox.append(message)
+
+    async def close(self, **kwargs):
+        if self.ws is not None:
+            await self.ws.close(**kwargs)
+
+    async def run(self):
+        try:
+            async for msg in self.ws:
+                if msg.type == WSMsgType.TEXT:
+                    await self.on_text(msg.data)
+                elif msg.type == WSMsgType.BINARY:
+                    await self.on_binary(msg.data)
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            if self.session_id is not None:
+                self.detach()
+            else:
+                await self.stop()
+
+    def detach(self):
+        self.ws = None
+        self.server.detached[self.session_id] = self
+        self.expiry = asyncio.get_running_loop().call_later(
+            self.config.resume_ttl, lambda: asyncio.ensure_future(self.expire())
+        )
+
+    async def expire(self):
+        if self.server.detached.get(self.session_id) is self:
+            del self.server.detached[self.session_id]
+            self.server.stats['sessions_expired'] += 1
+            await self.stop()
+            self.reset()
+
+    async def attach(self, ws):
+        """Continue this session on a new socket and deliver what it missed."""
+        if self.expiry:
+            self.expiry.cancel()
+            self.expiry = None
+        self.ws = ws
+        self.last_partial = ''  # the next partial carries its whole text
+        await self.send({'type': 'resumed', 'session_id': self.session_id, 'next_seq': self.chunk_id})
+        while self.outbox:
+            await self.send(self.outbox.popleft())
+        if not self.configured:
+            self.reset()  # it completed while parked; the socket is free for a new session
+
+    async def stop(self):
+        for task in (self.worker, self.refresher):
+            if task:
+                task.cancel()
+        if self.configured:
+            self.server.active_sessions -= 1
+            self.configured = False
+
+    async def on_text(self, data):
+        try:
+            message = json.loads(data)
+        except ValueError:
+            await self.send({'type': 'error', 'message': 'Invalid JSON message'})
+            return
+
+        kind = message.get('type')
+        if kind == 'config':
+            await self.on_config(message)
+        elif kind == 'resume' and not self.configured:
+            await self.on_resume(message)
+        elif not self.configured:
+            await self.send({'type': 'error', 'message': 'Send config first'})
+        elif kind == 'audio':
+            try:
+                pcm, sample_rate = streaming_protocol.decode_json_audio(message)
+            except streaming_protocol.AudioFrameError as e:
+                await self.send({'type': 'error', 'message': str(e)})
+                return
+            self.server.stats['json_frames'] += 1
+            self.server.stats['bytes_received'] += len(data)
+            if self.accept_sequence(message.get('seq')):
+                self.enqueue(pcm, sample_rate)
+        elif kind == 'ping':
+            await self.send({'type': 'pong', 'id': message.get('id')})
+        elif kind == 'end':
+            await self.on_end()
+        else:
+            await self.send({'type': 'error', 'message': f'Unknown message type: {kind}'})
+
+    async def on_binary(self, data):
+        if not self.binary_audio:
+            await self.send({'type': 'error', 'message': 'Binary audio was not negotiated'})
+            return
+        try:
+            sequence, encoding, sample_count, payload = streaming_protocol.decode_audio_frame(data)
+            pcm = audio_codecs.decode_payload(encoding, payload, sample_count)
+        except streaming_protocol.AudioFrameError as e:
+            await self.send({'type': 'error', 'message': str(e)})
+            return
+        self.server.stats['binary_frames'] += 1
+        self.server.stats['bytes_received'] += len(data)
+        if self.accept_sequence(sequence):
+            self.enqueue(pcm, self.sample_rate)
+
+    def accept_sequence(self, seq):
+        """False for a chunk this session already has (a replay after resume)."""
+        if self.session_id is None or seq is None:
+            return True
+        if seq < self.chunk_id:
+            self.server.stats['chunks_deduplicated'] += 1
+            return False
+        if seq > self.chunk_id:
+            self.server.stats['sequence_gaps'] += 1
+            self.chunk_id = seq
+        return True
+
+    async def authenticate(self, message):
+        id_token = message.get('id_token')
+        if not id_token:
+            await self.send({'type': 'error', 'message': 'Authentication required: missing id_token'})
+            await self.close()
+            return False
+        if not self.config.accept_any_token and self.server.tokens.validate(id_token) is None:
+            await self.send({'type': 'error', 'message': 'Authentication failed: Token invalid or expired'})
+            await self.close()
+            return False
+        return True
+
+    async def on_resume(self, message):
+        if not await self.authenticate(message):
+            return
+        session = self.server.detached.pop(message.get('session_id'), None)
+        if session is None or session.outbox_overflowed:
+            if session is not None:
+                await session.stop()
+            self.server.stats['resume_failures'] += 1
+            # The client falls back to a fresh `config` on this socket
+            await self.send({'type': 'resume_failed', 'message': 'Unknown or expired session'})
+            return
+
+        self.server.stats['sessions_resumed'] += 1
+        await session.attach(self.ws)
+        await session.run()
+
+    async def on_config(self, message):
+        if self.configured:
+            await self.send({'type': 'error', 'message': 'Session already configured'})
+            return
+        if not await self.authenticate(message):
+            return
+
+        max_sessions = self.config.max_sessions
+        if max_sessions and self.server.active_sessions >= max_sessions:
+            self.server.stats['sessions_rejected'] += 1
+            await self.send({'type': 'error', 'message': 'Server at capacity, try again later'})
+            await self.close()
+            return
+
+        audio_format = message.get('audio_format') or {}
+        self.sample_rate = int(audio_format.get('sample_rate') or self.config.sample_rate)
+        self.binary_audio = self.config.binary_audio and message.get('binary_audio') is True
+        self.partial_deltas = self.config.partial_deltas and message.get('partial_deltas') is True
+        self.final_segments = self.config.final_segments and message.get('final_segments') is True
+        self.flow_control = bool(self.config.credit_window) and message.get('flow_control') is True
+        self.credits = self.config.credit_window
+        if self.binary_audio:
+            supported = self.config.codecs.split(',')
+            self.audio_encoding = streaming_protocol.choose_encoding(audio_format, supported)
+        self.refresh_token = message.get('refresh_token')
+        if self.config.resume_ttl and message.get('resumable') is True:
+            self.session_id = 's-' + secrets.token_urlsafe(16)
+        self.configured = True
+        self.server.active_sessions += 1
+        self.server.stats['sessions_started'] += 1
+
+        self.worker = asyncio.create_task(self.process_chunks())
+        if self.refresh_token:
+            self.refresher = asyncio.create_task(self.refresh_periodically())
+
+        await self.send({
+            'type': 'ready',
+            'auto_refresh_enabled': bool(self.refresh_token),
+            'binary_audio': self.binary_audio,
+            'audio_encoding': self.audio_encoding,
+            'partial_deltas': self.partial_deltas,
+            'final_segments': self.final_segments,
+            'ping': True,
+            'flow_control': {'credits': self.config.credit_window} if self.flow_control else None,
+            'session_id': self.session_id,
+        })
+
+    def enqueue(self, pcm, sample_rate):
+        samples = np.frombuffer(bytes(pcm), dtype='<i2')
+
+        start = self.samples_received / self.sample_rate
+        self.samples_received += len(samples)
+        end = self.samples_received / self.sample_rate
+        self.server.stats['chunks_received'] += 1
+        if self.flow_control:
+            if self.credits <= 0:
+                self.server.stats['credit_violations'] += 1
+            self.credits -= 1
+        self.queue.put_nowait((self.chunk_id, samples, start, end))
+        self.chunk_id += 1
+
+    async def process_chunks(self):
+        while True:
+            item = await self.queue.get()
+            try:
+                if item is None:
+                    return
+                await self.transcribe(*item)
+                if self.flow_control:
+                    # The chunk has left the pipeline: let the client send another
+                    self.credits += 1
+                    self.server.stats['credits_granted'] += 1
+                    await self.send({'type': 'credit', 'credits': 1})
+            finally:
+                self.queue.task_done()
+
+    async def transcribe(self, chunk_id, samples, start, end):
+        server = self.server
+        if server.rate_limiter:
+            await server.rate_limiter.acquire()
+
+        if server.inference_slots:
+            async with server.inference_slots:
+                text = await self.infer(chunk_id, samples, end - start)
+        else:
+            text = await self.infer(chunk_id, samples, end - start)
+
+        if server.chance(self.config.disconnect_rate):
+            server.stats['disconnects_injected'] += 1
+            await self.close(code=1011, message=b'Synthetic disconnect')
+            return
+        if server.chance(self.config.chunk_error_rate):
+            server.stats['chunks_failed'] += 1
+            await self.send({'type': 'error', 'message': f'Synthetic inference failure on chunk {chunk_id}'})
+            return
+        if text is None:
+            server.stats['chunks_no_speech'] += 1
+            message = {'type': 'no_speech', 'chunk_id': chunk_id}
+            if self.final_segments:
+                self.add_fixups(message, self.close_sentence())  # a pause ends the sentence
+            await self.send(message)
+            return
+
+        server.stats['chunks_transcribed'] += 1
+        message = {
+            'type': 'chunk_result',
+            'chunk_id': chunk_id,
+            'start_time': start,
+            'end_time': end,
+        }
+        if self.final_segments:
+            fixups = []
+            if random.Random(f'{self.config.seed}:{chunk_id}:break').random() < SENTENCE_BREAK_RATE:
+                fixups = self.close_sentence()
+            if not self.sentence_open:
+                text = text[:1].upper() + text[1:]
+                self.sentence_open = True
+            message['segment'] = len(self.texts)
+            self.add_fixups(message, fixups)
+        self.texts.append(text)
+        message['text'] = text
+        await self.send(message)
+
+    def close_sentence(self):
+        """End the open sentence with a full stop on its last segment; returns the fix-ups."""
+        if not self.sentence_open:
+            return []
+        self.sentence_open = False
+        self.texts[-1] += '.'
+        return [[len(self.texts) - 1, self.texts[-1]]]
+
+    @staticmethod
+    def add_fixups(message, fixups):
+        if fixups:
+            message['fixups'] = fixups
+
+    async def infer(self, chunk_id, samples, duration):
+        """Return synthetic text for a chunk, or None if it is silent."""
+        latency = self.config.latency_ms + self.config.ms_per_audio_second * duration
+        steps = self.config.partials_per_chunk + 1 if self.config.partials else 1
+        await self.server.sleep_ms(latency / steps, self.config.jitter_ms / steps)
+
+        if rms(samples) < self.config.silence_rms:
+            return None
+
+        rng = random.Random(f'{self.config.seed}:{chunk_id}')
+        count = max(1, round(duration * self.config.words_per_second))
+        start = rng.randrange(len(WORDS))
+        words = [WORDS[(start + i) % len(WORDS)] for i in range(count)]
+
+        self.last_partial = ''
+        for step in range(1, steps):
+            # A growing prefix whose last word is still a guess, as a decoder's would be
+            heard = words[:max(1, count * step // steps)]
+            await self.send_partial(chunk_id, ' '.join(heard[:-1] + [rng.choice(WORDS)]))
+            await self.server.sleep_ms(latency / steps, self.config.jitter_ms / steps)
+        return ' '.join(words)
+
+    async def send_partial(self, chunk_id, text):
+        message = {'type': 'partial', 'chunk_id': chunk_id, 'text': text}
+        if self.partial_deltas:
+            message.update(streaming_protocol.encode_partial_delta(self.last_partial, text))
+        self.last_partial = text
+        self.server.stats['partials_sent'] += 1
+        await self.send(message)
+
+    async def on_end(self):
+        self.queue.put_nowait(None)
+        if self.worker:
+            await self.worker
+
+        message = {
+            'type': 'complete',
+            'total_chunks': self.chunk_id,
+            'duration': round(self.samples_received / self.sample_rate, 2),
+        }
+        if self.final_segments:
+            # Segments were punctuated as they came: only the last one is left to fix
+            await self.server.sleep_ms(self.config.final_latency_ms)
+            message['segments'] = len(self.texts)
+            self.add_fixups(message, self.close_sentence())
+        else:
+            await self.server.sleep_ms(
+                self.config.final_latency_ms + self.config.final_ms_per_chunk * self.chunk_id
+            )
+            message['text'] = ' '.join(self.texts)
+        await self.send(message)
+        await self.stop()
+        if self.session_id is not None and (self.ws is None or self.ws.closed):
+            return  # `complete` waits in the outbox until the client resumes
+        self.reset()
+
+    async def refresh_periodically(self):
+        while True:
+            await asyncio.sleep(self.config.refresh_interval)
+            tokens = None
+            if not self.server.chance(self.config.refresh_failure_rate):
+                tokens = self.server.tokens.refresh(self.refresh_token)
+            if tokens is None:
+                await self.send({'type': 'token_refresh_failed', 'message': 'Refresh token rejected'})
+                return
+
+            self.refresh_token = tokens['refreshToken']
+            self.server.stats['tokens_refreshed'] += 1
+            await self.send({
+                'type': 'token_refreshed',
+                'id_token': tokens['idToken'],
+                'refresh_token': tokens['refreshToken'],
+                'expires_in': int(tokens['expiresIn']),
+            })
+
+
+def rms(samples):
+    """Root mean square of an Int16 sample array."""
+    if not len(samples):
+        return 0.0
+    x = samples.astype(np.float32)
+    return math.sqrt(float(np.dot(x, x)) / len(x))
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Allow the page (served from another origin) to call /login."""
+    if request.method == 'OPTIONS':
+        response = web.Response()
+    else:
+        response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = request.headers.get('Origin', '*')
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
+    return response
+
+
+def parse_args(argv=None):
+    defaults = StandinConfig()
+    parser = argparse.ArgumentParser(description='Stand-in transcription server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency-ms', type=float, default=defaults.latency_ms,
+                        help='base inference latency per chunk')
+    parser.add_argument('--jitter-ms', type=float, default=defaults.jitter_ms)
+    parser.add_argument('--ms-per-audio-second', type=float, default=defaults.ms_per_audio_second,
+                        help='extra inference latency per second of audio in the chunk')
+    parser.add_argument('--login-latency-ms', type=float, default=defaults.login_latency_ms)
+    parser.add_argument('--final-latency-ms', type=float, default=defaults.final_latency_ms,
+                        help='fixed delay between end and complete')
+    parser.add_argument('--final-ms-per-chunk', type=float, default=defaults.final_ms_per_chunk,
+                        help='extra end->complete delay per chunk in the session (without final segments)')
+    parser.add_argument('--no-partials', dest='partials', action='store_false')
+    parser.add_argument('--partials-per-chunk', type=int, default=defaults.partials_per_chunk)
+    parser.add_argument('--chunk-error-rate', type=float, default=defaults.chunk_error_rate)
+    parser.add_argument('--disconnect-rate', type=float, default=defaults.disconnect_rate)
+    parser.add_argument('--login-failure-rate', type=float, default=defaults.login_failure_rate)
+    parser.add_argument('--refresh-failure-rate', type=float, default=defaults.refresh_failure_rate)
+    parser.add_argument('--max-sessions', type=int, default=defaults.max_sessions)
+    parser.add_argument('--inference-concurrency', type=int, default=defaults.inference_concurrency,
+                        help='chunks inferred at once across all sessions')
+    parser.add_argument('--max-chunks-per-second', type=float, default=defaults.max_chunks_per_second)
+    parser.add_argument('--token-ttl', type=int, default=defaults.token_ttl)
+    parser.add_argument('--refresh-interval', type=float, default=defaults.refresh_interval,
+                        help='seconds between token_refreshed messages')
+    parser.add_argument('--accept-any-token', action='store_true')
+    parser.add_argument('--no-binary-audio', dest='binary_audio', action='store_false')
+    parser.add_argument('--no-partial-deltas', dest='partial_deltas', action='store_false',
+                        help='always send partials as full text')
+    parser.add_argument('--no-final-segments', dest='final_segments', action='store_false',
+                        help='send the whole text in complete after a final pass')
+    parser.add_argument('--credit-window', type=int, default=defaults.credit_window,
+                        help='flow-control window in chunks (0 disables credits)')
+    parser.add_argument('--resume-ttl', type=float, default=defaults.resume_ttl,
+                        help='seconds a dropped session stays resumable (0 disables resume)')
+    parser.add_argument('--codecs', default=defaults.codecs,
+                        help='comma-separated binary audio codecs to accept (pcm_s16le, mulaw, adpcm_ima)')
+    parser.add_argument('--silence-rms', type=float, default=defaults.silence_rms)
+    parser.add_argument('--seed', type=int, default=defaults.seed)
+    return parser.parse_args(argv)
+
+
+def config_from_args(args):
+    fields = StandinConfig.__dataclass_fields__
+    return StandinConfig(**{k: v for k, v in vars(args).items() if k in fields})
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    server = StandinServer(config_from_args(args))
+    print(f"🧪 Stand-in transcription server on http://{args.host}:{args.port}")
+    print(f"   • Login:     http://{args.host}:{args.port}/login")
+    print(f"   • WebSocket: ws://{args.host}:{args.port}/stream-transcription-auth")
+    web.run_app(server.create_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1841 @@
+// ============================================================
+// CONFIGURATION
+// ============================================================
+// Server-side settings are rendered into the page as JSON so this file stays static
+const APP_CONFIG = JSON.parse(document.getElementById('app-config').textContent);
+const API_BASE_URL = APP_CONFIG.apiBaseUrl;
+const LOGIN_URL = `${API_BASE_URL}/login`;
+const GATEWAY_WS_PATH = APP_CONFIG.gatewayWsPath;
+// With the gateway's token cache, login goes through /auth and the tokens stay
+// server-side behind an HttpOnly cookie; the gateway adds them to `config`.
+const AUTH_PATH = APP_CONFIG.authPath;
+const WS_URL = GATEWAY_WS_PATH
+    ? `${location.protocol === 'https:' ? 'wss:' : 'ws:'}//${location.host}${GATEWAY_WS_PATH}`
+    : APP_CONFIG.wsUrl;
+const AUDIO_WORKLET_URL = APP_CONFIG.audioWorkletUrl;
+const LANGUAGE = 'en';
+const SAMPLE_RATE = 16000;
+// The gateway resamples to the model's rate (resample.py), so behind it the page
+// captures at the device's native rate and declares that rate in `config`.
+// Browsers asked for 16 kHz often ignore it or convert on a slow, low-quality path.
+// Talking to the transcription API directly, the page still asks for SAMPLE_RATE.
+const NATIVE_RATE_CAPTURE = Boolean(GATEWAY_WS_PATH);
+const CHUNK_DURATION_MS = 500;  // initial chunk duration
+
+// Adaptive chunk duration. Each chunk's send -> chunk_result/no_speech delay is
+// smoothed like TCP's SRTT, alongside a ping/pong RTT to the server. When results
+// lag (backlog or slow link) chunks grow, so fewer, larger messages are sent;
+// when round trips are well under a chunk they shrink to cut perceived latency.
+// Every chunk carries its own length (binary header sample count, or
+// `duration_ms` on JSON messages), so server timestamps stay correct.
+const ADAPTIVE_CHUNK_DURATION = true;
+const MIN_CHUNK_DURATION_MS = 250;
+const MAX_CHUNK_DURATION_MS = 1000;
+const CHUNK_DURATION_STEP_MS = 50;
+const CHUNK_ADAPT_INTERVAL_MS = 3000;
+const PING_INTERVAL_MS = 5000;
+const CHUNK_ID_BASE = 0;
+
+// Binary audio frames: 12-byte little-endian header followed by the samples.
+//   u8  version | u8 encoding | u16 header length | u32 sequence | u32 sample count
+// Used only once the server confirms `binary_audio` in its `ready` message;
+// until then (or if it never does) chunks go out as base64 WAV inside JSON.
+const PREFER_BINARY_AUDIO = true;
+const AUDIO_FRAME_VERSION = 1;
+const AUDIO_FRAME_HEADER_BYTES = 12;
+const AUDIO_ENCODING_PCM_S16LE = 0;
+const AUDIO_ENCODING_MULAW = 1;       // G.711 μ-law, 8 bits/sample (2x smaller)
+const AUDIO_ENCODING_ADPCM_IMA = 2;   // IMA-ADPCM, 4 bits/sample (4x smaller)
+const AUDIO_ENCODINGS = {
+    pcm_s16le: AUDIO_ENCODING_PCM_S16LE,
+    mulaw: AUDIO_ENCODING_MULAW,
+    adpcm_ima: AUDIO_ENCODING_ADPCM_IMA
+};
+// Codecs offered in `config`, most preferred first; the server picks one in `ready`.
+// Use ['pcm_s16le'] to always send uncompressed PCM.
+const PREFERRED_AUDIO_CODECS = ['adpcm_ima', 'mulaw', 'pcm_s16le'];
+const ADPCM_BLOCK_HEADER_BYTES = 4;
+const IMA_INDEX_TABLE = [-1, -1, -1, -1, 2, 4, 6, 8, -1, -1, -1, -1, 2, 4, 6, 8];
+const IMA_STEP_TABLE = [
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442,
+    11487, 12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794,
+    32767
+];
+const IS_LITTLE_ENDIAN = new Uint8Array(new Uint16Array([1]).buffer)[0] === 1;
+
+// Flow control. The server grants chunk credits (`ready.flow_control.credits`,
+// then a `credit` message per chunk it finishes). Without credits, or while the
+// socket's own send buffer is above MAX_BUFFERED_BYTES, chunks wait in a bounded
+// queue instead of piling up inside the browser. When the queue is full:
+//   'coalesce' - merge adjacent queued chunks into larger messages (up to
+//                MAX_COALESCED_MS each); drop the oldest audio once none fit
+//   'spool'    - keep up to MAX_SPOOLED_MS of audio queued, then drop the oldest
+const FLOW_CONTROL = true;
+const FLOW_CONTROL_POLICY = 'coalesce';
+const MAX_QUEUED_CHUNKS = 8;
+const MAX_COALESCED_MS = 2000;
+const MAX_SPOOLED_MS = 120000;
+const MAX_BUFFERED_BYTES = 256 * 1024;
+const SEND_RETRY_MS = 50;
+
+// Resumable sessions. The server names the session in `ready` (`session_id`) and
+// every chunk carries its sequence number (binary header, or `seq` in JSON).
+// Sent chunks are kept until their chunk_result/no_speech arrives. If the socket
+// drops, the page reconnects with exponential backoff, sends `resume`, and replays
+// only the chunks from the server's `next_seq` on. Audio captured meanwhile waits
+// in the send queue. If the session can't be resumed, a fresh one is started and
+// the unanswered audio is sent again.
+const RESUME_SESSIONS = true;
+const RECONNECT_BASE_DELAY_MS = 500;
+const RECONNECT_MAX_DELAY_MS = 10000;
+const RECONNECT_MAX_ATTEMPTS = 8;
+const MAX_REPLAY_CHUNKS = 120;
+
+// Transcript and debug log rendering. A multi-hour session produces tens of
+// thousands of chunk results and log lines, so neither one grows the DOM. The
+// transcript is virtualized: only the rows in view (plus TRANSCRIPT_OVERSCAN on
+// each side) exist, placed by a table of measured row heights. The debug log is
+// a ring of DEBUG_LOG_CAPACITY line elements that are reused oldest-first. All
+// DOM writes are batched into one requestAnimationFrame callback.
+const TRANSCRIPT_OVERSCAN = 6;
+const TRANSCRIPT_ROW_ESTIMATE_PX = 80;
+const TRANSCRIPT_FOLLOW_SLACK_PX = 40;
+const DEBUG_LOG_CAPACITY = 500;
+
+// Live partial hypotheses. With PARTIAL_DELTAS the server sends each partial as
+// the number of characters it keeps from the chunk's previous hypothesis plus
+// the new tail. The newest one is shown in a row below the transcript: its
+// stable text grows in place and only the tail span is replaced.
+const PARTIAL_DELTAS = true;
+
+// Incremental final transcript. With FINAL_SEGMENTS every chunk_result is a
+// punctuated segment of the final transcript, later messages fix up earlier
+// segments in place, and `complete` only says how many segments it covers. It
+// comes right after the last chunk instead of after a pass over the session.
+const FINAL_SEGMENTS = true;
+
+// Pre-warmed start. Once the user is authenticated the page creates the
+// AudioContext (suspended until the Start click), loads the capture worklet and
+// opens an idle WebSocket. Start then asks for the microphone while `config`
+// goes out, and captured audio waits in the send queue until `ready`.
+const PREWARM = true;
+const READY_TIMEOUT_MS = 10000;
+
+// Stored transcripts. Through the gateway, `ready` names the session's
+// `transcript_id`; the page keeps the last one for this tab and, after a
+// reload, fetches /transcripts/<id> to show that transcript again.
+const TRANSCRIPT_STORAGE_KEY = 'transcriptId';
+
+// Capture ring buffer inside the AudioWorklet (in chunks) and number of
+// preallocated Int16 frames cycled between the worklet and this page.
+const CAPTURE_RING_CHUNKS = 4;
+const CAPTURE_FRAME_POOL_SIZE = 4;
+
+// Performance telemetry. While a session runs, main-thread timings of capture,
+// encoding, sending and rendering go into fixed-size buffers, flushed with
+// navigator.sendBeacon every TELEMETRY_FLUSH_MS, when a buffer fills and when
+// the tab is hidden. The app aggregates them per build and network (telemetry.py).
+const TELEMETRY_URL = APP_CONFIG.telemetryUrl;
+const TELEMETRY_FLUSH_MS = 30000;
+const TELEMETRY_MAX_SAMPLES = 256;  // per metric between flushes
+const TELEMETRY_METRICS = ['frame_lag_ms', 'frame_ms', 'encode_ms', 'buffered_bytes', 'render_ms'];
+
+// ============================================================
+// STATE
+// ============================================================
+let currentUser = null;
+let idToken = null;
+let refreshToken = null;
+let audioContext = null;
+let mediaStream = null;
+let websocket = null;
+let isRecording = false;
+let chunksProcessed = 0;
+let chunksSent = 0;
+let recordingStartTime = null;
+let captureNode = null;
+let useBinaryAudio = false;
+let audioEncoding = AUDIO_ENCODING_PCM_S16LE;
+let adpcmState = { predictor: 0, index: 0 };
+let chunkDurationMs = CHUNK_DURATION_MS;
+let chunkSentAt = new Map();
+let pingSentAt = new Map();
+let pingInterval = null;
+let pingSequence = 0;
+let smoothedResultMs = null;
+let resultVarianceMs = 0;
+let smoothedPingMs = null;
+let lastChunkAdaptTime = 0;
+let sendQueue = [];
+let queuedSamples = 0;
+let sendCredits = null;  // null until the server enables flow control
+let flushTimer = null;
+let endPending = false;
+let flowStats = { queued: 0, coalesced: 0, dropped: 0, droppedMs: 0 };
+let sessionId = null;
+let sessionComplete = false;
+let reconnecting = false;
+let reconnectAttempts = 0;
+let reconnectTimer = null;
+let unackedChunks = new Map();  // seq -> Int16Array, in send order
+let transcriptItems = [];       // { label, text } per chunk_result
+let transcriptHeights = [];     // measured (or estimated) row heights
+let transcriptOffsets = [0];    // top of each row; the last entry is the total height
+let transcriptWindow = null;    // holds the rendered rows between two padding spacers
+let transcriptRows = [];        // rendered row elements, reused while scrolling
+let transcriptRowGap = 0;
+let transcriptFollow = true;    // keep the newest result in view
+let transcriptDirty = false;
+let livePartials = new Map();   // chunk id -> { stable, tail } until its result arrives
+let liveChunkId = null;         // chunk shown in the live row
+let liveRow = null;
+let liveDirty = false;
+let segmentItems = [];          // final transcript segment -> transcript item index
+let segmentBase = 0;            // segment 0 of the current session
+let renderScheduled = false;
+let pendingLogLines = new Array(DEBUG_LOG_CAPACITY);  // ring, bounded while the tab is hidden
+let pendingLogStart = 0;
+let pendingLogCount = 0;
+let warmContext = null;         // promise of an AudioContext with the worklet loaded
+let captureRate = SAMPLE_RATE;  // rate of the audio being sent: the AudioContext's
+let warmSocket = null;          // idle WebSocket opened ahead of `config`
+let awaitingReady = false;      // session started, `ready` not yet received
+let configSent = false;         // `config` went out on the current connection
+let readyTimer = null;
+let captureSource = null;
+let startTimings = null;        // ms since the Start click, per milestone
+let tokenExpiryTime = null;
+let durationInterval = null;
+let telemetry = null;           // metric -> { values: Float64Array, count }
+let telemetryTimer = null;      // set while a session is measured
+let pendingRenderTimes = [];    // arrival times of chunk_results not yet rendered
+
+// ============================================================
+// DOM ELEMENTS
+// ============================================================
+const authSection = document.getElementById('authSection');
+const authStatus = document.getElementById('authStatus');
+const userInfo = document.getElementById('userInfo');
+const loginForm = document.getElementById('loginForm');
+const emailInput = document.getElementById('emailInput');
+const passwordInput = document.getElementById('passwordInput');
+const loginBtn = document.getElementById('loginBtn');
+const loginBtnText = document.getElementById('loginBtnText');
+const logoutBtn = document.getElementById('logoutBtn');
+const tokenInfo = document.getElementById('tokenInfo');
+const refreshStatus = document.getElementById('refreshStatus');
+const tokenExpiry = document.getElementById('tokenExpiry');
+const lastRefresh = document.getElementById('lastRefresh');
+const startBtn = document.getElementById('startBtn');
+const stopBtn = document.getElementById('stopBtn');
+const status = document.getElementById('status');
+const transcriptionBox = document.getElementById('transcriptionBox');
+const finalTranscription = document.getElementById('finalTranscription');
+const finalText = document.getElementById('finalText');
+const errorMessage = document.getElementById('errorMessage');
+const debugLog = document.getElementById('debugLog');
+
+// ============================================================
+// UTILITY FUNCTIONS
+// ============================================================
+function log(message) {
+    console.log(message);
+    const timestamp = new Date().toLocaleTimeString();
+    const line = `[${timestamp}] ${message}`;
+    
+    // Past capacity the oldest pending line is overwritten; it would scroll out anyway
+    const slot = (pendingLogStart + pendingLogCount) % DEBUG_LOG_CAPACITY;
+    pendingLogLines[slot] = line;
+    if (pendingLogCount < DEBUG_LOG_CAPACITY) {
+        pendingLogCount++;
+    } else {
+        pendingLogStart = (pendingLogStart + 1) % DEBUG_LOG_CAPACITY;
+    }
+    scheduleRender();
+}
+
+function updateStatus(message, className) {
+    status.textContent = message;
+    status.className = `status ${className}`;
+}
+
+function showError(message) {
+    errorMessage.textContent = message;
+    errorMessage.style.display = 'block';
+    log('ERROR: ' + message);
+    setTimeout(() => {
+        errorMessage.style.display = 'none';
+    }, 5000);
+}
+
+// ============================================================
+// RENDERING
+// ============================================================
+function scheduleRender() {
+    if (renderScheduled) return;
+    renderScheduled = true;
+    requestAnimationFrame(() => {
+        renderScheduled = false;
+        flushDebugLog();
+        if (transcriptDirty) {
+            transcriptDirty = false;
+            renderTranscript();
+        }
+        if (liveDirty) {
+            liveDirty = false;
+            renderLivePartial();
+        }
+        if (pendingRenderTimes.length) {
+            const now = performance.now();
+            for (const arrivedAt of pendingRenderTimes) {
+                recordTelemetry('render_ms', now - arrivedAt);
+            }
+            pendingRenderTimes.length = 0;
+        }
+    });
+}
+
+function flushDebugLog() {
+    if (pendingLogCount === 0) return;
+    for (let i = 0; i < pendingLogCount; i++) {
+        // Once the log is full, the oldest line element moves to the end
+        const lineEl = debugLog.childElementCount < DEBUG_LOG_CAPACITY
+            ? document.createElement('div')
+            : debugLog.firstElementChild;
+        lineEl.textContent = pendingLogLines[(pendingLogStart + i) % DEBUG_LOG_CAPACITY];
+        debugLog.appendChild(lineEl);
+    }
+    pendingLogLines.fill(undefined);
+    pendingLogStart = 0;
+    pendingLogCount = 0;
+    debugLog.scrollTop = debugLog.scrollHeight;
+}
+
+function resetTranscript() {
+    transcriptItems = [];
+    transcriptHeights = [];
+    transcriptOffsets = [0];
+    transcriptRows = [];
+    transcriptFollow = true;
+    transcriptionBox.textContent = '';
+    transcriptWindow = document.createElement('div');
+    liveRow = createLiveRow();
+    transcriptionBox.append(transcriptWindow, liveRow);
+    livePartials.clear();
+    liveChunkId = null;
+    segmentItems = [];
+    segmentBase = 0;
+}
+
+function updateTranscript(index, text) {
+    transcriptItems[index].text = text;
+    for (const row of transcriptRows) {
+        if (row.itemIndex === index) row.itemIndex = -1;  // rewritten on the next render
+    }
+    transcriptDirty = true;
+    scheduleRender();
+}
+
+function applyFixups(fixups) {
+    if (!fixups) return;
+    for (const [segment, text] of fixups) {
+        const index = segmentItems[segmentBase + segment];
+        if (index !== undefined) updateTranscript(index, text);
+    }
+}
+
+function finalTranscriptText(count) {
+    const parts = [];
+    for (let i = segmentBase; i < segmentBase + count; i++) {
+        const index = segmentItems[i];
+        if (index !== undefined && transcriptItems[index].text) parts.push(transcriptItems[index].text);
+    }
+    return parts.join(' ');
+}
+
+function appendTranscript(label, text) {
+    const index = transcriptItems.length;
+    transcriptItems.push({ label, text });
+    transcriptHeights.push(TRANSCRIPT_ROW_ESTIMATE_PX);
+    transcriptOffsets.push(transcriptOffsets[index] + TRANSCRIPT_ROW_ESTIMATE_PX);
+    transcriptDirty = true;
+    scheduleRender();
+}
+
+function onTranscriptScroll() {
+    if (!transcriptWindow) return;
+    const box = transcriptionBox;
+    transcriptFollow = box.scrollTop + box.clientHeight >= box.scrollHeight - TRANSCRIPT_FOLLOW_SLACK_PX;
+    transcriptDirty = true;
+    scheduleRender();
+}
+
+// Index of the row containing vertical offset `y`
+function findTranscriptRow(y) {
+    let low = 0;
+    let high = transcriptItems.length - 1;
+    while (low < high) {
+        const mid = (low + high + 1) >> 1;
+        if (transcriptOffsets[mid] <= y) {
+            low = mid;
+        } else {
+            high = mid - 1;
+        }
+    }
+    return low;
+}
+
+function createTranscriptRow() {
+    const row = document.createElement('div');
+    row.className = 'transcription-item';
+    const label = document.createElement('div');
+    label.className = 'chunk-label';
+    const text = document.createElement('div');
+    text.className = 'chunk-text';
+    row.append(label, text);
+    row.itemIndex = -1;
+    return row;
+}
+
+function renderTranscript() {
+    const box = transcriptionBox;
+    const count = transcriptItems.length;
+    if (!transcriptWindow || count === 0) return;
+    
+    const total = transcriptOffsets[count];
+    const viewTop = transcriptFollow ? Math.max(0, total - box.clientHeight) : box.scrollTop;
+    const first = Math.max(0, findTranscriptRow(viewTop) - TRANSCRIPT_OVERSCAN);
+    const end = Math.min(count, findTranscriptRow(viewTop + box.clientHeight) + 1 + TRANSCRIPT_OVERSCAN);
+    
+    while (transcriptRows.length < end - first) {
+        const row = createTranscriptRow();
+        transcriptWindow.appendChild(row);
+        transcriptRows.push(row);
+    }
+    while (transcriptRows.length > end - first) {
+        transcriptRows.pop().remove();
+    }
+    for (let k = 0; k < transcriptRows.length; k++) {
+        const row = transcriptRows[k];
+        const index = first + k;
+        if (row.itemIndex === index) continue;
+        row.itemIndex = index;
+        row.firstChild.textContent = transcriptItems[index].label;
+        row.lastChild.textContent = transcriptItems[index].text;
+    }
+    
+    // Measure what was rendered; rows above and below keep their last known height
+    if (transcriptRows.length && !transcriptRowGap) {
+        transcriptRowGap = parseFloat(getComputedStyle(transcriptRows[0]).marginBottom) || 0;
+    }
+    let changedFrom = count;
+    for (let k = 0; k < transcriptRows.length; k++) {
+        const height = transcriptRows[k].offsetHeight + transcriptRowGap;
+        if (height !== transcriptHeights[first + k]) {
+            transcriptHeights[first + k] = height;
+            changedFrom = Math.min(changedFrom, first + k);
+        }
+    }
+    for (let i = changedFrom; i < count; i++) {
+        transcriptOffsets[i + 1] = transcriptOffsets[i] + transcriptHeights[i];
+    }
+    
+    transcriptWindow.style.paddingTop = `${transcriptOffsets[first]}px`;
+    transcriptWindow.style.paddingBottom = `${transcriptOffsets[count] - transcriptOffsets[end]}px`;
+    if (transcriptFollow) {
+        box.scrollTop = box.scrollHeight;
+    }
+}
+
+function commonPrefixLength(a, b) {
+    const limit = Math.min(a.length, b.length);
+    let i = 0;
+    while (i < limit && a.charCodeAt(i) === b.charCodeAt(i)) i++;
+    return i;
+}
+
+function createLiveRow() {
+    const row = createTranscriptRow();
+    row.classList.add('live-partial');
+    row.hidden = true;
+    row.chunkId = null;
+    row.stableText = document.createTextNode('');
+    row.tailText = document.createTextNode('');
+    const tail = document.createElement('span');
+    tail.className = 'partial-tail';
+    tail.appendChild(row.tailText);
+    row.lastChild.append(row.stableText, tail);
+    return row;
+}
+
+function onPartial(data) {
+    const previous = livePartials.get(data.chunk_id);
+    const full = previous ? previous.stable + previous.tail : '';
+    let stable, tail;
+    if ('stable' in data) {
+        stable = Math.min(full.length, data.stable);
+        tail = data.text;
+    } else {
+        // A full-text partial keeps what it shares with the last one
+        stable = commonPrefixLength(full, data.text);
+        tail = data.text.substring(stable);
+    }
+    livePartials.set(data.chunk_id, { stable: full.substring(0, stable), tail });
+    liveChunkId = data.chunk_id;
+    liveDirty = true;
+    scheduleRender();
+}
+
+function dropLivePartial(chunkId) {
+    if (livePartials.delete(chunkId) && chunkId === liveChunkId) {
+        liveDirty = true;
+        scheduleRender();
+    }
+}
+
+function renderLivePartial() {
+    if (!liveRow) return;
+    const current = livePartials.get(liveChunkId);
+    liveRow.hidden = !current;
+    if (!current) return;
+    
+    if (liveRow.chunkId !== liveChunkId) {
+        liveRow.chunkId = liveChunkId;
+        liveRow.firstChild.textContent = `Chunk ${liveChunkId} (live)`;
+        liveRow.stableText.data = '';
+    }
+    // Usually the stable text only grows; trim it first when a revision reached into it
+    const shown = liveRow.stableText.data;
+    const kept = commonPrefixLength(shown, current.stable);
+    if (kept < shown.length) {
+        liveRow.stableText.deleteData(kept, shown.length - kept);
+    }
+    if (kept < current.stable.length) {
+        liveRow.stableText.appendData(current.stable.substring(kept));
+    }
+    if (liveRow.tailText.data !== current.tail) {
+        liveRow.tailText.data = current.tail;
+    }
+    if (transcriptFollow) {
+        transcriptionBox.scrollTop = transcriptionBox.scrollHeight;
+    }
+}
+
+transcriptionBox.addEventListener('scroll', onTranscriptScroll, { passive: true });
+
+// ============================================================
+// TELEMETRY
+// ============================================================
+function startTelemetry() {
+    if (!TELEMETRY_URL || !navigator.sendBeacon || telemetryTimer) return;
+    if (!telemetry) {
+        telemetry = {};
+        for (const name of TELEMETRY_METRICS) {
+            telemetry[name] = { values: new Float64Array(TELEMETRY_MAX_SAMPLES), count: 0 };
+        }
+    }
+    telemetryTimer = setInterval(flushTelemetry, TELEMETRY_FLUSH_MS);
+}
+
+function stopTelemetry() {
+    if (!telemetryTimer) return;
+    clearInterval(telemetryTimer);
+    telemetryTimer = null;
+    flushTelemetry();
+}
+
+function recordTelemetry(name, value) {
+    if (!telemetryTimer) return;
+    const metric = telemetry[name];
+    if (metric.count === TELEMETRY_MAX_SAMPLES) {
+        flushTelemetry();
+    }
+    metric.values[metric.count++] = value;
+}
+
+function flushTelemetry() {
+    if (!telemetry) return;
+    const samples = {};
+    let total = 0;
+    for (const name of TELEMETRY_METRICS) {
+        const metric = telemetry[name];
+        if (metric.count === 0) continue;
+        samples[name] = Array.from(metric.values.subarray(0, metric.count), v => Math.round(v * 100) / 100);
+        total += metric.count;
+        metric.count = 0;
+    }
+    if (total === 0) return;
+    const body = JSON.stringify({ build: APP_CONFIG.build, samples: samples });
+    navigator.sendBeacon(TELEMETRY_URL, new Blob([body], { type: 'application/json' }));
+}
+
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') flushTelemetry();
+});
+
+// ============================================================
+// AUTHENTICATION
+// ============================================================
+
+// Check for stored tokens on page load
+window.addEventListener('load', () => {
+    if (AUTH_PATH) {
+        restoreServerSession();
+        return;
+    }
+    const storedIdToken = localStorage.getItem('idToken');
+    const storedRefreshToken = localStorage.getItem('refreshToken');
+    const storedUser = localStorage.getItem('userInfo');
+    
+    if (storedIdToken && storedRefreshToken && storedUser) {
+        idToken = storedIdToken;
+        refreshToken = storedRefreshToken;
+        currentUser = JSON.parse(storedUser);
+        onUserAuthenticated();
+        log('✅ Restored session from localStorage');
+    }
+});
+
+async function restoreServerSession() {
+    try {
+        const response = await fetch(`${AUTH_PATH}/session`, { credentials: 'same-origin' });
+        if (!response.ok) return;
+        const data = await response.json();
+        currentUser = data.user;
+        onUserAuthenticated();
+        log('✅ Restored server-side session');
+    } catch (error) {
+        log('⚠️ Could not check the server session: ' + error.message);
+    }
+}
+
+// Show the tab's last stored transcript again after a reload
+async function restoreTranscript() {
+    const transcriptId = sessionStorage.getItem(TRANSCRIPT_STORAGE_KEY);
+    if (!transcriptId || !GATEWAY_WS_PATH || isRecording || transcriptItems.length) return;
+    try {
+        const response = await fetch(`/transcripts/${encodeURIComponent(transcriptId)}`, { credentials: 'same-origin' });
+        if (!response.ok) {
+            if (response.status === 404) sessionStorage.removeItem(TRANSCRIPT_STORAGE_KEY);
+            return;
+        }
+        const data = await response.json();
+        if (isRecording || transcriptItems.length) return;  // a recording started meanwhile
+        resetTranscript();
+        for (const chunk of data.chunks) {
+            appendTranscript(
+                `Chunk ${chunk.chunk_id} (${chunk.start_time.toFixed(1)}s - ${chunk.end_time.toFixed(1)}s)`,
+                chunk.text
+            );
+        }
+        if (data.complete) {
+            finalTranscription.style.display = 'block';
+            finalText.textContent = data.complete.text;
+        }
+        log(`📜 Restored stored transcript (${data.chunks.length} chunks)`);
+    } catch (error) {
+        log('⚠️ Could not load the stored transcript: ' + error.message);
+    }
+}
+
+function onUserAuthenticated() {
+    log('✅ User authenticated: ' + currentUser.email);
+    
+    authSection.className = 'auth-section authenticated';
+    authStatus.textContent = '✅ Authenticated';
+    userInfo.innerHTML = `
+        <div><strong>${currentUser.displayName || 'User'}</strong></div>
+        <div>${currentUser.email}</div>
+    `;
+    userInfo.style.display = 'block';
+    loginForm.style.display = 'none';
+    logoutBtn.style.display = 'block';
+    
+    startBtn.disabled = false;
+    updateStatus('Ready to start recording', 'idle');
+    
+    // Show token info
+    tokenInfo.classList.remove('hidden');
+    lastRefresh.textContent = 'Last refresh: Just logged in';
+    
+    prewarm();
+    restoreTranscript();
+    
+    // Calculate token expiry
+    if (currentUser.expiresIn) {
+        const expiryDate = new Date(currentUser.expiresIn);
+        tokenExpiry.textContent = `Token expires: ${expiryDate.toLocaleTimeString()}`;
+    }
+}
+
+function onUserLoggedOut() {
+    log('🔓 User logged out');
+    
+    if (AUTH_PATH) {
+        fetch(`${AUTH_PATH}/logout`, { method: 'POST', credentials: 'same-origin' })
+            .catch(error => log('⚠️ Logout request failed: ' + error.message));
+    }
+    
+    stopTelemetry();
+    
+    // Clear stored data
+    sessionStorage.removeItem(TRANSCRIPT_STORAGE_KEY);
+    localStorage.removeItem('idToken');
+    localStorage.removeItem('refreshToken');
+    localStorage.removeItem('userInfo');
+    
+    currentUser = null;
+    idToken = null;
+    refreshToken = null;
+    
+    authSection.className = 'auth-section';
+    authStatus.textContent = '🔒 Not Authenticated';
+    userInfo.style.display = 'none';
+    loginForm.style.display = 'flex';
+    logoutBtn.style.display = 'none';
+    
+    startBtn.disabled = true;
+    stopBtn.disabled = true;
+    updateStatus('Please login to start recording', 'idle');
+    
+    tokenInfo.classList.add('hidden');
+    
+    // Stop recording if active
+    if (isRecording) {
+        stopRecording();
+    }
+    releasePrewarm();
+}
+
+// Login handler
+loginForm.addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const email = emailInput.value;
+    const password = passwordInput.value;
+    
+    try {
+        log('🔐 Attempting login...');
+        loginBtn.disabled = true;
+        loginBtnText.innerHTML = '<div class="spinner"></div> Logging in...';
+        
+        const response = await fetch(AUTH_PATH ? `${AUTH_PATH}/login` : LOGIN_URL, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                email: email,
+                password: password
+            })
+        });
+        
+        if (!response.ok) {
+            const errorData = await response.json();
+            throw new Error(errorData.detail || 'Login failed');
+        }
+        
+        const data = await response.json();
+        log('✅ Login successful');
+        
+        if (AUTH_PATH) {
+            // Tokens stay in the gateway's cache; only the user profile comes back
+            currentUser = data.user;
+            passwordInput.value = '';
+            onUserAuthenticated();
+            return;
+        }
+        log('Response: ' + JSON.stringify(data).substring(0, 100) + '...');
+        
+        // Extract tokens from response
+        // Based on your API response structure:
+        // { "access_token": { "idToken": "...", "refreshToken": "...", ... } }
+        const accessToken = data.access_token;
+        
+        idToken = accessToken.idToken;
+        refreshToken = accessToken.refreshToken;
+        
+        currentUser = {
+            email: accessToken.email,
+            displayName: accessToken.displayName,
+            localId: accessToken.localId,
+            expiresIn: accessToken.expiresIn
+        };
+        
+        // Store in localStorage
+        localStorage.setItem('idToken', idToken);
+        localStorage.setItem('refreshToken', refreshToken);
+        localStorage.setItem('userInfo', JSON.stringify(currentUser));
+        
+        passwordInput.value = '';
+        onUserAuthenticated();
+        
+    } catch (error) {
+        log('❌ Login failed: ' + error.message);
+        showError('Login failed: ' + error.message);
+    } finally {
+        loginBtn.disabled = false;
+        loginBtnText.textContent = '🔑 Login';
+    }
+});
+
+// Logout handler
+logoutBtn.addEventListener('click', () => {
+    onUserLoggedOut();
+});
+
+// ============================================================
+// TOKEN MANAGEMENT
+// ============================================================
+function isAuthenticated() {
+    return currentUser !== null && (AUTH_PATH || (idToken && refreshToken));
+}
+
+function getTokens() {
+    if (AUTH_PATH) {
+        return {};  // the gateway fills in the cached tokens
+    }
+    if (!idToken || !refreshToken) {
+        throw new Error('No tokens available. Please login.');
+    }
+    return { idToken, refreshToken };
+}
+
+function updateTokenExpiry(expiresIn) {
+    tokenExpiryTime = new Date(Date.now() + expiresIn * 1000);
+    tokenExpiry.textContent = `Token expires: ${tokenExpiryTime.toLocaleTimeString()}`;
+}
+
+function handleTokenRefresh(data) {
+    log('🔄 Token automatically refreshed by server!');
+    
+    // Update stored tokens (with AUTH_PATH the gateway's cache keeps them)
+    if (!AUTH_PATH) {
+        idToken = data.id_token;
+        refreshToken = data.refresh_token;
+        
+        localStorage.setItem('idToken', idToken);
+        localStorage.setItem('refreshToken', refreshToken);
+    }
+    
+    // Update UI
+    refreshStatus.textContent = 'Active';
+    refreshStatus.style.color = '#10b981';
+    lastRefresh.textContent = `Last refresh: ${new Date().toLocaleTimeString()}`;
+    
+    if (data.expires_in) {
+        updateTokenExpiry(data.expires_in);
+    }
+}
+
+// ============================================================
+// RECORDING FUNCTIONS
+// ============================================================
+startBtn.addEventListener('click', startRecording);
+stopBtn.addEventListener('click', stopRecording);
+
+async function startRecording() {
+    try {
+        if (!isAuthenticated()) {
+            showError('Please login first');
+            return;
+        }
+        
+        startTimings = { start: performance.now() };
+        isRecording = true;
+        startBtn.disabled = true;
+        stopBtn.disabled = false;
+        log('🎤 Requesting microphone access...');
+        
+        useBinaryAudio = false;
+        audioEncoding = AUDIO_ENCODING_PCM_S16LE;
+        adpcmState = { predictor: 0, index: 0 };
+        chunksSent = 0;
+        chunksProcessed = 0;
+        resetChunkTiming();
+        resetSendQueue();
+        resetSession();
+        resetTranscript();
+        startTelemetry();
+        finalTranscription.style.display = 'none';
+        document.getElementById('firstResult').textContent = '-';
+        
+        // Connection, microphone and audio graph come up in parallel
+        awaitingReady = true;
+        configSent = false;
+        readyTimer = setTimeout(onReadyTimeout, READY_TIMEOUT_MS);
+        openWebSocket(sendConfigForCapture, takeWarmSocket());
+        const audioConstraints = {
+            channelCount: 1,
+            echoCancellation: true,
+            noiseSuppression: true,
+            autoGainControl: true
+        };
+        if (!NATIVE_RATE_CAPTURE) audioConstraints.sampleRate = SAMPLE_RATE;
+        const [stream, context] = await Promise.all([
+            navigator.mediaDevices.getUserMedia({ audio: audioConstraints }),
+            prewarmAudio()
+        ]);
+        if (!isRecording) {
+            // Stopped (or failed) while the permission prompt was open
+            stream.getTracks().forEach(track => track.stop());
+            return;
+        }
+        mediaStream = stream;
+        audioContext = context;
+        markStartTiming('mic');
+        log(`✅ Microphone access granted (${Math.round(startTimings.mic)}ms)`);
+        
+        // Allowed now: we are inside the Start click's user activation
+        await audioContext.resume();
+        log(`🎵 Audio context running (${audioContext.sampleRate}Hz` +
+            (NATIVE_RATE_CAPTURE && audioContext.sampleRate !== SAMPLE_RATE
+                ? `, resampled to ${SAMPLE_RATE}Hz by the gateway)` : ')'));
+        
+        // Capture starts here; chunks before `ready` wait in the send queue
+        captureNode = createCaptureNode(audioContext);
+        captureSource = audioContext.createMediaStreamSource(mediaStream);
+        captureSource.connect(captureNode);
+        captureNode.connect(audioContext.destination);
+        
+        recordingStartTime = Date.now();
+        updateStatus('🔴 Recording... Speak now!', 'recording');
+        log('🎙️ Recording started');
+        
+        // Update duration
+        durationInterval = setInterval(() => {
+            if (isRecording) {
+                const duration = Math.floor((Date.now() - recordingStartTime) / 1000);
+                document.getElementById('duration').textContent = duration + 's';
+            }
+        }, 1000);
+        
+    } catch (error) {
+        log('❌ Error starting recording: ' + error.message);
+        showError('Could not start recording: ' + error.message);
+        if (isRecording) stopRecording();
+    }
+}
+
+function onReadyTimeout() {
+    readyTimer = null;
+    if (!awaitingReady || !isRecording) return;
+    showError('The transcription service did not answer. Please try again.');
+    abandonSession();
+    stopRecording();
+}
+
+// ============================================================
+// PRE-WARMED START
+// ============================================================
+function prewarm() {
+    if (!PREWARM) return;
+    prewarmAudio().catch(error => log('⚠️ Audio pre-warm failed: ' + error.message));
+    prewarmSocket();
+}
+
+// AudioContext with the capture worklet loaded. Created outside a user gesture
+// it starts suspended; startRecording resumes it.
+function prewarmAudio() {
+    if (!warmContext) {
+        const context = new (window.AudioContext || window.webkitAudioContext)(
+            NATIVE_RATE_CAPTURE ? {} : { sampleRate: SAMPLE_RATE }
+        );
+        if (!context.audioWorklet) {
+            context.close();
+            return Promise.reject(new Error('AudioWorklet is not supported in this browser'));
+        }
+        warmContext = context.audioWorklet.addModule(AUDIO_WORKLET_URL).then(() => context);
+        warmContext.catch(() => {
+            warmContext = null;
+            context.close();
+        });
+    }
+    return warmContext;
+}
+
+function prewarmSocket() {
+    if (!PREWARM || warmSocket || !isAuthenticated()) return;
+    const socket = new WebSocket(WS_URL);
+    socket.binaryType = 'arraybuffer';
+    socket.onclose = () => {
+        if (warmSocket === socket) warmSocket = null;
+    };
+    socket.onerror = () => {};
+    warmSocket = socket;
+}
+
+function takeWarmSocket() {
+    const socket = warmSocket;
+    warmSocket = null;
+    if (socket && socket.readyState <= WebSocket.OPEN) {
+        return socket;
+    }
+    return null;
+}
+
+function releasePrewarm() {
+    if (warmSocket) {
+        warmSocket.close();
+        warmSocket = null;
+    }
+    if (warmContext) {
+        warmContext.then(context => context.close()).catch(() => {});
+        warmContext = null;
+    }
+}
+
+function markStartTiming(name) {
+    if (!startTimings || startTimings[name] !== undefined) return;
+    startTimings[name] = performance.now() - startTimings.start;
+    if (name === 'firstResult') {
+        const t = startTimings;
+        const ms = (value) => value === undefined ? '-' : `${Math.round(value)}ms`;
+        document.getElementById('firstResult').textContent = ms(t.firstResult);
+        log(`⏱️ Start path: mic ${ms(t.mic)}, first sample ${ms(t.firstSample)}, socket open ${ms(t.open)}, ` +
+            `ready ${ms(t.ready)}, first chunk sent ${ms(t.firstChunk)}, first result ${ms(t.firstResult)}`);
+    }
+}
+
+// ============================================================
+// CONNECTION / RESUME
+// ============================================================
+// `socket` is a pre-warmed connection to use instead of opening a new one
+function openWebSocket(onOpen, socket = null) {
+    closeWebSocket();
+    websocket = socket || new WebSocket(WS_URL);
+    websocket.binaryType = 'arraybuffer';
+    
+    websocket.onopen = () => {
+        log('✅ WebSocket connected');
+        markStartTiming('open');
+        onOpen();
+    };
+    
+    websocket.onmessage = (event) => {
+        if (typeof event.data !== 'string') {
+            log('⚠️ Ignoring unexpected binary message from server');
+            return;
+        }
+        const data = JSON.parse(event.data);
+        handleWebSocketMessage(data);
+    };
+    
+    websocket.onerror = (error) => {
+        log('❌ WebSocket error: ' + error);
+    };
+    
+    websocket.onclose = () => {
+        log('🔌 WebSocket disconnected');
+        onWebSocketClosed();
+    };
+    
+    if (websocket.readyState === WebSocket.OPEN) {
+        log('✅ Using pre-warmed WebSocket');
+        markStartTiming('open');
+        onOpen();
+    }
+}
+
+// Detached first, so a connection we are done with can't reconnect or stop
+// whatever session comes next
+function closeWebSocket() {
+    if (!websocket) return;
+    websocket.onopen = websocket.onmessage = websocket.onerror = websocket.onclose = null;
+    if (websocket.readyState <= WebSocket.OPEN) websocket.close();
+    websocket = null;
+}
+
+// Stop arrived before there was a session to end: drop the connection and
+// whatever audio was waiting for `ready`
+function abandonSession() {
+    closeWebSocket();
+    resetSendQueue();
+    awaitingReady = false;
+    stopTelemetry();
+    prewarmSocket();
+    log('🔌 Session abandoned before it started');
+}
+
+// `config` declares the capture rate, known once the AudioContext exists
+function sendConfigForCapture() {
+    prewarmAudio().then(context => {
+        captureRate = context.sampleRate;
+        if (isRecording && websocket && websocket.readyState === WebSocket.OPEN) sendConfig();
+    }, () => {});  // startRecording reports the failure
+}
+
+function audioFormat() {
+    return {
+        encoding: 'pcm_s16le',
+        sample_rate: captureRate,
+        channels: 1,
+        frame_version: AUDIO_FRAME_VERSION,
+        codecs: PREFERRED_AUDIO_CODECS
+    };
+}
+
+function sendConfig() {
+    const tokens = getTokens();
+    configSent = true;
+    
+    // Send config with authentication tokens
+    websocket.send(JSON.stringify({
+        type: 'config',
+        language: LANGUAGE,
+        id_token: tokens.idToken,
+        refresh_token: tokens.refreshToken,  // Enable auto-refresh!
+        binary_audio: PREFER_BINARY_AUDIO,
+        partial_deltas: PARTIAL_DELTAS,
+        final_segments: FINAL_SEGMENTS,
+        flow_control: FLOW_CONTROL,
+        resumable: RESUME_SESSIONS,
+        chunk_duration_ms: chunkDurationMs,
+        adaptive_chunk_duration: ADAPTIVE_CHUNK_DURATION
+            ? { min_ms: MIN_CHUNK_DURATION_MS, max_ms: MAX_CHUNK_DURATION_MS }
+            : null,
+        audio_format: audioFormat()
+    }));
+    
+    log('📤 Sent config with auth tokens (auto-refresh enabled)');
+}
+
+function resetSession() {
+    sessionId = null;
+    sessionComplete = false;
+    reconnecting = false;
+    reconnectAttempts = 0;
+    unackedChunks.clear();
+    if (reconnectTimer) {
+        clearTimeout(reconnectTimer);
+        reconnectTimer = null;
+    }
+}
+
+function onWebSocketClosed() {
+    if (RESUME_SESSIONS && sessionId && !sessionComplete) {
+        scheduleReconnect();
+    } else if (isRecording) {
+        showError('WebSocket connection error. Make sure the server is running.');
+        stopRecording();
+    }
+}
+
+function scheduleReconnect() {
+    reconnecting = true;
+    if (reconnectAttempts >= RECONNECT_MAX_ATTEMPTS) {
+        log('❌ Could not reconnect, giving up on the session');
+        showError('Connection lost. Please start a new recording.');
+        sessionId = null;
+        reconnecting = false;
+        if (isRecording) stopRecording();
+        return;
+    }
+    
+    const backoff = Math.min(RECONNECT_MAX_DELAY_MS, RECONNECT_BASE_DELAY_MS * 2 ** reconnectAttempts);
+    const delay = Math.round(backoff * (0.8 + Math.random() * 0.4));
+    reconnectAttempts++;
+    log(`🔁 Reconnecting in ${delay}ms (attempt ${reconnectAttempts}/${RECONNECT_MAX_ATTEMPTS})`);
+    reconnectTimer = setTimeout(() => {
+        reconnectTimer = null;
+        openWebSocket(sendResume);
+    }, delay);
+}
+
+function sendResume() {
+    const tokens = getTokens();
+    websocket.send(JSON.stringify({
+        type: 'resume',
+        session_id: sessionId,
+        id_token: tokens.idToken,
+        refresh_token: tokens.refreshToken,
+        partial_deltas: PARTIAL_DELTAS,
+        audio_format: audioFormat()  // lets the gateway resample a resumed passthrough session
+    }));
+    log(`📤 Resuming session ${sessionId}`);
+}
+
+function onResumed(data) {
+    reconnecting = false;
+    reconnectAttempts = 0;
+    
+    // Chunks below next_seq reached the server; their results come on their own
+    let replayed = 0;
+    for (const [seq, pcm] of unackedChunks) {
+        if (seq >= data.next_seq) {
+            transmitAudioChunk(pcm, seq);
+            replayed++;
+        }
+    }
+    log(`🔗 Session resumed, replayed ${replayed} chunks from #${data.next_seq}`);
+    flushAudioQueue();
+}
+
+function onResumeFailed(data) {
+    log(`⚠️ Could not resume session (${data.message}), starting a new one`);
+    
+    // Unanswered audio goes out again at the front of the new session
+    const pending = Array.from(unackedChunks.values());
+    sendQueue = pending.concat(sendQueue);
+    queuedSamples = sendQueue.reduce((total, pcm) => total + pcm.length, 0);
+    unackedChunks.clear();
+    chunkSentAt.clear();
+    chunksSent = 0;
+    sendCredits = null;
+    sessionId = null;
+    reconnecting = false;
+    reconnectAttempts = 0;
+    awaitingReady = true;
+    sendConfig();
+}
+
+function rememberForReplay(seq, pcmData) {
+    if (!RESUME_SESSIONS) return;
+    // The worklet reuses its buffers, so replayable audio is copied
+    unackedChunks.set(seq, pcmData.slice());
+    if (unackedChunks.size > MAX_REPLAY_CHUNKS) {
+        unackedChunks.delete(unackedChunks.keys().next().value);
+    }
+}
+
+// `context` already has the worklet module loaded (prewarmAudio)
+function createCaptureNode(context) {
+    const frameSamples = Math.round((chunkDurationMs / 1000) * context.sampleRate);
+    const maxFrameSamples = Math.round((MAX_CHUNK_DURATION_MS / 1000) * context.sampleRate);
+    const node = new AudioWorkletNode(context, 'audio-capture-processor', {
+        numberOfInputs: 1,
+        numberOfOutputs: 1,
+        outputChannelCount: [1],
+        processorOptions: {
+            frameSamples: frameSamples,
+            maxFrameSamples: maxFrameSamples,
+            ringSamples: maxFrameSamples * CAPTURE_RING_CHUNKS,
+            poolSize: CAPTURE_FRAME_POOL_SIZE
+        }
+    });
+    
+    node.port.onmessage = (event) => {
+        const message = event.data;
+        if (message.type === 'frame') {
+            if (isRecording) {
+                const handledAt = performance.now();
+                // How long the finished frame waited for the main thread
+                recordTelemetry('frame_lag_ms', Math.max(0, (context.currentTime - message.time) * 1000));
+                sendAudioChunk(message.samples);
+                recordTelemetry('frame_ms', performance.now() - handledAt);
+            }
+            // Hand the buffer back so the worklet never allocates per chunk
+            node.port.postMessage({ type: 'recycle', buffer: message.samples.buffer }, [message.samples.buffer]);
+        } else if (message.type === 'started') {
+            markStartTiming('firstSample');
+        } else if (message.type === 'overflow') {
+            log(`⚠️ Capture ring buffer overflow, ${message.dropped} samples dropped`);
+        }
+    };
+    
+    log(`🧩 Capture worklet ready (${frameSamples} samples per chunk)`);
+    document.getElementById('chunkSize').textContent = chunkDurationMs + 'ms';
+    return node;
+}
+
+// ============================================================
+// ADAPTIVE CHUNK DURATION
+// ============================================================
+function resetChunkTiming() {
+    chunkDurationMs = CHUNK_DURATION_MS;
+    chunkSentAt.clear();
+    pingSentAt.clear();
+    smoothedResultMs = null;
+    resultVarianceMs = 0;
+    smoothedPingMs = null;
+    lastChunkAdaptTime = performance.now();
+    if (pingInterval) {
+        clearInterval(pingInterval);
+        pingInterval = null;
+    }
+}
+
+function startPinging() {
+    if (pingInterval) return;
+    pingInterval = setInterval(() => {
+        if (!websocket || websocket.readyState !== WebSocket.OPEN) return;
+        const id = pingSequence++;
+        pingSentAt.set(id, performance.now());
+        websocket.send(JSON.stringify({ type: 'ping', id: id }));
+    }, PING_INTERVAL_MS);
+}
+
+function onPong(data) {
+    const sentAt = pingSentAt.get(data.id);
+    if (sentAt === undefined) return;
+    pingSentAt.delete(data.id);
+    const rtt = performance.now() - sentAt;
+    smoothedPingMs = smoothedPingMs === null ? rtt : smoothedPingMs + (rtt - smoothedPingMs) / 8;
+}
+
+function onChunkAnswered(chunkId) {
+    unackedChunks.delete(chunkId - CHUNK_ID_BASE);
+    const sentAt = chunkSentAt.get(chunkId);
+    if (sentAt === undefined) return;
+    chunkSentAt.delete(chunkId);
+    
+    const sample = performance.now() - sentAt;
+    if (smoothedResultMs === null) {
+        smoothedResultMs = sample;
+        resultVarianceMs = sample / 2;
+    } else {
+        resultVarianceMs += (Math.abs(sample - smoothedResultMs) - resultVarianceMs) / 4;
+        smoothedResultMs += (sample - smoothedResultMs) / 8;
+    }
+    adaptChunkDuration();
+}
+
+function adaptChunkDuration() {
+    if (!ADAPTIVE_CHUNK_DURATION || !captureNode || smoothedResultMs === null) return;
+    const now = performance.now();
+    if (now - lastChunkAdaptTime < CHUNK_ADAPT_INTERVAL_MS) return;
+    lastChunkAdaptTime = now;
+    
+    const inFlight = chunkSentAt.size + sendQueue.length;
+    const pingMs = smoothedPingMs === null ? 0 : smoothedPingMs;
+    let next = chunkDurationMs;
+    if (smoothedResultMs > 2 * chunkDurationMs || inFlight > 2 || pingMs > chunkDurationMs) {
+        // Results are falling behind the audio: send fewer, larger chunks
+        next = chunkDurationMs * 1.5;
+    } else if (smoothedResultMs + 2 * resultVarianceMs < chunkDurationMs / 2
+               && inFlight <= 1 && pingMs < chunkDurationMs / 4) {
+        // Round trips are short: smaller chunks get text back sooner
+        next = chunkDurationMs * 0.75;
+    }
+    
+    next = Math.round(next / CHUNK_DURATION_STEP_MS) * CHUNK_DURATION_STEP_MS;
+    next = Math.max(MIN_CHUNK_DURATION_MS, Math.min(MAX_CHUNK_DURATION_MS, next));
+    if (next === chunkDurationMs) return;
+    
+    log(`⏱️ Chunk duration ${chunkDurationMs}ms → ${next}ms (result ${Math.round(smoothedResultMs)}ms, ping ${Math.round(pingMs)}ms, ${inFlight} in flight)`);
+    chunkDurationMs = next;
+    captureNode.port.postMessage({
+        type: 'frame_samples',
+        frameSamples: Math.round((next / 1000) * audioContext.sampleRate)
+    });
+    document.getElementById('chunkSize').textContent = next + 'ms';
+}
+
+function sendAudioChunk(pcmData) {
+    if (reconnecting || awaitingReady) {
+        // Keep capturing until the session is ready or resumed; the queue drains then
+        flowStats.queued++;
+        enqueueAudioChunk(pcmData.slice());
+        updateFlowStats();
+        return;
+    }
+    if (!websocket || websocket.readyState !== WebSocket.OPEN) {
+        log('⚠️ WebSocket not ready, skipping chunk');
+        return;
+    }
+    
+    if (sendQueue.length === 0 && canTransmit()) {
+        transmitAudioChunk(pcmData);
+        return;
+    }
+    // The worklet reuses this buffer as soon as we return, so queued audio is copied
+    flowStats.queued++;
+    enqueueAudioChunk(pcmData.slice());
+    flushAudioQueue();
+}
+
+// ============================================================
+// SEND QUEUE / FLOW CONTROL
+// ============================================================
+function resetSendQueue() {
+    sendQueue = [];
+    queuedSamples = 0;
+    sendCredits = null;
+    endPending = false;
+    flowStats = { queued: 0, coalesced: 0, dropped: 0, droppedMs: 0 };
+    if (flushTimer) {
+        clearTimeout(flushTimer);
+        flushTimer = null;
+    }
+    updateFlowStats();
+}
+
+function canTransmit() {
+    if (reconnecting || awaitingReady) return false;
+    if (websocket.bufferedAmount > MAX_BUFFERED_BYTES) return false;
+    return sendCredits === null || sendCredits > 0;
+}
+
+function enqueueAudioChunk(pcm) {
+    sendQueue.push(pcm);
+    queuedSamples += pcm.length;
+    
+    if (FLOW_CONTROL_POLICY === 'spool') {
+        const maxSamples = captureRate * MAX_SPOOLED_MS / 1000;
+        while (queuedSamples > maxSamples && sendQueue.length > 1) {
+            dropOldestChunk();
+        }
+    } else {
+        while (sendQueue.length > MAX_QUEUED_CHUNKS) {
+            if (!coalesceQueuedChunks()) {
+                dropOldestChunk();
+            }
+        }
+    }
+}
+
+function coalesceQueuedChunks() {
+    const maxSamples = captureRate * MAX_COALESCED_MS / 1000;
+    for (let i = 0; i + 1 < sendQueue.length; i++) {
+        const first = sendQueue[i];
+        const second = sendQueue[i + 1];
+        if (first.length + second.length <= maxSamples) {
+            const merged = new Int16Array(first.length + second.length);
+            merged.set(first);
+            merged.set(second, first.length);
+            sendQueue.splice(i, 2, merged);
+            flowStats.coalesced++;
+            return true;
+        }
+    }
+    return false;
+}
+
+function dropOldestChunk() {
+    const dropped = sendQueue.shift();
+    queuedSamples -= dropped.length;
+    const droppedMs = Math.round(dropped.length * 1000 / captureRate);
+    flowStats.dropped++;
+    flowStats.droppedMs += droppedMs;
+    log(`⚠️ Send queue full, dropped ${droppedMs}ms of the oldest audio`);
+}
+
+function flushAudioQueue() {
+    if (flushTimer) {
+        clearTimeout(flushTimer);
+        flushTimer = null;
+    }
+    if (!websocket || websocket.readyState !== WebSocket.OPEN || reconnecting) return;
+    
+    while (sendQueue.length > 0 && canTransmit()) {
+        const pcm = sendQueue.shift();
+        queuedSamples -= pcm.length;
+        transmitAudioChunk(pcm);
+    }
+    if (sendQueue.length > 0 && websocket.bufferedAmount > MAX_BUFFERED_BYTES) {
+        // WebSocket has no "drained" event, so poll until the buffer empties
+        flushTimer = setTimeout(flushAudioQueue, SEND_RETRY_MS);
+    }
+    if (sendQueue.length === 0 && endPending) {
+        sendEnd();
+    }
+    updateFlowStats();
+}
+
+function onCredit(data) {
+    if (sendCredits === null) return;
+    sendCredits += data.credits || 0;
+    flushAudioQueue();
+}
+
+function sendEnd() {
+    endPending = false;
+    websocket.send(JSON.stringify({ type: 'end' }));
+    log('📤 Sent end signal');
+}
+
+function updateFlowStats() {
+    const credits = sendCredits === null ? '∞' : sendCredits;
+    document.getElementById('sendQueue').textContent = `${sendQueue.length} / ${credits}`;
+    document.getElementById('flowDrops').textContent = `${flowStats.coalesced} / ${flowStats.dropped}`;
+}
+
+// `replaySeq` is set when a chunk is sent again after a resume; its credit was
+// already spent the first time.
+function transmitAudioChunk(pcmData, replaySeq) {
+    const replay = replaySeq !== undefined;
+    const seq = replay ? replaySeq : chunksSent;
+    try {
+        let bytesSent;
+        let encodeInfo = '';
+        if (!replay && sendCredits !== null) sendCredits--;
+        chunkSentAt.set(CHUNK_ID_BASE + seq, performance.now());
+        if (useBinaryAudio) {
+            // Encoded samples in a binary frame - no WAV header, base64 or JSON
+            const encodeStart = performance.now();
+            const frame = createAudioFrame(pcmData, seq);
+            const encodeMs = performance.now() - encodeStart;
+            recordTelemetry('encode_ms', encodeMs);
+            websocket.send(frame);
+            bytesSent = frame.byteLength;
+            encodeInfo = `, ${encodeMs.toFixed(2)} ms encode`;
+        } else {
+            const encodeStart = performance.now();
+            // Create WAV file
+            const wavBuffer = createWavFile(pcmData, captureRate);
+            
+            // Convert to base64
+            const base64 = arrayBufferToBase64(wavBuffer);
+            const message = JSON.stringify({
+                type: 'audio',
+                data: base64,
+                seq: seq,
+                duration_ms: Math.round(pcmData.length * 1000 / captureRate)
+            });
+            recordTelemetry('encode_ms', performance.now() - encodeStart);
+            
+            // Send to server
+            websocket.send(message);
+            bytesSent = base64.length;
+        }
+        recordTelemetry('buffered_bytes', websocket.bufferedAmount);
+        
+        if (replay) return;
+        rememberForReplay(seq, pcmData);
+        markStartTiming('firstChunk');
+        chunksSent++;
+        document.getElementById('chunksSent').textContent = chunksSent;
+        
+        log(`📤 Sent chunk #${chunksSent} (${pcmData.length} samples, ${bytesSent} bytes, ${useBinaryAudio ? 'binary' : 'json'}${encodeInfo})`);
+        
+    } catch (error) {
+        log('❌ Error sending chunk: ' + error.message);
+    }
+}
+
+function createAudioFrame(pcmData, sequence) {
+    const buffer = new ArrayBuffer(AUDIO_FRAME_HEADER_BYTES + audioPayloadSize(pcmData.length));
+    const view = new DataView(buffer);
+    
+    view.setUint8(0, AUDIO_FRAME_VERSION);
+    view.setUint8(1, audioEncoding);
+    view.setUint16(2, AUDIO_FRAME_HEADER_BYTES, true);
+    view.setUint32(4, sequence, true);
+    view.setUint32(8, pcmData.length, true);
+    
+    if (audioEncoding === AUDIO_ENCODING_MULAW) {
+        encodeMulaw(pcmData, new Uint8Array(buffer, AUDIO_FRAME_HEADER_BYTES));
+    } else if (audioEncoding === AUDIO_ENCODING_ADPCM_IMA) {
+        encodeAdpcmBlock(pcmData, view, AUDIO_FRAME_HEADER_BYTES);
+    } else if (IS_LITTLE_ENDIAN) {
+        new Int16Array(buffer, AUDIO_FRAME_HEADER_BYTES, pcmData.length).set(pcmData);
+    } else {
+        let offset = AUDIO_FRAME_HEADER_BYTES;
+        for (let i = 0; i < pcmData.length; i++) {
+            view.setInt16(offset, pcmData[i], true);
+            offset += 2;
+        }
+    }
+    
+    return buffer;
+}
+
+function audioPayloadSize(sampleCount) {
+    if (audioEncoding === AUDIO_ENCODING_MULAW) return sampleCount;
+    if (audioEncoding === AUDIO_ENCODING_ADPCM_IMA) {
+        return ADPCM_BLOCK_HEADER_BYTES + Math.ceil(sampleCount / 2);
+    }
+    return sampleCount * 2;
+}
+
+// G.711 μ-law: sign bit, 3-bit segment, 4-bit mantissa, all bits inverted
+function encodeMulaw(pcmData, out) {
+    for (let i = 0; i < pcmData.length; i++) {
+        let sample = pcmData[i];
+        const sign = sample < 0 ? 0x80 : 0;
+        if (sign) sample = -sample;
+        if (sample > 32635) sample = 32635;
+        sample += 0x84;
+        const exponent = Math.min(7, 31 - Math.clz32(sample >> 7));
+        const mantissa = (sample >> (exponent + 3)) & 0x0F;
+        out[i] = ~(sign | (exponent << 4) | mantissa) & 0xFF;
+    }
+}
+
+// IMA-ADPCM block: i16 predictor | u8 step index | u8 reserved | nibbles (low first).
+// The header carries the encoder state, so each frame decodes on its own.
+function encodeAdpcmBlock(pcmData, view, offset) {
+    let predictor = adpcmState.predictor;
+    let index = adpcmState.index;
+    view.setInt16(offset, predictor, true);
+    view.setUint8(offset + 2, index);
+    view.setUint8(offset + 3, 0);
+    
+    const codes = new Uint8Array(view.buffer, offset + ADPCM_BLOCK_HEADER_BYTES);
+    for (let i = 0; i < pcmData.length; i++) {
+        let step = IMA_STEP_TABLE[index];
+        let diff = pcmData[i] - predictor;
+        let nibble = 0;
+        if (diff < 0) {
+            nibble = 8;
+            diff = -diff;
+        }
+        let vpdiff = step >> 3;
+        if (diff >= step) { nibble |= 4; diff -= step; vpdiff += step; }
+        step >>= 1;
+        if (diff >= step) { nibble |= 2; diff -= step; vpdiff += step; }
+        step >>= 1;
+        if (diff >= step) { nibble |= 1; vpdiff += step; }
+        
+        predictor += (nibble & 8) ? -vpdiff : vpdiff;
+        if (predictor > 32767) predictor = 32767;
+        else if (predictor < -32768) predictor = -32768;
+        index += IMA_INDEX_TABLE[nibble];
+        if (index < 0) index = 0;
+        else if (index > 88) index = 88;
+        
+        if (i & 1) codes[i >> 1] |= nibble << 4;
+        else codes[i >> 1] = nibble;
+    }
+    
+    adpcmState.predictor = predictor;
+    adpcmState.index = index;
+}
+
+function createWavFile(pcmData, sampleRate) {
+    const numChannels = 1;
+    const bytesPerSample = 2;
+    const blockAlign = numChannels * bytesPerSample;
+    const byteRate = sampleRate * blockAlign;
+    const dataSize = pcmData.length * bytesPerSample;
+    const buffer = new ArrayBuffer(44 + dataSize);
+    const view = new DataView(buffer);
+    
+    writeString(view, 0, 'RIFF');
+    view.setUint32(4, 36 + dataSize, true);
+    writeString(view, 8, 'WAVE');
+    writeString(view, 12, 'fmt ');
+    view.setUint32(16, 16, true);
+    view.setUint16(20, 1, true);
+    view.setUint16(22, numChannels, true);
+    view.setUint32(24, sampleRate, true);
+    view.setUint32(28, byteRate, true);
+    view.setUint16(32, blockAlign, true);
+    view.setUint16(34, 16, true);
+    writeString(view, 36, 'data');
+    view.setUint32(40, dataSize, true);
+    
+    let offset = 44;
+    for (let i = 0; i < pcmData.length; i++) {
+        view.setInt16(offset, pcmData[i], true);
+        offset += 2;
+    }
+    
+    return buffer;
+}
+
+function writeString(view, offset, string) {
+    for (let i = 0; i < string.length; i++) {
+        view.setUint8(offset + i, string.charCodeAt(i));
+    }
+}
+
+function arrayBufferToBase64(buffer) {
+    const bytes = new Uint8Array(buffer);
+    let binary = '';
+    for (let i = 0; i < bytes.byteLength; i++) {
+        binary += String.fromCharCode(bytes[i]);
+    }
+    return btoa(binary);
+}
+
+function stopRecording() {
+    log('🛑 Stopping recording...');
+    
+    if (durationInterval) {
+        clearInterval(durationInterval);
+    }
+    if (pingInterval) {
+        clearInterval(pingInterval);
+        pingInterval = null;
+    }
+    
+    if (mediaStream) {
+        mediaStream.getTracks().forEach(track => track.stop());
+    }
+    
+    if (captureNode) {
+        captureNode.port.postMessage({ type: 'stop' });
+        captureNode.disconnect();
+        captureNode = null;
+    }
+    if (captureSource) {
+        captureSource.disconnect();
+        captureSource = null;
+    }
+    if (readyTimer) {
+        clearTimeout(readyTimer);
+        readyTimer = null;
+    }
+    
+    if (audioContext) {
+        // Kept (suspended) with its worklet loaded for the next recording
+        audioContext.suspend();
+        audioContext = null;
+    }
+    
+    if (awaitingReady && !configSent) {
+        abandonSession();
+    } else if (websocket && (websocket.readyState <= WebSocket.OPEN || reconnecting)) {
+        // `end` goes out after any audio still waiting for credits or a resume
+        endPending = true;
+        flushAudioQueue();
+    }
+    
+    isRecording = false;
+    startBtn.disabled = false;
+    stopBtn.disabled = true;
+    
+    if (websocket) {
+        updateStatus('⏸️ Processing final transcription...', 'processing');
+    } else {
+        updateStatus('Ready to start recording', 'idle');
+    }
+}
+
+// ============================================================
+// WEBSOCKET MESSAGE HANDLER
+// ============================================================
+function handleWebSocketMessage(data) {
+    log(`📨 Received: ${data.type}` + (data.text ? ` - "${data.text.substring(0, 50)}..."` : ''));
+    
+    switch (data.type) {
+        case 'ready':
+            log('🟢 Session ready');
+            markStartTiming('ready');
+            awaitingReady = false;
+            segmentBase = segmentItems.length;
+            if (readyTimer) {
+                clearTimeout(readyTimer);
+                readyTimer = null;
+            }
+            sessionId = data.session_id || null;
+            if (data.transcript_id) {
+                sessionStorage.setItem(TRANSCRIPT_STORAGE_KEY, data.transcript_id);
+            }
+            useBinaryAudio = PREFER_BINARY_AUDIO && data.binary_audio === true;
+            audioEncoding = useBinaryAudio && data.audio_encoding in AUDIO_ENCODINGS
+                && PREFERRED_AUDIO_CODECS.includes(data.audio_encoding)
+                ? AUDIO_ENCODINGS[data.audio_encoding]
+                : AUDIO_ENCODING_PCM_S16LE;
+            log(useBinaryAudio
+                ? `📦 Server accepted binary audio frames (${data.audio_encoding || 'pcm_s16le'})`
+                : '📦 Using JSON/base64 audio (binary frames not supported by server)');
+            if (FLOW_CONTROL && data.flow_control && data.flow_control.credits) {
+                // The window counts every chunk since config, including any sent before ready
+                sendCredits = data.flow_control.credits - chunksSent;
+                log(`🚦 Flow control: ${data.flow_control.credits} chunk credits (${FLOW_CONTROL_POLICY} when exhausted)`);
+            }
+            flushAudioQueue();
+            if (ADAPTIVE_CHUNK_DURATION && data.ping === true) {
+                startPinging();
+            }
+            if (data.auto_refresh_enabled) {
+                log('🔄 Auto-refresh is ENABLED - tokens will refresh every 55 minutes');
+                refreshStatus.textContent = 'Enabled';
+                refreshStatus.style.color = '#10b981';
+            } else {
+                log('⚠️ Auto-refresh is NOT enabled - session will expire in 1 hour');
+                refreshStatus.textContent = 'Disabled';
+                refreshStatus.style.color = '#ef4444';
+            }
+            break;
+            
+        case 'token_refreshed':
+            handleTokenRefresh(data);
+            break;
+            
+        case 'token_refresh_failed':
+            log('❌ Token refresh failed: ' + data.message);
+            showError('Session expired. Please log in again.');
+            refreshStatus.textContent = 'Failed';
+            refreshStatus.style.color = '#ef4444';
+            // Auto logout after refresh failure
+            setTimeout(() => {
+                stopRecording();
+                onUserLoggedOut();
+            }, 2000);
+            break;
+            
+        case 'pong':
+            onPong(data);
+            break;
+            
+        case 'resumed':
+            onResumed(data);
+            break;
+            
+        case 'resume_failed':
+            onResumeFailed(data);
+            break;
+            
+        case 'credit':
+            onCredit(data);
+            break;
+            
+        case 'chunk_result':
+            if (telemetryTimer && !document.hidden && pendingRenderTimes.length < TELEMETRY_MAX_SAMPLES) {
+                pendingRenderTimes.push(performance.now());
+            }
+            markStartTiming('firstResult');
+            onChunkAnswered(data.chunk_id);
+            dropLivePartial(data.chunk_id);
+            applyFixups(data.fixups);
+            chunksProcessed++;
+            document.getElementById('chunksProcessed').textContent = chunksProcessed;
+            
+            appendTranscript(
+                `Chunk ${data.chunk_id} (${data.start_time.toFixed(1)}s - ${data.end_time.toFixed(1)}s)`,
+                data.text
+            );
+            if (typeof data.segment === 'number') {
+                segmentItems[segmentBase + data.segment] = transcriptItems.length - 1;
+            }
+            break;
+            
+        case 'partial':
+            onPartial(data);
+            break;
+            
+        case 'complete':
+            sessionComplete = true;
+            sessionId = null;
+            unackedChunks.clear();
+            applyFixups(data.fixups);
+            finalTranscription.style.display = 'block';
+            finalText.textContent = 'text' in data ? data.text : finalTranscriptText(data.segments || 0);
+            updateStatus('✅ Transcription complete!', 'idle');
+            stopTelemetry();
+            closeWebSocket();
+            prewarmSocket();  // for the next recording
+            log(`✅ Complete: ${data.total_chunks} chunks processed in ${data.duration}s`);
+            if (flowStats.queued) {
+                log(`🚦 ${flowStats.queued} chunks waited for credits, ${flowStats.coalesced} merges, ${flowStats.dropped} dropped (${flowStats.droppedMs}ms)`);
+            }
+            if (data.vad) {
+                log(`🔇 Gateway answered ${data.vad.suppressed_chunks} of ${data.vad.chunks} chunks as silence (${data.vad.suppressed_audio_seconds}s not sent upstream)`);
+            }
+            break;
+            
+        case 'no_speech':
+            onChunkAnswered(data.chunk_id);
+            dropLivePartial(data.chunk_id);
+            applyFixups(data.fixups);
+            log(`🔇 No speech in chunk ${data.chunk_id}`);
+            break;
+            
+        case 'error':
+            showError(data.message);
+            if (data.message.includes('Authentication') || 
+                data.message.includes('Token') ||
+                data.message.includes('authenticated')) {
+                stopRecording();
+                setTimeout(() => onUserLoggedOut(), 1000);
+            }
+            break;
+    }
+}
@@ -0,0 +1,103 @@
+// Audio capture worklet: runs on the audio rendering thread.
+//
+// Incoming 128-sample render quanta are written into a preallocated Float32
+// ring buffer. Whenever a full chunk is available it is converted to Int16 PCM
+// into a pooled frame and transferred (zero-copy) to the page, which sends it
+// and transfers the buffer back. Nothing is allocated per sample or per chunk
+// once the pool is warm.
+//
+// The page can change the chunk size mid-stream ('frame_samples'); the ring is
+// sized for the largest chunk up front and the pool is refilled at the new size.
+class AudioCaptureProcessor extends AudioWorkletProcessor {
+    constructor(options) {
+        super();
+        const opts = options.processorOptions || {};
+        this.frameSamples = opts.frameSamples;
+        const maxFrameSamples = Math.max(opts.maxFrameSamples || 0, this.frameSamples);
+        this.ring = new Float32Array(Math.max(opts.ringSamples || 0, maxFrameSamples * 2));
+        this.maxFrameSamples = maxFrameSamples;
+        this.readIndex = 0;
+        this.writeIndex = 0;
+        this.available = 0;
+        this.dropped = 0;
+        this.running = true;
+        this.started = false;
+        
+        this.pool = [];
+        for (let i = 0; i < (opts.poolSize || 4); i++) {
+            this.pool.push(new Int16Array(this.frameSamples));
+        }
+        
+        this.port.onmessage = (event) => {
+            const message = event.data;
+            if (message.type === 'recycle') {
+                const frame = new Int16Array(message.buffer);
+                if (frame.length === this.frameSamples) {
+                    this.pool.push(frame);
+                }
+            } else if (message.type === 'frame_samples') {
+                this.frameSamples = Math.min(message.frameSamples, this.maxFrameSamples);
+                this.pool = [];
+            } else if (message.type === 'stop') {
+                this.running = false;
+            }
+        };
+    }
+    
+    write(input) {
+        const capacity = this.ring.length;
+        const count = input.length;
+        
+        if (this.available + count > capacity) {
+            // Consumer fell behind: drop the oldest samples rather than grow
+            const overflow = this.available + count - capacity;
+            this.readIndex = (this.readIndex + overflow) % capacity;
+            this.available -= overflow;
+            this.dropped += overflow;
+            this.port.postMessage({ type: 'overflow', dropped: this.dropped });
+        }
+        
+        const firstPart = Math.min(count, capacity - this.writeIndex);
+        this.ring.set(input.subarray(0, firstPart), this.writeIndex);
+        if (firstPart < count) {
+            this.ring.set(input.subarray(firstPart), 0);
+        }
+        this.writeIndex = (this.writeIndex + count) % capacity;
+        this.available += count;
+    }
+    
+    emitFrame() {
+        const frame = this.pool.pop() || new Int16Array(this.frameSamples);
+        const capacity = this.ring.length;
+        let index = this.readIndex;
+        
+        for (let i = 0; i < this.frameSamples; i++) {
+            const s = Math.max(-1, Math.min(1, this.ring[index]));
+            frame[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
+            index = index + 1 === capacity ? 0 : index + 1;
+        }
+        
+        this.readIndex = index;
+        this.available -= this.frameSamples;
+        // `time` (audio clock) lets the page measure how long the frame waits for it
+        this.port.postMessage({ type: 'frame', samples: frame, time: currentTime }, [frame.buffer]);
+    }
+    
+    process(inputs) {
+        const input = inputs[0];
+        if (input && input[0]) {
+            if (!this.started) {
+                // Lets the page time its start path to the first captured sample
+                this.started = true;
+                this.port.postMessage({ type: 'started' });
+            }
+            this.write(input[0]);
+            while (this.available >= this.frameSamples) {
+                this.emitFrame();
+            }
+        }
+        return this.running;
+    }
+}
+
+registerProcessor('audio-capture-processor', AudioCaptureProcessor);
@@ -0,0 +1,480 @@
+"""
+Python streaming client for WAV files on disk.
+
+Speaks the page's protocol (config -> audio -> end -> complete) without a
+browser, for regression runs and back-office re-transcription.
+
+Memory stays bounded however large the files are:
+- Each WAV is memory-mapped and its RIFF header parsed once. Chunks are
+  memoryview slices of the mapping, so the client never reads the file into
+  a buffer of its own.
+- A binary frame is its 12-byte header plus the chunk, assembled in one
+  per-session buffer that is reused for every frame. The WebSocket layer still
+  masks each frame into its own copy, as every client-to-server frame must be.
+- At most `window` chunks per session are unanswered, fewer if the server's
+  flow-control credits say so. Pages already sent are released from the
+  mapping as the stream moves on.
+- At most `concurrency` files are open and streaming at once.
+
+Files must be mono 16-bit PCM. Chunks are sent at real-time pace (`speed` 1),
+N times faster, or as fast as the window allows (`speed` 0).
+
+Usage:
+    python stream_client.py --url http://localhost:8001 recordings/*.wav --concurrency 8 --speed 0
+"""
+
+import argparse
+import asyncio
+import json
+import mmap
+import struct
+import sys
+import time
+from dataclasses import dataclass
+
+import aiohttp
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import audio_codecs
+import streaming_protocol
+
+RIFF_HEADER = struct.Struct('<4sI4s')
+CHUNK_HEADER = struct.Struct('<4sI')
+FMT_CHUNK = struct.Struct('<HHIIHH')
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+RELEASE_BYTES = 4 * 1024 * 1024  # sent audio is dropped from the mapping in steps of this size
+
+
+class WavError(ValueError):
+    """The file is not a WAV the client can stream."""
+
+
+@dataclass
+class StreamOptions:
+    chunk_ms: int = 500
+    window: int = 8  # chunks in flight per session; server credits can lower it
+    speed: float = 1.0  # multiple of real time; 0 = unpaced
+    codec: str = 'pcm_s16le'
+    language: str = 'en'
+    binary_audio: bool = True
+    timeout: float = None  # per session
+
+
+class WavFile:
+    """A memory-mapped 16-bit PCM WAV file; mono unless `mono` is False."""
+
+    def __init__(self, path, mono=True):
+        self.path = path
+        self.mono = mono
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise WavError('empty file')
+        try:
+            self.parse_header()
+        except (WavError, struct.error) as e:
+            self.map.close()
+            raise WavError(str(e))
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+        self.data = memoryview(self.map)[self.data_offset:self.data_offset + self.data_bytes]
+        self.released = 0
+
+    def parse_header(self):
+        riff, _, wave_id = RIFF_HEADER.unpack_from(self.map, 0)
+        if riff != b'RIFF' or wave_id != b'WAVE':
+            raise WavError('not a RIFF/WAVE file')
+        offset = RIFF_HEADER.size
+        fmt = None
+        while offset + CHUNK_HEADER.size <= len(self.map):
+            chunk_id, size = CHUNK_HEADER.unpack_from(self.map, offset)
+            body = offset + CHUNK_HEADER.size
+            if chunk_id == b'fmt ':
+                fmt = FMT_CHUNK.unpack_from(self.map, body)
+            elif chunk_id == b'data':
+                if fmt is None:
+                    raise WavError('data chunk before fmt chunk')
+                self.data_offset = body
+                # Streamed recorders often leave the size unset; take what is there
+                self.data_bytes = min(size, len(self.map) - body)
+                break
+            offset = body + size + (size & 1)
+        else:
+            raise WavError('no data chunk')
+
+        audio_format, self.channels, self.sample_rate, _, _, bits = fmt
+        if (audio_format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_EXTENSIBLE) or bits != 16
+                or self.channels < 1 or (self.mono and self.channels != 1)):
+            raise WavError(f'expected {"mono " if self.mono else ""}16-bit PCM, got format {audio_format}, '
+                           f'{self.channels} channel(s), {bits} bits')
+        self.frame_bytes = 2 * self.channels
+        self.data_bytes -= self.data_bytes % self.frame_bytes
+
+    @property
+    def frame_count(self):
+        return self.data_bytes // self.frame_bytes
+
+    @property
+    def duration(self):
+        return self.frame_count / self.sample_rate
+
+    def frames(self, chunk_ms):
+        """Chunks of `chunk_ms` as memoryviews into the mapping (the last one may be shorter)."""
+        step = max(1, self.sample_rate * chunk_ms // 1000) * self.frame_bytes
+        for start in range(0, self.data_bytes, step):
+            yield self.data[start:start + step]
+
+    def release(self, upto):
+        """Let the kernel drop mapped pages of audio before byte `upto` of the data."""
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        end = (self.data_offset + upto) // mmap.PAGESIZE * mmap.PAGESIZE
+        if end - self.released >= RELEASE_BYTES:
+            self.map.madvise(mmap.MADV_DONTNEED, self.released, end - self.released)
+            self.released = end
+
+    def release_span(self, start, end):
+        """Drop the mapped pages lying wholly within bytes [start, end) of the data."""
+        if not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        first = -(-(self.data_offset + start) // mmap.PAGESIZE) * mmap.PAGESIZE
+        last = (self.data_offset + end) // mmap.PAGESIZE * mmap.PAGESIZE
+        if last > first:
+            self.map.madvise(mmap.MADV_DONTNEED, first, last - first)
+
+    def close(self):
+        self.data.release()
+        try:
+            self.map.close()
+        except BufferError:
+            pass  # a view is still alive somewhere; the mapping closes when it is collected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamSession:
+    """
+    One WebSocket session streaming a sequence of Int16 PCM frames.
+
+    `frames` yields bytes-like chunks; they are not kept after being sent, so
+    they may be views into a mapping that is released behind the stream.
+    """
+
+    def __init__(self, frames, sample_rate, options, on_sent=None):
+        self.frames = frames
+        self.sample_rate = sample_rate
+        self.options = options
+        self.on_sent = on_sent
+        self.results = {}  # server chunk_id -> chunk_result
+        self.no_speech = 0
+        self.errors = []
+        self.sent = 0
+        self.answered = 0
+        self.bytes_sent = 0
+        self.credits = None  # None: the server did not enable flow control
+        self.complete = None
+        self.buffer = bytearray()
+
+    async def run(self, http, ws_url, tokens):
+        async with http.ws_connect(ws_url, max_msg_size=0) as ws:
+            await ws.send_str(json.dumps({
+                'type': 'config',
+                'language': self.options.language,
+                'id_token': tokens['idToken'],
+                'refresh_token': tokens.get('refreshToken'),
+                'binary_audio': self.options.binary_audio,
+                'flow_control': True,
+                'audio_format': {
+                    'encoding': 'pcm_s16le',
+                    'sample_rate': self.sample_rate,
+                    'channels': 1,
+                    'frame_version': streaming_protocol.AUDIO_FRAME_VERSION,
+                    'codecs': [self.options.codec],
+                },
+            }))
+            ready = await self.receive_ready(ws)
+            encoding = None
+            if ready.get('binary_audio') is True:
+                encoding = streaming_protocol.ENCODING_IDS[ready.get('audio_encoding') or 'pcm_s16le']
+            if ready.get('flow_control'):
+                self.credits = ready['flow_control']['credits']
+
+            changed = asyncio.Event()
+            receiver = asyncio.create_task(self.receive(ws, changed))
+            try:
+                await self.send_frames(ws, encoding, receiver, changed)
+                if not receiver.done():
+                    await ws.send_str(json.dumps({'type': 'end'}))
+                await receiver
+            finally:
+                receiver.cancel()
+        if self.complete is None:
+            raise ConnectionError(self.errors[-1] if self.errors else 'Connection closed before complete')
+        return self
+
+    async def send_frames(self, ws, encoding, receiver, changed):
+        speed = self.options.speed
+        started = time.perf_counter()
+        audio_sent = 0.0
+        for seq, frame in enumerate(self.frames):
+            # Released on every path, so a failed session can't keep the file's mapping open
+            with memoryview(frame).cast('B') as frame:
+                if speed:
+                    delay = started + audio_sent / speed - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                while self.blocked() and not receiver.done():
+                    changed.clear()
+                    await changed.wait()
+                if receiver.done():
+                    return
+
+                sample_count = len(frame) // 2
+                if encoding is None:
+                    message = streaming_protocol.encode_json_audio(frame, self.sample_rate)
+                    message['seq'] = seq
+                    payload = json.dumps(message)
+                    await ws.send_str(payload)
+                else:
+                    payload = self.build_frame(seq, frame, encoding, sample_count)
+                    await ws.send_bytes(payload)
+            self.sent += 1
+            self.bytes_sent += len(payload)
+            audio_sent += sample_count / self.sample_rate
+            if self.credits is not None:
+                self.credits -= 1
+            if self.on_sent:
+                self.on_sent(self.sent)
+
+    def build_frame(self, seq, frame, encoding, sample_count):
+        """Header plus payload in the session's reusable buffer; valid until the next call."""
+        if encoding != streaming_protocol.ENCODING_PCM_S16LE:
+            frame = audio_codecs.encode_payload(encoding, frame)
+        size = streaming_protocol.AUDIO_FRAME_HEADER_BYTES + len(frame)
+        if len(self.buffer) < size:
+            self.buffer = bytearray(size)
+        streaming_protocol.AUDIO_FRAME_HEADER.pack_into(
+            self.buffer, 0, streaming_protocol.AUDIO_FRAME_VERSION, encoding,
+            streaming_protocol.AUDIO_FRAME_HEADER_BYTES, seq, sample_count,
+        )
+        self.buffer[streaming_protocol.AUDIO_FRAME_HEADER_BYTES:size] = frame
+        return memoryview(self.buffer)[:size]
+
+    def blocked(self):
+        if self.sent - self.answered >= self.options.window:
+            return True
+        return self.credits is not None and self.credits <= 0
+
+    async def receive_ready(self, ws):
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            data = json.loads(msg.data)
+            if data.get('type') == 'ready':
+                return data
+            if data.get('type') == 'error':
+                raise ConnectionError(data.get('message') or 'Session rejected')
+        raise ConnectionError('Connection closed before ready')
+
+    async def receive(self, ws, changed):
+        try:
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                kind = data.get('type')
+                if kind == 'chunk_result':
+                    self.results[data.get('chunk_id')] = data
+                    self.answered += 1
+                elif kind == 'no_speech':
+                    self.no_speech += 1
+                    self.answered += 1
+                elif kind == 'error':
+                    # A failed chunk: its text is lost but it no longer holds the window
+                    self.errors.append(data.get('message', ''))
+                    self.answered += 1
+                elif kind == 'credit':
+                    if self.credits is not None:
+                        self.credits += data.get('credits', 0)
+                elif kind == 'complete':
+                    self.complete = data
+                    return
+                else:
+                    continue
+                changed.set()
+        finally:
+            changed.set()
+
+    def segments(self, offset=0.0):
+        """Results in chunk order; times are shifted by `offset` seconds."""
+        segments = []
+        for chunk_id in sorted(self.results):
+            result = self.results[chunk_id]
+            segments.append({
+                'start_time': round(offset + result.get('start_time', 0.0), 3),
+                'end_time': round(offset + result.get('end_time', 0.0), 3),
+                'text': result.get('text', ''),
+            })
+        return segments
+
+    def counts(self):
+        return {
+            'sent': self.sent,
+            'chunk_results': len(self.results),
+            'no_speech': self.no_speech,
+            'errors': len(self.errors),
+        }
+
+
+async def stream_file(http, ws_url, tokens, path, options=None):
+    """Stream one WAV file; returns its transcript, counters and timings."""
+    options = options or StreamOptions()
+    started = time.perf_counter()
+    with WavFile(path) as wav:
+        step = max(1, wav.sample_rate * options.chunk_ms // 1000) * 2
+        session = StreamSession(
+            wav.frames(options.chunk_ms), wav.sample_rate, options,
+            on_sent=lambda sent: wav.release(min(wav.data_bytes, sent * step)),
+        )
+        await asyncio.wait_for(session.run(http, ws_url, tokens), options.timeout)
+        duration = wav.duration
+    wall_seconds = time.perf_counter() - started
+    segments = session.segments()
+    return {
+        'file': path,
+        'text': ' '.join(segment['text'] for segment in segments if segment['text']),
+        'segments': segments,
+        'chunks': session.counts(),
+        'bytes_sent': session.bytes_sent,
+        'audio_seconds': round(duration, 3),
+        'wall_seconds': round(wall_seconds, 3),
+    }
+
+
+async def stream_files(http, ws_url, tokens, paths, options=None, concurrency=4):
+    """
+    Stream many files, at most `concurrency` at a time. Yields each file's
+    result (or {'file', 'failure'}) as it finishes.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(path):
+        async with slots:
+            try:
+                return await stream_file(http, ws_url, tokens, path, options)
+            except (WavError, OSError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                return {'file': path, 'failure': str(e) or type(e).__name__}
+
+    # Tasks are created lazily so a long file list never holds more than a window of work
+    pending = set()
+    paths = iter(paths)
+    while True:
+        while len(pending) < concurrency * 2:
+            path = next(paths, None)
+            if path is None:
+                break
+            pending.add(asyncio.create_task(run(path)))
+        if not pending:
+            return
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            yield task.result()
+
+
+async def login(http, api_base_url, email, password):
+    async with http.post(api_base_url + '/login', json={'email': email, 'password': password}) as response:
+        data = await response.json(content_type=None)
+        if response.status != 200:
+            raise ConnectionError(f"Login failed: {data.get('detail', response.status)}")
+        return data['access_token']
+
+
+def parse_args(argv=None):
+    defaults = StreamOptions()
+    parser = argparse.ArgumentParser(description='Stream WAV files through the transcription protocol')
+    parser.add_argument('files', nargs='+', help='mono 16-bit PCM WAV files')
+    parser.add_argument('--url', default='http://localhost:8001',
+                        help='base URL of the API serving /login')
+    parser.add_argument('--ws-url', help='WebSocket URL (default: derived from --url)')
+    parser.add_argument('--concurrency', type=int, default=4, help='files streamed at once')
+    parser.add_argument('--chunk-ms', type=int, default=defaults.chunk_ms)
+    parser.add_argument('--window', type=int, default=defaults.window,
+                        help='chunks in flight per session (server credits may lower it)')
+    parser.add_argument('--speed', type=float, default=defaults.speed,
+                        help='pacing multiple of real time (0 = as fast as the window allows)')
+    parser.add_argument('--codec', choices=sorted(streaming_protocol.ENCODING_IDS), default=defaults.codec)
+    parser.add_argument('--transport', choices=('binary', 'json'), default='binary')
+    parser.add_argument('--language', default=defaults.language)
+    parser.add_argument('--timeout', type=float, help='per-file timeout in seconds')
+    parser.add_argument('--email', default='loadtest@example.com')
+    parser.add_argument('--password', default='loadtest')
+    parser.add_argument('--id-token', help='skip /login and use this id token')
+    parser.add_argument('--output', help='write one JSON result per file to this JSONL file')
+    args = parser.parse_args(argv)
+
+    args.url = args.url.rstrip('/')
+    if not args.ws_url:
+        args.ws_url = (
+            args.url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1)
+            + '/stream-transcription-auth'
+        )
+    return args
+
+
+async def run_cli(args, output):
+    options = StreamOptions(
+        chunk_ms=args.chunk_ms, window=args.window, speed=args.speed, codec=args.codec,
+        language=args.language, binary_audio=args.transport == 'binary', timeout=args.timeout,
+    )
+    totals = {'files': 0, 'failed': 0, 'audio_seconds': 0.0}
+    started = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0)) as http:
+        if args.id_token:
+            tokens = {'idToken': args.id_token}
+        else:
+            tokens = await login(http, args.url, args.email, args.password)
+        async for result in stream_files(http, args.ws_url, tokens, args.files, options, args.concurrency):
+            totals['files'] += 1
+            if 'failure' in result:
+                totals['failed'] += 1
+                print(f"❌ {result['file']}: {result['failure']}", file=sys.stderr)
+            else:
+                totals['audio_seconds'] += result['audio_seconds']
+                print(f"✅ {result['file']}: {result['audio_seconds']} s in {result['wall_seconds']} s, "
+                      f"{result['chunks']['chunk_results']} results", file=sys.stderr)
+            output.write(json.dumps(result) + '\n')
+    totals['wall_seconds'] = time.perf_counter() - started
+    return totals
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        totals = asyncio.run(run_cli(args, output))
+    except (ConnectionError, aiohttp.ClientError, OSError) as e:
+        raise SystemExit(f'❌ {e}')
+    finally:
+        if args.output:
+            output.close()
+
+    wall = totals['wall_seconds']
+    print(f"📊 {totals['files']} files ({totals['failed']} failed), {totals['audio_seconds']:.1f} s of audio "
+          f"in {wall:.2f} s ({totals['audio_seconds'] / wall:.2f} audio-s/s)", file=sys.stderr)
+    if resource:
+        # Linux reports kilobytes
+        print(f"   peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Wire format helpers for the /stream-transcription-auth WebSocket protocol.
+
+Audio can reach the server in two ways:
+- JSON text message: {"type": "audio", "data": "<base64 WAV file>"} (original format)
+- Binary message: 12-byte little-endian header followed by encoded samples
+
+Binary frames are only sent after the server answers the client's `config`
+(which carries "binary_audio": true) with a `ready` message that also contains
+"binary_audio": true. Servers that ignore the flag keep receiving JSON.
+
+The client lists the codecs it can produce in `config.audio_format.codecs`
+(preference order). The server answers with the one it picked in
+`ready.audio_encoding`; without that field the client sends plain PCM.
+
+Binary frame header:
+    offset 0  u8   version        (1)
+    offset 1  u8   encoding       (0 = pcm_s16le, 1 = mulaw, 2 = adpcm_ima)
+    offset 2  u16  header length  (12; payload starts here)
+    offset 4  u32  sequence number (per session, starting at 0)
+    offset 8  u32  sample count
+
+Partial hypotheses can be sent as deltas. A client that puts
+"partial_deltas": true in `config` (or `resume`) and gets it back in `ready`
+receives `partial` messages with a `stable` field: the new hypothesis for that
+chunk is the first `stable` characters of the previous one followed by `text`.
+`stable` counts UTF-16 code units, as JavaScript string indices do. The first
+partial of a chunk, and any partial without `stable`, carries the whole text.
+
+The final transcript can be assembled as the session goes. With
+"final_segments": true in `config` and `ready`, every `chunk_result` carries
+`segment`, its index in the final transcript, and its `text` is already
+punctuated for it. Fix-ups to segments already delivered (a full stop once the
+next words show that a sentence ended) ride on later `chunk_result`,
+`no_speech` and `complete` messages as "fixups": [[segment, text], ...].
+`complete` then carries "segments": N instead of `text`: the final transcript
+is segments 0..N-1 joined with spaces (FinalTranscript).
+"""
+
+import base64
+import io
+import struct
+import wave
+
+AUDIO_FRAME_VERSION = 1
+AUDIO_FRAME_HEADER = struct.Struct('<BBHII')
+AUDIO_FRAME_HEADER_BYTES = AUDIO_FRAME_HEADER.size
+
+ENCODING_PCM_S16LE = 0
+ENCODING_MULAW = 1
+ENCODING_ADPCM_IMA = 2
+ENCODING_NAMES = {
+    ENCODING_PCM_S16LE: 'pcm_s16le',
+    ENCODING_MULAW: 'mulaw',
+    ENCODING_ADPCM_IMA: 'adpcm_ima',
+}
+ENCODING_IDS = {name: encoding for encoding, name in ENCODING_NAMES.items()}
+BYTES_PER_SAMPLE = {
+    ENCODING_PCM_S16LE: 2,
+    ENCODING_MULAW: 1,
+}
+ADPCM_BLOCK_HEADER_BYTES = 4
+
+
+class AudioFrameError(ValueError):
+    """Raised when an incoming audio message cannot be decoded."""
+
+
+def payload_size(encoding, sample_count):
+    """Number of payload bytes a frame of `sample_count` samples must carry."""
+    if encoding == ENCODING_ADPCM_IMA:
+        return ADPCM_BLOCK_HEADER_BYTES + (sample_count + 1) // 2
+    return sample_count * BYTES_PER_SAMPLE[encoding]
+
+
+def choose_encoding(audio_format, supported):
+    """
+    Pick the first codec from the client's `audio_format.codecs` that the
+    server supports. Falls back to pcm_s16le.
+    """
+    codecs = (audio_format or {}).get('codecs') or []
+    for name in codecs:
+        if name in supported:
+            return name
+    return 'pcm_s16le'
+
+
+def encode_audio_frame(sequence, payload, encoding=ENCODING_PCM_S16LE, sample_count=None):
+    """
+    Build a binary audio frame from an encoded payload.
+
+    `sample_count` can be omitted for fixed-width encodings (PCM, μ-law).
+    """
+    if sample_count is None:
+        sample_count = len(payload) // BYTES_PER_SAMPLE[encoding]
+    header = AUDIO_FRAME_HEADER.pack(
+        AUDIO_FRAME_VERSION, encoding, AUDIO_FRAME_HEADER_BYTES, sequence, sample_count
+    )
+    return header + bytes(payload)
+
+
+def decode_audio_frame(frame):
+    """
+    Split a binary audio frame into (sequence, encoding, sample_count, payload).
+
+    The payload is a memoryview into `frame`, so no audio bytes are copied.
+    """
+    view = memoryview(frame)
+    if len(view) < AUDIO_FRAME_HEADER_BYTES:
+        raise AudioFrameError(f'Audio frame too short ({len(view)} bytes)')
+
+    version, encoding, header_len, sequence, sample_count = AUDIO_FRAME_HEADER.unpack_from(view)
+    if version != AUDIO_FRAME_VERSION:
+        raise AudioFrameError(f'Unsupported audio frame version {version}')
+    if encoding not in ENCODING_NAMES:
+        raise AudioFrameError(f'Unsupported audio encoding {encoding}')
+    if header_len < AUDIO_FRAME_HEADER_BYTES or header_len > len(view):
+        raise AudioFrameError(f'Invalid audio frame header length {header_len}')
+
+    payload = view[header_len:]
+    expected = payload_size(encoding, sample_count)
+    if len(payload) != expected:
+        raise AudioFrameError(
+            f'Audio frame payload is {len(payload)} bytes, header says {expected}'
+        )
+    return sequence, encoding, sample_count, payload
+
+
+def decode_json_audio(message):
+    """Decode the base64 WAV of a JSON `audio` message into (pcm_bytes, sample_rate)."""
+    try:
+        wav_bytes = base64.b64decode(message['data'], validate=True)
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+            sample_width = wav.getsampwidth()
+            channels = wav.getnchannels()
+            sample_rate = wav.getframerate()
+            pcm = wav.readframes(wav.getnframes())
+    except (KeyError, TypeError, ValueError, EOFError, wave.Error) as e:
+        raise AudioFrameError(f'Invalid JSON audio message: {e}') from e
+
+    if sample_width != 2 or channels != 1:
+        raise AudioFrameError('Expected mono 16-bit WAV audio')
+    return pcm, sample_rate
+
+
+def encode_json_audio(pcm, sample_rate):
+    """Build the original JSON `audio` message (base64 WAV) from PCM bytes."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return {
+        'type': 'audio',
+        'data': base64.b64encode(buffer.getvalue()).decode('ascii'),
+    }
+
+
+def encode_partial_delta(previous, text):
+    """
+    Fields of a delta `partial` that turns hypothesis `previous` into `text`:
+    {'stable': <shared prefix in UTF-16 code units>, 'text': <rest of text>}, or
+    just {'text': text} when nothing is shared. The prefix ends on a word
+    boundary, so a word the decoder is still changing stays in the tail.
+    """
+    limit = min(len(previous), len(text))
+    common = 0
+    while common < limit and previous[common] == text[common]:
+        common += 1
+    if common < len(text) and text[common] != ' ':
+        common = text.rfind(' ', 0, common) + 1
+    if not common:
+        return {'text': text}
+    return {'stable': len(text[:common].encode('utf-16-le')) // 2, 'text': text[common:]}
+
+
+def apply_partial_delta(previous, message):
+    """Full hypothesis after a `partial` message, given the previous one for its chunk."""
+    if 'stable' not in message:
+        return message.get('text', '')
+    kept = previous.encode('utf-16-le')[:2 * message['stable']].decode('utf-16-le', errors='ignore')
+    return kept + message.get('text', '')
+
+
+class FinalTranscript:
+    """Final transcript of a `final_segments` session, assembled from its messages."""
+
+    def __init__(self):
+        self.segments = []
+
+    def update(self, message):
+        """Take in a chunk_result, no_speech or complete message."""
+        for index, text in message.get('fixups') or ():
+            if 0 <= index < len(self.segments):
+                self.segments[index] = text
+        index = message.get('segment')
+        if message.get('type') == 'chunk_result' and isinstance(index, int) and index >= 0:
+            if index >= len(self.segments):
+                self.segments.extend([''] * (index + 1 - len(self.segments)))
+            self.segments[index] = message.get('text', '')
+
+    def text(self, count=None):
+        return ' '.join(text for text in self.segments[:count] if text)
@@ -0,0 +1,213 @@
+"""
+Real-user performance telemetry from the page.
+
+While recording, the page times the browser half of the pipeline into a small
+in-memory buffer:
+- frame_lag_ms: a capture frame waiting for the main thread (worklet -> page)
+- frame_ms: main-thread time handling one captured frame
+- encode_ms: building one binary frame or WAV/base64 message
+- buffered_bytes: WebSocket bufferedAmount after each send
+- render_ms: a `chunk_result` arriving until its row is rendered
+
+The buffer goes out in batches with navigator.sendBeacon (POST /telemetry):
+every TELEMETRY_FLUSH_MS in the page, when it is full, and when the tab is
+hidden. Each metric keeps at most a fixed number of samples between flushes.
+
+The app keeps rolling-window aggregates keyed by client build (the content hash
+of app.js) and by client network. Each window is TELEMETRY_WINDOW_S seconds,
+kept in one-minute buckets of histograms (metrics.Histogram). A network is a
+name from TELEMETRY_NETWORKS ("clinic-a=10.1.0.0/16;clinic-b=192.168.7.0/24")
+when an address matches one, else the address's /24 (IPv4) or /48 (IPv6).
+GET /telemetry returns p50/p95/p99 per build and per network. Each gateway
+worker aggregates its own beacons; with several, the gateway answers
+GET /telemetry itself from every worker's export().
+"""
+
+import collections
+import ipaddress
+import json
+import os
+import re
+import threading
+import time
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+
+WINDOW_SECONDS = int(os.environ.get('TELEMETRY_WINDOW_S', '900'))
+BUCKET_SECONDS = 60
+MAX_BEACON_BYTES = 64 * 1024  # the sendBeacon payload limit
+MAX_SAMPLES = 512  # per metric per beacon
+MAX_KEYS = 512  # builds plus networks per bucket; new ones past it are counted as 'other'
+# Metric name -> whether it is a duration in milliseconds (else an integer count)
+METRICS = {
+    'frame_lag_ms': True,
+    'frame_ms': True,
+    'encode_ms': True,
+    'buffered_bytes': False,
+    'render_ms': True,
+}
+BUILD_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+def parse_networks(spec):
+    """[(name, ip_network)] from "name=cidr;name=cidr"."""
+    networks = []
+    for entry in filter(None, (part.strip() for part in spec.split(';'))):
+        name, _, cidr = entry.partition('=')
+        try:
+            networks.append((name.strip(), ipaddress.ip_network(cidr.strip(), strict=False)))
+        except ValueError:
+            continue  # a bad entry shouldn't take the endpoint down
+    return networks
+
+
+NETWORKS = parse_networks(os.environ.get('TELEMETRY_NETWORKS', ''))
+
+
+def network_of(address, networks=NETWORKS):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return 'unknown'
+    for name, network in networks:
+        if ip.version == network.version and ip in network:
+            return name
+    prefix = 24 if ip.version == 4 else 48
+    return str(ipaddress.ip_network(f'{ip}/{prefix}', strict=False))
+
+
+class RollingAggregates:
+    """Per-build and per-network histograms over the last `window` seconds."""
+
+    def __init__(self, window=WINDOW_SECONDS, bucket=BUCKET_SECONDS):
+        self.window = window
+        self.bucket = bucket
+        self.lock = threading.Lock()
+        self.buckets = collections.deque()  # (start, {(dimension, key): {'beacons': n, metric: Histogram}})
+
+    def current(self, now):
+        start = int(now // self.bucket) * self.bucket
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, {}))
+        while self.buckets[0][0] <= now - self.window - self.bucket:
+            self.buckets.popleft()
+        return self.buckets[-1][1]
+
+    def add(self, build, network, samples, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            groups = self.current(now)
+            for dimension, key in (('build', build), ('network', network)):
+                if (dimension, key) not in groups and len(groups) >= MAX_KEYS:
+                    key = 'other'
+                group = groups.setdefault((dimension, key), {'beacons': 0})
+                group['beacons'] += 1
+                for name, values in samples.items():
+                    histogram = group.get(name)
+                    if histogram is None:
+                        histogram = group[name] = metrics.Histogram()
+                    if METRICS[name]:
+                        for value in values:
+                            histogram.record(value / 1000)
+                    else:
+                        for value in values:
+                            histogram.record_value(int(value))
+
+    def collect(self, now=None):
+        """{(dimension, key): {'beacons': n, metric: Histogram}} over the window."""
+        now = time.time() if now is None else now
+        merged = {}
+        with self.lock:
+            for start, groups in self.buckets:
+                if start <= now - self.window - self.bucket:
+                    continue
+                merge_groups(merged, groups)
+        return merged
+
+    def export(self, now=None):
+        """collect() in JSON-safe form, for merging across gateway workers (see combine)."""
+        return [[dimension, key, {name: value if name == 'beacons' else value.to_dict()
+                                  for name, value in group.items()}]
+                for (dimension, key), group in self.collect(now).items()]
+
+    def snapshot(self, now=None):
+        return summarize(self.collect(now), self.window)
+
+
+def merge_groups(target, groups):
+    for group_key, group in groups.items():
+        merged = target.setdefault(group_key, {'beacons': 0})
+        merged['beacons'] += group['beacons']
+        for name, histogram in group.items():
+            if name != 'beacons':
+                merged.setdefault(name, metrics.Histogram()).merge(histogram)
+    return target
+
+
+def combine(exports):
+    """collect()-shaped groups from several processes' export()."""
+    merged = {}
+    for export in exports:
+        merge_groups(merged, {
+            (dimension, key): {name: value if name == 'beacons' else metrics.Histogram.from_dict(value)
+                               for name, value in group.items()}
+            for dimension, key, group in export
+        })
+    return merged
+
+
+def summarize(groups, window):
+    """The GET /telemetry body: p50/p95/p99 per build and per network."""
+    result = {'window_seconds': window, 'builds': {}, 'networks': {}}
+    for (dimension, key), group in groups.items():
+        entry = {'beacons': group['beacons']}
+        for name, histogram in sorted(group.items()):
+            if name != 'beacons':
+                entry[name] = histogram.summary() if METRICS[name] else histogram.summary(unit=1)
+        result[dimension + 's'][key] = entry
+    return result
+
+
+def parse_beacon(body):
+    """(build, {metric: [numbers]}) from a beacon body, or None if it is malformed."""
+    try:
+        beacon = json.loads(body)
+    except ValueError:
+        return None
+    if not isinstance(beacon, dict) or not isinstance(beacon.get('samples'), dict):
+        return None
+    build = beacon.get('build')
+    if not isinstance(build, str) or not BUILD_PATTERN.match(build):
+        build = 'unknown'
+    samples = {}
+    for name, values in beacon['samples'].items():
+        if name not in METRICS or not isinstance(values, list):
+            continue
+        values = [v for v in values[:MAX_SAMPLES]
+                  if isinstance(v, (int, float)) and not isinstance(v, bool) and 0 <= v < 1e9]
+        if values:
+            samples[name] = values
+    return build, samples
+
+
+aggregates = RollingAggregates()
+blueprint = Blueprint('telemetry', __name__)
+
+
+@blueprint.route('/telemetry', methods=['POST'])
+def ingest():
+    if (request.content_length or 0) > MAX_BEACON_BYTES:
+        return jsonify({'detail': 'Beacon too large'}), 413
+    parsed = parse_beacon(request.get_data(cache=False))
+    if parsed is None:
+        return jsonify({'detail': 'Invalid telemetry beacon'}), 400
+    build, samples = parsed
+    aggregates.add(build, network_of(request.remote_addr or ''), samples)
+    return '', 204
+
+
+@blueprint.route('/telemetry', methods=['GET'])
+def report():
+    return jsonify(aggregates.snapshot())
@@ -0,0 +1,263 @@
+"""
+Server-side token cache for the gateway.
+
+Without it, every tab posts credentials to the transcription API's /login,
+keeps idToken/refreshToken in localStorage and sends them in each `config`,
+and every upstream WebSocket refreshes its own copy every 55 minutes. Many tabs
+and reconnects per user multiply that auth traffic, and a new tab pays a login
+round trip before it can record.
+
+With the cache, the page logs in through the gateway (POST /auth/login). The
+tokens stay on the server, keyed by an HttpOnly session cookie that all of the
+user's tabs share, and the gateway writes them into `config` and `resume`:
+- a background task refreshes each entry `token_refresh_ahead` seconds before
+  its id token expires, so starting a session is a dict lookup
+- refreshes are single-flight: callers arriving while one is in progress
+  await that refresh instead of starting their own
+- /login and refresh calls share one pooled keep-alive HTTP client
+- entries unused for `token_idle_ttl` seconds are dropped
+
+Entries live in one process. With several gateway workers the cookie value
+starts with the index of the worker holding the entry, and the other workers
+forward requests carrying it there.
+
+Refresh is POST {api_base_url}{token_refresh_path} with {"refresh_token": ...},
+answered like /login. If the API has no such endpoint (404/405), the cache
+stops refreshing: the refresh token goes upstream in `config` as before and
+rotated tokens are picked up from `token_refreshed` messages.
+"""
+
+import asyncio
+import secrets
+import sys
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import web
+
+AUTH_PATH = '/auth'
+COOKIE_NAME = 'transcription_session'
+DEFAULT_EXPIRES_IN = 3600.0
+USER_FIELDS = ('email', 'displayName', 'localId', 'expiresIn')
+
+
+class AuthError(Exception):
+    """Login rejected or failed upstream; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.status = status
+
+
+class TokenEntry:
+    """Tokens of one browser session (cookie)."""
+
+    def __init__(self, session_key, tokens):
+        self.session_key = session_key
+        self.user = {name: tokens.get(name) for name in USER_FIELDS}
+        self.refreshing = None
+        self.last_used = time.monotonic()
+        self.update(tokens['idToken'], tokens['refreshToken'], tokens.get('expiresIn'))
+
+    def update(self, id_token, refresh_token, expires_in):
+        self.id_token = id_token
+        self.refresh_token = refresh_token
+        self.expires_at = time.monotonic() + float(expires_in or DEFAULT_EXPIRES_IN)
+
+    def expires_in(self):
+        return self.expires_at - time.monotonic()
+
+
+class TokenCache:
+    """Holds tokens per session cookie and keeps them fresh ahead of expiry."""
+
+    def __init__(self, config, stats):
+        self.config = config
+        self.login_url = config.api_base_url + '/login'
+        self.refresh_url = config.api_base_url + config.token_refresh_path if config.token_refresh_path else ''
+        self.can_refresh = bool(self.refresh_url)
+        self.entries = {}
+        self.client = None
+        self.maintainer = None
+        self.stats = stats
+        stats.update({
+            'auth_logins': 0,
+            'auth_login_failures': 0,
+            'auth_cache_hits': 0,
+            'auth_cache_misses': 0,
+            'auth_refreshes': 0,
+            'auth_refresh_failures': 0,
+            'auth_refresh_joins': 0,
+            'auth_refresh_waits': 0,
+        })
+
+    async def start(self):
+        self.client = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(keepalive_timeout=self.config.pool_idle_timeout),
+            timeout=aiohttp.ClientTimeout(total=self.config.connect_timeout * 3),
+        )
+        self.maintainer = asyncio.create_task(self.maintain())
+
+    async def stop(self):
+        if self.maintainer:
+            self.maintainer.cancel()
+        await self.client.close()
+
+    async def post(self, url, body):
+        async with self.client.post(url, json=body) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                data = None
+            return response.status, data if isinstance(data, dict) else {}
+
+    # ============================================================
+    # Entries
+    # ============================================================
+    async def login(self, email, password):
+        """Log in upstream and create a cache entry; returns the entry."""
+        try:
+            status, data = await self.post(self.login_url, {'email': email, 'password': password})
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+            self.stats['auth_login_failures'] += 1
+            raise AuthError(f'Login service unavailable: {type(e).__name__}', 502)
+        tokens = data.get('access_token')
+        if status != 200 or not isinstance(tokens, dict):
+            self.stats['auth_login_failures'] += 1
+            raise AuthError(data.get('detail') or 'Login failed', status if 400 <= status < 500 else 502)
+
+        self.stats['auth_logins'] += 1
+        session_key = self.config.shard_key(secrets.token_urlsafe(32))
+        entry = self.entries[session_key] = TokenEntry(session_key, tokens)
+        return entry
+
+    def lookup(self, session_key):
+        entry = self.entries.get(session_key) if session_key else None
+        if entry is None:
+            self.stats['auth_cache_misses'] += 1
+            return None
+        self.stats['auth_cache_hits'] += 1
+        entry.last_used = time.monotonic()
+        return entry
+
+    def lookup_request(self, request):
+        """
+        Entry for the session cookie of an HTTP or WebSocket request.
+
+        Browsers send cookies on cross-origin WebSocket handshakes too, so a
+        request from a foreign Origin never gets the user's tokens.
+        """
+        origin = request.headers.get('Origin')
+        if origin and urlsplit(origin).netloc != request.host:
+            return None
+        return self.lookup(request.cookies.get(COOKIE_NAME))
+
+    def logout(self, entry):
+        self.entries.pop(entry.session_key, None)
+
+    async def current(self, entry):
+        """
+        Entry with a live id token. Returns at once unless the token already
+        expired (refresh-ahead fell behind), then waits for the shared refresh.
+        """
+        if entry.expires_in() > 0 or not self.can_refresh:
+            return entry
+        self.stats['auth_refresh_waits'] += 1
+        await asyncio.shield(self.refresh(entry))
+        return entry
+
+    def update_from_upstream(self, entry, message):
+        """Take over tokens the upstream rotated itself (`token_refreshed`)."""
+        if message.get('id_token') and message.get('refresh_token'):
+            entry.update(message['id_token'], message['refresh_token'], message.get('expires_in'))
+
+    # ============================================================
+    # Refresh
+    # ============================================================
+    def refresh(self, entry):
+        """Refresh `entry`, or join the refresh already in flight."""
+        if entry.refreshing is None:
+            entry.refreshing = asyncio.ensure_future(self.run_refresh(entry))
+        else:
+            self.stats['auth_refresh_joins'] += 1
+        return entry.refreshing
+
+    async def run_refresh(self, entry):
+        try:
+            status, data = await self.post(self.refresh_url, {'refresh_token': entry.refresh_token})
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError):
+            self.stats['auth_refresh_failures'] += 1
+            return False
+        finally:
+            entry.refreshing = None
+
+        if status in (404, 405):
+            self.can_refresh = False
+            print(f'⚠️ {self.refresh_url} not available; tokens will be refreshed per connection upstream',
+                  file=sys.stderr)
+            return False
+        tokens = data.get('access_token')
+        if status != 200 or not isinstance(tokens, dict):
+            self.stats['auth_refresh_failures'] += 1
+            if 400 <= status < 500:
+                # Refresh token revoked: the user has to log in again
+                self.logout(entry)
+            return False
+        entry.update(tokens['idToken'], tokens['refreshToken'], tokens.get('expiresIn'))
+        self.stats['auth_refreshes'] += 1
+        return True
+
+    async def maintain(self):
+        interval = max(1.0, min(30.0, self.config.token_refresh_ahead / 4))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for entry in list(self.entries.values()):
+                if now - entry.last_used > self.config.token_idle_ttl:
+                    self.logout(entry)
+                elif (self.can_refresh and entry.refreshing is None
+                      and entry.expires_at - now <= self.config.token_refresh_ahead):
+                    self.refresh(entry)
+
+    # ============================================================
+    # HTTP handlers
+    # ============================================================
+    def set_cookie(self, request, response, entry):
+        response.set_cookie(
+            COOKIE_NAME, entry.session_key,
+            max_age=int(self.config.token_idle_ttl), path='/',
+            httponly=True, samesite='Strict', secure=request.secure,
+        )
+
+    async def handle_login(self, request):
+        try:
+            body = await request.json()
+            email, password = body['email'], body['password']
+        except (ValueError, KeyError, TypeError):
+            return web.json_response({'detail': 'email and password are required'}, status=422)
+        try:
+            entry = await self.login(email, password)
+        except AuthError as e:
+            return web.json_response({'detail': str(e)}, status=e.status)
+
+        previous = self.lookup_request(request)
+        if previous is not None:
+            self.logout(previous)
+        response = web.json_response({'user': entry.user})
+        self.set_cookie(request, response, entry)
+        return response
+
+    async def handle_session(self, request):
+        entry = self.lookup_request(request)
+        if entry is None:
+            return web.json_response({'detail': 'Not authenticated'}, status=401)
+        return web.json_response({'user': entry.user, 'expires_in': round(entry.expires_in())})
+
+    async def handle_logout(self, request):
+        entry = self.lookup_request(request)
+        if entry is not None:
+            self.logout(entry)
+        response = web.json_response({'ok': True})
+        response.del_cookie(COOKIE_NAME, path='/')
+        return response
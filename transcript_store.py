@@ -0,0 +1,377 @@
+"""
+Append-only transcript store for the gateway.
+
+Every `chunk_result` and `complete` the gateway relays is appended to a log of
+JSON lines under GATEWAY_TRANSCRIPT_DIR, so a transcript outlives the page that
+showed it. The log is split into segment files (segment-000001.jsonl, ...) that
+rotate at `segment_bytes`.
+
+The relay never touches the disk: `append` puts the record on a queue and
+returns. A writer thread takes everything that queued up while the previous
+commit ran and writes it as one batch, grouped by session. It then fsyncs once
+(group commit). Under load, batches grow instead of fsyncs multiplying, and
+`commit_interval` caps how often fsync runs.
+
+When a session completes (or is closed without `complete`), its records are
+written once more as one contiguous block, in time order, followed by the
+`complete` or `closed` record. index.jsonl then gets one line for the session:
+where the block is, and the start time and offset of each chunk in it. Reading a whole session, or any time range of it, is then a
+single seek and read. Sessions still in progress are read from the extents
+their batches were written to.
+
+On start, the index is loaded and only the tail of the log that may hold
+unfinished sessions is scanned. A torn last line from a crash is cut off.
+
+Record lines:
+    {"s": <transcript id>, "k": "start", "owner": ..., "ts": ...}
+    {"s": ..., "k": "chunk", "chunk_id": ..., "start_time": ..., "end_time": ..., "text": ...}
+        (a chunk logged again, e.g. with a fix-up's corrected text, replaces its earlier record)
+    {"s": ..., "k": "complete", "text": ..., "total_chunks": ..., "duration": ...}
+    {"s": ..., "k": "closed"}                    (ended without `complete`)
+"""
+
+import array
+import bisect
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+SEGMENT_PREFIX = 'segment-'
+SEGMENT_SUFFIX = '.jsonl'
+INDEX_FILE = 'index.jsonl'
+FINAL_KINDS = ('complete', 'closed')
+
+fsync = getattr(os, 'fdatasync', os.fsync)
+
+
+def encode(record):
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class CompletedSession:
+    """Index entry of a completed session: one contiguous block in one segment."""
+
+    def __init__(self, entry):
+        self.owner = entry.get('owner')
+        self.segment = entry['segment']
+        self.offset = entry['offset']
+        self.length = entry['length']
+        self.starts = array.array('d', entry['starts'])
+        self.offsets = array.array('I', entry['offsets'])  # relative to `offset`
+
+    def byte_range(self, start=None, end=None):
+        """(offset, length) covering the chunks overlapping [start, end), or the whole block."""
+        if start is None and end is None:
+            return self.offset, self.length
+        first = 0 if start is None else max(0, bisect.bisect_right(self.starts, start) - 1)
+        last = len(self.starts) if end is None else bisect.bisect_left(self.starts, end)
+        if first >= last:
+            return self.offset, 0
+        stop = self.offsets[last] if last < len(self.offsets) else self.length
+        return self.offset + self.offsets[first], stop - self.offsets[first]
+
+
+class LiveSession:
+    """A session still being written: its records and the extents they are in."""
+
+    def __init__(self, owner=None):
+        self.owner = owner
+        self.records = {}  # (chunk_id, start_time) -> record; replays after a crash dedupe here
+        self.extents = []  # (segment, offset, length)
+        self.first = None  # (segment, offset) of its first record
+
+    def add_extent(self, segment, offset, length):
+        if self.first is None:
+            self.first = (segment, offset)
+        last = self.extents[-1] if self.extents else None
+        if last and last[0] == segment and last[1] + last[2] == offset:
+            self.extents[-1] = (segment, last[1], last[2] + length)
+        else:
+            self.extents.append((segment, offset, length))
+
+
+class TranscriptStore:
+    def __init__(self, directory, segment_bytes=64 * 1024 * 1024, commit_interval=0.05, stats=None):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        self.queue = queue.SimpleQueue()
+        self.lock = threading.Lock()  # guards the two index dicts
+        self.completed = {}
+        self.live = {}
+        self.segment = 0
+        self.segment_file = None
+        self.segment_size = 0
+        self.index_file = None
+        self.writer = None
+        self.stats = stats if stats is not None else {}
+        self.stats.update({
+            'transcript_records': 0,
+            'transcript_commits': 0,
+            'transcript_bytes': 0,
+            'transcript_sessions_completed': 0,
+        })
+
+    # ============================================================
+    # Lifecycle
+    # ============================================================
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        resume_from = self.load_index()
+        self.recover(resume_from)
+        self.index_file = open(os.path.join(self.directory, INDEX_FILE), 'ab')
+        self.open_segment(max(1, self.segment))
+        self.writer = threading.Thread(target=self.write_loop, name='transcript-writer', daemon=True)
+        self.writer.start()
+
+    def stop(self):
+        if self.writer:
+            self.queue.put(None)
+            self.writer.join()
+        for f in (self.segment_file, self.index_file):
+            if f:
+                f.close()
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}')
+
+    def open_segment(self, segment):
+        if self.segment_file:
+            self.segment_file.close()
+        self.segment = segment
+        self.segment_file = open(self.segment_path(segment), 'ab')
+        self.segment_size = self.segment_file.tell()
+
+    def load_index(self):
+        """Load completed sessions; returns where the log scan has to start."""
+        resume_from = (1, 0)
+        path = os.path.join(self.directory, INDEX_FILE)
+        size = 0
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line) if line.endswith(b'\n') else None
+                    except ValueError:
+                        entry = None
+                    if entry is None:
+                        break
+                    self.completed[entry['session']] = CompletedSession(entry)
+                    resume_from = tuple(entry['resume_from'])
+                    size += len(line)
+        except FileNotFoundError:
+            return resume_from
+        if os.path.getsize(path) != size:
+            os.truncate(path, size)  # torn last line; its session is recovered from the log
+        return resume_from
+
+    def recover(self, resume_from):
+        """Rebuild unfinished sessions from the log tail and drop a torn last line."""
+        segments = sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        for segment in segments:
+            if segment < resume_from[0]:
+                continue
+            path = self.segment_path(segment)
+            with open(path, 'rb') as f:
+                offset = resume_from[1] if segment == resume_from[0] else 0
+                f.seek(offset)
+                for line in f:
+                    try:
+                        record = json.loads(line) if line.endswith(b'\n') else None
+                    except ValueError:
+                        record = None
+                    if record is None:
+                        break
+                    self.replay(record, segment, offset, len(line))
+                    offset += len(line)
+            if os.path.getsize(path) != offset:
+                print(f'⚠️ Truncating torn record at {path}:{offset}', file=sys.stderr)
+                os.truncate(path, offset)
+        self.segment = segments[-1] if segments else 1
+
+    def replay(self, record, segment, offset, length):
+        session_id = record['s']
+        if session_id in self.completed:
+            return  # already consolidated (this is its block or an earlier copy)
+        session = self.live.get(session_id)
+        if session is None:
+            session = self.live[session_id] = LiveSession()
+        if record['k'] == 'start':
+            session.owner = record.get('owner')
+        elif record['k'] in FINAL_KINDS:
+            # Crashed between writing the block and indexing it: consolidate again
+            self.queue.put(record)
+        else:
+            session.records[record.get('chunk_id'), record.get('start_time')] = record
+        session.add_extent(segment, offset, length)
+
+    # ============================================================
+    # Writing (append is called on the event loop, the rest on the writer thread)
+    # ============================================================
+    def append(self, session_id, kind, owner=None, **fields):
+        """Queue a record; never blocks."""
+        fields.update(s=session_id, k=kind)
+        if kind == 'start':
+            fields.update(owner=owner, ts=round(time.time(), 3))
+        self.queue.put(fields)
+
+    def write_loop(self):
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            started = time.monotonic()
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [record for record in batch if record is not None]
+            if batch:
+                try:
+                    self.commit(batch)
+                except (OSError, ValueError) as e:
+                    print(f'⚠️ Transcript commit failed: {e!r}', file=sys.stderr)
+            # Cap the fsync rate; whatever arrives meanwhile joins the next batch
+            delay = self.commit_interval - (time.monotonic() - started)
+            if running and delay > 0:
+                time.sleep(delay)
+
+    def commit(self, batch):
+        by_session = {}
+        for record in batch:
+            by_session.setdefault(record['s'], []).append(record)
+
+        blob = bytearray()
+        extents = []
+        index_lines = []
+        for session_id, records in by_session.items():
+            with self.lock:
+                session = self.live.get(session_id)
+                if session is None:
+                    session = self.live[session_id] = LiveSession()
+            final = None
+            for record in records:
+                if record['k'] == 'start':
+                    session.owner = record.get('owner')
+                elif record['k'] in FINAL_KINDS:
+                    final = record
+                else:
+                    session.records[record.get('chunk_id'), record.get('start_time')] = record
+
+            if final is None:
+                data = b''.join(encode(record) for record in records)
+                extents.append((session, len(blob), len(data)))
+                blob += data
+            else:
+                # The session's consolidated block; earlier lines stay behind as garbage
+                entry, data = self.consolidate(session, final, len(blob))
+                index_lines.append((session_id, entry))
+                blob += data
+
+        if self.segment_size and self.segment_size + len(blob) > self.segment_bytes:
+            self.open_segment(self.segment + 1)
+        base = self.segment_size
+        self.segment_file.write(blob)
+        self.segment_file.flush()
+        fsync(self.segment_file.fileno())
+        self.segment_size += len(blob)
+
+        with self.lock:
+            for session, offset, length in extents:
+                session.add_extent(self.segment, base + offset, length)
+            for session_id, entry in index_lines:
+                entry.update(segment=self.segment, offset=base + entry['offset'])
+                self.live.pop(session_id, None)
+                self.completed[session_id] = CompletedSession(entry)
+            resume_from = min((s.first for s in self.live.values() if s.first), default=None)
+        if index_lines:
+            resume_from = list(resume_from or (self.segment, self.segment_size))
+            self.index_file.write(b''.join(
+                encode(dict(entry, session=session_id, resume_from=resume_from))
+                for session_id, entry in index_lines
+            ))
+            self.index_file.flush()
+            fsync(self.index_file.fileno())
+
+        self.stats['transcript_records'] += len(batch)
+        self.stats['transcript_commits'] += 1
+        self.stats['transcript_bytes'] += len(blob)
+        self.stats['transcript_sessions_completed'] += len(index_lines)
+
+    def consolidate(self, session, final, offset):
+        """Index entry and bytes of a finished session's contiguous block."""
+        records = sorted(session.records.values(), key=lambda r: (r.get('start_time') or 0.0, r.get('chunk_id') or 0))
+        starts, offsets, parts = [], [], []
+        size = 0
+        for record in records:
+            line = encode(record)
+            starts.append(record.get('start_time') or 0.0)
+            offsets.append(size)
+            parts.append(line)
+            size += len(line)
+        parts.append(encode(final))
+        data = b''.join(parts)
+        entry = {'owner': session.owner, 'offset': offset, 'length': len(data),
+                 'starts': starts, 'offsets': offsets}
+        return entry, data
+
+    # ============================================================
+    # Reading (blocking file IO: run it off the event loop)
+    # ============================================================
+    def owner(self, session_id):
+        """(known, owner) of a session."""
+        with self.lock:
+            session = self.completed.get(session_id) or self.live.get(session_id)
+        return (session is not None), (session.owner if session else None)
+
+    def read(self, session_id, start=None, end=None):
+        """
+        Chunks of a session overlapping [start, end) seconds (all of them by
+        default), or None for an unknown session. `complete` is included when
+        the whole session is read.
+        """
+        with self.lock:
+            completed = self.completed.get(session_id)
+            live = None if completed else self.live.get(session_id)
+            extents = list(live.extents) if live else None
+        if completed is not None:
+            offset, length = completed.byte_range(start, end)
+            lines = self.read_range(completed.segment, offset, length).splitlines()
+        elif extents is not None:
+            lines = [line for extent in extents for line in self.read_range(*extent).splitlines()]
+        else:
+            return None
+
+        chunks, complete = {}, None
+        for line in lines:
+            record = json.loads(line)
+            if record.get('s') != session_id:
+                continue
+            if record['k'] == 'complete':
+                complete = record
+            elif record['k'] == 'chunk':
+                if start is not None and (record.get('end_time') or 0.0) <= start:
+                    continue
+                if end is not None and (record.get('start_time') or 0.0) >= end:
+                    continue
+                chunks[record.get('chunk_id'), record.get('start_time')] = record
+        chunks = list(chunks.values())
+        if completed is None:
+            chunks.sort(key=lambda r: (r.get('start_time') or 0.0, r.get('chunk_id') or 0))
+        return {'transcript_id': session_id, 'chunks': chunks, 'complete': complete}
+
+    def read_range(self, segment, offset, length):
+        if not length:
+            return b''
+        with open(self.segment_path(segment), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
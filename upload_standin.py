@@ -0,0 +1,204 @@
+"""
+Local stand-in for the audio upload backend used by uploadaudio.html.
+
+POST /upload-and-store-metadata/ answers like the real backend: a
+`gcs_metadata_id`, a `content_type` and a `signed_url` for a single PUT. When
+the widget also sends `resumable=true` and `file_size`, the response includes
+an `upload` object describing a resumable multipart session:
+
+    {"session_url": "/upload-sessions/<id>", "part_size": 8388608, "part_count": 60}
+
+    GET  {session_url}              -> part_size, part_count, committed part numbers
+    PUT  {session_url}/parts/<n>    -> store part n (0-based); X-Part-SHA256 is verified
+    POST {session_url}/complete     -> assemble the parts once every one is committed
+
+Parts may arrive in any order and in parallel. A part is committed with an
+atomic rename once its checksum matches, so after a crash or a page reload the
+committed set is whatever is on disk. Session state lives only in the
+directory, so any worker process can serve any request.
+
+Files are kept under UPLOAD_STANDIN_DIR (default ./uploads).
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import secrets
+import shutil
+
+from flask import Blueprint, jsonify, request
+from werkzeug.utils import secure_filename
+
+UPLOAD_DIR = os.environ.get(
+    'UPLOAD_STANDIN_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
+)
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+MAX_PARTS = 10000
+SESSION_ID = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+blueprint = Blueprint('upload_standin', __name__)
+
+
+def session_dir(upload_id):
+    return os.path.join(UPLOAD_DIR, upload_id)
+
+
+def object_path(upload_id):
+    """The uploaded file; its client-side name is only kept in session.json."""
+    return os.path.join(session_dir(upload_id), 'object')
+
+
+def part_path(upload_id, part):
+    return os.path.join(session_dir(upload_id), f'{part:05d}.part')
+
+
+def load_session(upload_id):
+    """Session metadata, or None for an unknown id."""
+    if not SESSION_ID.match(upload_id):
+        return None
+    try:
+        with open(os.path.join(session_dir(upload_id), 'session.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def committed_parts(upload_id):
+    names = os.listdir(session_dir(upload_id))
+    return sorted(int(name[:-5]) for name in names if name.endswith('.part'))
+
+
+def error(message, status):
+    return jsonify({'detail': message}), status
+
+
+@blueprint.after_request
+def allow_cross_origin(response):
+    # The widget is often opened straight from disk (file://)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    response.headers['Access-Control-Allow-Headers'] = 'Authorization, Content-Type, X-Part-SHA256, x-goog-meta-gcs_metadata_id'
+    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, OPTIONS'
+    return response
+
+
+@blueprint.route('/upload-and-store-metadata/', methods=['POST', 'OPTIONS'])
+def create_upload():
+    if request.method == 'OPTIONS':
+        return '', 204
+    file_name = secure_filename(request.form.get('file_name', '')) or 'audio'
+    content_type = request.form.get('content_type') or 'audio/wav'
+    upload_id = secrets.token_urlsafe(18)
+    session_url = f'/upload-sessions/{upload_id}'
+    session = {'file_name': file_name, 'content_type': content_type, 'file_size': None}
+    response = {
+        'gcs_metadata_id': upload_id,
+        'content_type': content_type,
+        'signed_url': request.host_url.rstrip('/') + session_url + '/object',
+    }
+
+    if request.form.get('resumable') == 'true':
+        try:
+            file_size = int(request.form['file_size'])
+        except (KeyError, ValueError):
+            return error('file_size is required for resumable uploads', 422)
+        part_size = max(DEFAULT_PART_SIZE, math.ceil(file_size / MAX_PARTS))
+        session.update(file_size=file_size, part_size=part_size,
+                       part_count=max(1, math.ceil(file_size / part_size)))
+        response['upload'] = {
+            'session_url': session_url,
+            'part_size': part_size,
+            'part_count': session['part_count'],
+        }
+
+    os.makedirs(session_dir(upload_id))
+    with open(os.path.join(session_dir(upload_id), 'session.json'), 'w') as f:
+        json.dump(session, f)
+    return jsonify(response)
+
+
+@blueprint.route('/upload-sessions/<upload_id>', methods=['GET'])
+def upload_status(upload_id):
+    session = load_session(upload_id)
+    if session is None:
+        return error('Unknown upload session', 404)
+    return jsonify({
+        'part_size': session.get('part_size'),
+        'part_count': session.get('part_count'),
+        'committed': committed_parts(upload_id),
+        'complete': session.get('complete', False),
+    })
+
+
+@blueprint.route('/upload-sessions/<upload_id>/parts/<int:part>', methods=['PUT', 'OPTIONS'])
+def upload_part(upload_id, part):
+    if request.method == 'OPTIONS':
+        return '', 204
+    session = load_session(upload_id)
+    if session is None or 'part_count' not in session:
+        return error('Unknown upload session', 404)
+    if session.get('complete'):
+        return error('Upload already completed', 409)
+    if not 0 <= part < session['part_count']:
+        return error('Part number out of range', 416)
+
+    data = request.get_data(cache=False)
+    is_last = part == session['part_count'] - 1
+    expected = session['file_size'] - part * session['part_size'] if is_last else session['part_size']
+    if len(data) != expected:
+        return error(f'Part {part} must be {expected} bytes, got {len(data)}', 400)
+    digest = hashlib.sha256(data).hexdigest()
+    claimed = request.headers.get('X-Part-SHA256')
+    if claimed and claimed.lower() != digest:
+        return error(f'Checksum mismatch for part {part}', 400)
+
+    # Written aside and renamed, so a part on disk is always a complete one
+    path = part_path(upload_id, part)
+    tmp = f'{path}.{secrets.token_hex(4)}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return jsonify({'part': part, 'size': len(data), 'sha256': digest})
+
+
+@blueprint.route('/upload-sessions/<upload_id>/complete', methods=['POST', 'OPTIONS'])
+def complete_upload(upload_id):
+    if request.method == 'OPTIONS':
+        return '', 204
+    session = load_session(upload_id)
+    if session is None or 'part_count' not in session:
+        return error('Unknown upload session', 404)
+    if session.get('complete'):
+        return jsonify({'gcs_metadata_id': upload_id, 'size': session['file_size']})
+
+    missing = sorted(set(range(session['part_count'])) - set(committed_parts(upload_id)))
+    if missing:
+        return jsonify({'detail': 'Parts missing', 'missing': missing[:100]}), 409
+
+    target = object_path(upload_id)
+    with open(target, 'wb') as out:
+        for part in range(session['part_count']):
+            with open(part_path(upload_id, part), 'rb') as f:
+                shutil.copyfileobj(f, out, 1024 * 1024)
+    for part in range(session['part_count']):
+        os.remove(part_path(upload_id, part))
+
+    session['complete'] = True
+    with open(os.path.join(session_dir(upload_id), 'session.json'), 'w') as f:
+        json.dump(session, f)
+    return jsonify({'gcs_metadata_id': upload_id, 'size': os.path.getsize(target)})
+
+
+@blueprint.route('/upload-sessions/<upload_id>/object', methods=['PUT', 'OPTIONS'])
+def upload_object(upload_id):
+    """Single-request upload, standing in for the signed GCS URL."""
+    if request.method == 'OPTIONS':
+        return '', 204
+    session = load_session(upload_id)
+    if session is None:
+        return error('Unknown upload session', 404)
+    target = object_path(upload_id)
+    with open(target, 'wb') as out:
+        shutil.copyfileobj(request.stream, out, 1024 * 1024)
+    return '', 200
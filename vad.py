@@ -0,0 +1,99 @@
+"""
+Vectorized energy / zero-crossing voice activity detection.
+
+Used by the gateway to answer silent audio chunks with `no_speech` locally
+instead of shipping them upstream for decoding and inference.
+
+Each chunk is split into short frames (20 ms by default) and classified in one
+NumPy pass:
+- voiced frames: energy above the threshold
+- unvoiced frames (fricatives like "s", "f"): somewhat lower energy but a high
+  zero-crossing rate
+The threshold is the larger of an absolute floor and the session's tracked
+noise floor plus a margin. A chunk is speech when it has enough speech frames.
+After speech, a hangover window keeps forwarding chunks so trailing word
+endings are not clipped.
+"""
+
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """Per-session speech/silence classifier for 16-bit PCM chunks."""
+
+    def __init__(self, sample_rate=16000, frame_ms=20, threshold_db=-50.0,
+                 noise_margin_db=12.0, unvoiced_margin_db=8.0, unvoiced_zcr=0.25,
+                 min_speech_frames=3, hangover_ms=500):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.threshold_db = threshold_db
+        self.noise_margin_db = noise_margin_db
+        self.unvoiced_margin_db = unvoiced_margin_db
+        self.unvoiced_zcr = unvoiced_zcr
+        self.min_speech_frames = min_speech_frames
+        self.hangover_ms = hangover_ms
+        self.noise_floor_db = threshold_db - noise_margin_db
+        self.hangover_left_ms = 0.0
+
+        self.chunks = 0
+        self.speech_chunks = 0
+        self.hangover_chunks = 0
+        self.silent_chunks = 0
+        self.silent_seconds = 0.0
+        self.silent_bytes = 0
+
+    def classify(self, pcm):
+        """Return True if the chunk of little-endian Int16 PCM contains speech."""
+        samples = np.frombuffer(pcm, dtype='<i2')
+        frame_len = max(1, self.sample_rate * self.frame_ms // 1000)
+        count = len(samples) // frame_len
+        if count == 0:
+            return False
+
+        frames = samples[:count * frame_len].reshape(count, frame_len).astype(np.float32)
+        frames *= 1.0 / 32768.0
+        energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frame_len
+
+        threshold = max(self.threshold_db, self.noise_floor_db + self.noise_margin_db)
+        voiced = energy_db > threshold
+        unvoiced = (energy_db > threshold - self.unvoiced_margin_db) & (zcr > self.unvoiced_zcr)
+        speech_frames = int(np.count_nonzero(voiced | unvoiced))
+        is_speech = speech_frames >= min(self.min_speech_frames, count)
+
+        if not is_speech:
+            # Track the background level from the quietest frames of silent chunks
+            quiet = float(np.percentile(energy_db, 20))
+            self.noise_floor_db += 0.1 * (quiet - self.noise_floor_db)
+        return is_speech
+
+    def should_forward(self, pcm):
+        """Classify a chunk, apply the hangover window and update counters."""
+        duration_ms = 1000.0 * (len(pcm) // 2) / self.sample_rate
+        self.chunks += 1
+
+        if self.classify(pcm):
+            self.speech_chunks += 1
+            self.hangover_left_ms = self.hangover_ms
+            return True
+        if self.hangover_left_ms > 0:
+            self.hangover_chunks += 1
+            self.hangover_left_ms -= duration_ms
+            return True
+
+        self.silent_chunks += 1
+        self.silent_seconds += duration_ms / 1000.0
+        self.silent_bytes += len(pcm)
+        return False
+
+    def counters(self):
+        return {
+            'chunks': self.chunks,
+            'speech_chunks': self.speech_chunks,
+            'hangover_chunks': self.hangover_chunks,
+            'suppressed_chunks': self.silent_chunks,
+            'suppressed_audio_seconds': round(self.silent_seconds, 3),
+            'suppressed_bytes': self.silent_bytes,
+            'suppressed_ratio': round(self.silent_chunks / self.chunks, 4) if self.chunks else 0.0,
+        }